@@ -0,0 +1,79 @@
+"""
+Analysis Store - registro de análisis por canción (BPM, tonalidad, compás, duración)
+
+El pipeline de separación lo llena desde el PCM que ya decodificó; /status y
+/songs/{song_id}/analysis lo sirven sin volver a descargar ni decodificar el
+original. Se guarda en memoria, en la cache local y en B2:
+
+    analysis/{user_id}/{song_id}.json
+"""
+
+import json
+import tempfile
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from b2_storage import b2_storage
+from models import SAFE_ID, SongAnalysis
+from scratch_space import scratch_space
+
+
+class AnalysisStore:
+    def __init__(self):
+        self.cache_dir = scratch_space.register_cache(Path(tempfile.gettempdir()) / "moises_analysis")
+        self._records: Dict[Tuple[str, str], SongAnalysis] = {}   # (user_id, song_id) -> análisis
+
+    def _b2_path(self, user_id: str, song_id: str) -> str:
+        return f"analysis/{user_id}/{song_id}.json"
+
+    def _local_path(self, user_id: str, song_id: str) -> Path:
+        return self.cache_dir / f"{user_id}_{song_id}.json"
+
+    async def save(self, analysis: SongAnalysis) -> Optional[str]:
+        """Guarda el análisis en memoria, en la cache local y en B2; retorna la URL de B2"""
+        self._records[(analysis.user_id, analysis.song_id)] = analysis
+        data = analysis.model_dump_json().encode("utf-8")
+        self._local_path(analysis.user_id, analysis.song_id).write_bytes(data)
+
+        try:
+            upload = await b2_storage.upload_file(
+                file_content=data,
+                filename=self._b2_path(analysis.user_id, analysis.song_id),
+                content_type="application/json"
+            )
+            print(f"[ANALYSIS] Guardado {analysis.song_id}: BPM={analysis.bpm}, Key={analysis.key}, Compás={analysis.time_signature}")
+            return upload.get("download_url")
+        except Exception as e:
+            print(f"[ANALYSIS] Error subiendo análisis a B2: {e}")
+            return None
+
+    async def load(self, user_id: str, song_id: str) -> Optional[SongAnalysis]:
+        """Análisis de una canción (memoria -> cache local -> B2); None si no existe"""
+        if not (SAFE_ID.match(user_id or "") and SAFE_ID.match(song_id or "")):
+            raise ValueError(f"user_id/song_id inválidos: {user_id!r}, {song_id!r}")
+
+        record = self._records.get((user_id, song_id))
+        if record is not None:
+            return record
+
+        try:
+            local_path = self._local_path(user_id, song_id)
+            if local_path.exists():
+                data = local_path.read_bytes()
+                scratch_space.touch(local_path)
+            else:
+                data = await b2_storage.download_file_bytes(self._b2_path(user_id, song_id))
+                if not data:
+                    return None
+                local_path.write_bytes(data)
+
+            analysis = SongAnalysis.model_validate(json.loads(data))
+            self._records[(user_id, song_id)] = analysis
+            return analysis
+        except Exception as e:
+            print(f"[ANALYSIS] Error cargando análisis de {song_id}: {e}")
+            return None
+
+
+# Instancia global
+analysis_store = AnalysisStore()
@@ -0,0 +1,118 @@
+"""
+Audio Fetch - descargas de audio por URL con un cliente HTTP compartido
+
+- Un solo httpx.AsyncClient por proceso (keep-alive y HTTP/2 si h2 está
+  instalado), creado en la primera descarga (httpx no se importa al arrancar
+  la API) y cerrado en el lifespan de la app
+- Las descargas se escriben a disco por chunks (nunca la respuesta entera en memoria),
+  en un workspace de scratch_space que se libera al salir
+- Las URLs propias no salen a internet:
+    http://localhost:8000/api/audio/{path}  -> stem local (stem_cache) o B2 directo
+    https://s3.../moises2/{path}            -> stem local (stem_cache) o B2 directo
+"""
+
+import os
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import AsyncIterator, Optional
+from urllib.parse import unquote, urlsplit
+
+from b2_storage import b2_storage
+from scratch_space import scratch_space
+
+# Hosts del propio backend (proxy /api/audio y /audio)
+OWN_HOSTS = set(os.getenv("AUDIO_PROXY_HOSTS", "localhost:8000,127.0.0.1:8000").split(","))
+PROXY_PREFIXES = ("/api/audio/", "/audio/")
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class AudioFetcher:
+    def __init__(self):
+        self.chunk_size = 256 * 1024
+        self._client: Optional["httpx.AsyncClient"] = None
+
+    def _create_client(self) -> "httpx.AsyncClient":
+        import httpx
+
+        http2 = _http2_available()
+        client = httpx.AsyncClient(
+            http2=http2,
+            timeout=httpx.Timeout(90.0, connect=10.0),
+            limits=httpx.Limits(max_connections=32, max_keepalive_connections=16, keepalive_expiry=60.0),
+            follow_redirects=True
+        )
+        print(f"[FETCH] Cliente HTTP compartido listo (HTTP/2: {http2})")
+        return client
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    @property
+    def client(self) -> "httpx.AsyncClient":
+        if self._client is None:
+            self._client = self._create_client()
+        return self._client
+
+    def storage_path(self, url: str) -> Optional[str]:
+        """Ruta en el bucket si la URL es del propio proxy o del bucket de B2"""
+        parts = urlsplit(url)
+        if parts.netloc in OWN_HOSTS:
+            for prefix in PROXY_PREFIXES:
+                if parts.path.startswith(prefix):
+                    return unquote(parts.path[len(prefix):])
+        return b2_storage.path_from_url(url)
+
+    def _local_file(self, storage_path: str) -> Optional[Path]:
+        """Stem ya en disco (stems/{user_id}/{song_id}/{stem}.wav en la cache de separación)"""
+        from stem_cache import stem_cache
+
+        parts = storage_path.split("/")
+        if len(parts) == 4 and parts[0] == "stems":
+            _, user_id, song_id, filename = parts
+            return stem_cache.song_stems(user_id, song_id).get(Path(filename).stem)
+        return None
+
+    @asynccontextmanager
+    async def fetch_to_file(self, url: str, suffix: Optional[str] = None) -> AsyncIterator[Path]:
+        """
+        Ruta local con el contenido de la URL (se borra al salir si es temporal)
+
+        Orden: archivo local -> B2 directo (URLs propias) -> GET con el cliente compartido
+        """
+        storage_path = self.storage_path(url)
+        if storage_path:
+            local = self._local_file(storage_path)
+            if local is not None:
+                print(f"[FETCH] {url} -> archivo local {local}")
+                yield local
+                return
+
+        suffix = suffix or Path(urlsplit(url).path).suffix or ".mp3"
+        async with scratch_space.workspace("fetch") as workspace:
+            temp_path = workspace / f"audio{suffix}"
+            with open(temp_path, "wb") as f:
+                if storage_path:
+                    print(f"[FETCH] {url} -> B2 directo: {storage_path}")
+                    async for chunk in b2_storage.download_file(storage_path):
+                        f.write(chunk)
+                else:
+                    async with self.client.stream("GET", url) as response:
+                        if response.status_code != 200:
+                            raise FileNotFoundError(f"No se pudo descargar el archivo: {response.status_code}")
+                        async for chunk in response.aiter_bytes(self.chunk_size):
+                            f.write(chunk)
+            print(f"[FETCH] Descargado {url}: {temp_path.stat().st_size} bytes")
+            yield temp_path
+
+
+# Global instance
+audio_fetcher = AudioFetcher()
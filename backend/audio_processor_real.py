@@ -6,11 +6,12 @@ import os
 import asyncio
 import subprocess
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 import shutil
-import librosa
-import soundfile as sf
-import numpy as np
+
+from stem_mixer import stem_mixer
+from separation_models import select_model, build_separation_command, demucs_env, demucs_output_dir
+from extended_stems import extended_stems_engine
 
 class AudioProcessor:
     def __init__(self):
@@ -27,13 +28,9 @@ class AudioProcessor:
             if task_callback:
                 task_callback(20, "Starting Demucs AI separation...")
             
-            # Run Demucs command - using the htdemucs model for best quality
-            cmd = [
-                "python", "-m", "demucs",
-                "--name", "htdemucs",  # Best quality model
-                "--out", str(output_dir),
-                file_path
-            ]
+            # Run Demucs command - model and inference settings from the registry
+            config = select_model("vocals-drums-bass-other")
+            cmd = build_separation_command(config, file_path, str(output_dir))
             
             print(f"Running Demucs command: {' '.join(cmd)}")
             
@@ -45,7 +42,8 @@ class AudioProcessor:
             process = await asyncio.create_subprocess_exec(
                 *cmd,
                 stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
+                stderr=asyncio.subprocess.PIPE,
+                env=demucs_env(config)
             )
             
             stdout, stderr = await process.communicate()
@@ -62,10 +60,9 @@ class AudioProcessor:
             
             # Find the separated files
             stems = {}
-            file_name = Path(file_path).stem
             
             # Demucs creates a folder with the model name
-            model_dir = output_dir / "htdemucs" / file_name
+            model_dir = demucs_output_dir(config, str(output_dir), file_path)
             
             if model_dir.exists():
                 # Map Demucs output to our expected format
@@ -89,10 +86,6 @@ class AudioProcessor:
                             print(f"Found vocals: {vocals_path}")
                         
                         # Instrumental = drums + bass + other
-                        import librosa
-                        import soundfile as sf
-                        import numpy as np
-                        
                         instrumental_tracks = []
                         for track in ["drums", "bass", "other"]:
                             track_path = model_dir / f"{track}.wav"
@@ -100,26 +93,11 @@ class AudioProcessor:
                                 instrumental_tracks.append(track_path)
                         
                         if instrumental_tracks:
-                            # Combinar los tracks instrumentales
-                            combined_audio = None
-                            sr = None
-                            
-                            for track_path in instrumental_tracks:
-                                audio, sample_rate = librosa.load(track_path, sr=None)
-                                sr = sample_rate
-                                
-                                if combined_audio is None:
-                                    combined_audio = audio
-                                else:
-                                    # Asegurar que tengan la misma longitud
-                                    min_length = min(len(combined_audio), len(audio))
-                                    combined_audio = combined_audio[:min_length] + audio[:min_length]
-                            
-                            # Guardar track instrumental combinado
+                            # Combinar los tracks instrumentales (por bloques, SR nativo)
                             instrumental_path = model_dir.parent / "instrumental.wav"
-                            sf.write(str(instrumental_path), combined_audio, sr)
-                            stems["instrumental"] = str(instrumental_path)
-                            print(f"Created instrumental: {instrumental_path}")
+                            if stem_mixer.mix_stems(instrumental_tracks, instrumental_path):
+                                stems["instrumental"] = str(instrumental_path)
+                                print(f"Created instrumental: {instrumental_path}")
                     
                     else:
                         # Procesar tracks individuales solicitados
@@ -160,7 +138,8 @@ class AudioProcessor:
             all_stems = await self.separate_with_demucs(file_path)
             
             # Create additional tracks using AI processing
-            extended_stems = await self.create_extended_tracks(file_path, all_stems)
+            requested = [name for name, enabled in tracks.items() if enabled]
+            extended_stems = await self.create_extended_tracks(file_path, all_stems, requested)
             
             # Filter based on requested tracks
             filtered_stems = {}
@@ -174,26 +153,19 @@ class AudioProcessor:
             print(f"[ERROR] Error in custom track separation: {e}")
             raise
     
-    async def create_extended_tracks(self, file_path: str, basic_stems: Dict[str, str]) -> Dict[str, str]:
-        """Create additional tracks using AI processing"""
+    async def create_extended_tracks(self, file_path: str, basic_stems: Dict[str, str], requested_tracks: Optional[List[str]] = None) -> Dict[str, str]:
+        """Create additional tracks from one shared STFT/HPSS decomposition"""
         try:
             extended_stems = basic_stems.copy()
             output_dir = Path(file_path).parent / "extended_tracks"
             output_dir.mkdir(exist_ok=True)
             
-            # Load the original audio
-            audio, sr = librosa.load(file_path, sr=None)
-            
-            # Create additional tracks using librosa and AI processing
-            additional_tracks = {
-                "piano": self.extract_piano(audio, sr, output_dir),
-                "guitar": self.extract_guitar(audio, sr, output_dir),
-                "strings": self.extract_strings(audio, sr, output_dir),
-                "brass": self.extract_brass(audio, sr, output_dir),
-                "percussion": self.extract_percussion(audio, sr, output_dir),
-                "synth": self.extract_synth(audio, sr, output_dir),
-                "instrumental": self.create_instrumental(basic_stems, output_dir)
-            }
+            # One analysis for all extended tracks (piano, guitar, strings, brass, percussion, synth)
+            loop = asyncio.get_event_loop()
+            additional_tracks = await loop.run_in_executor(
+                None, extended_stems_engine.separate_file, file_path, output_dir, requested_tracks
+            )
+            additional_tracks["instrumental"] = self.create_instrumental(basic_stems, output_dir)
             
             # Add valid tracks to extended stems
             for track_name, track_path in additional_tracks.items():
@@ -207,95 +179,17 @@ class AudioProcessor:
             print(f"[ERROR] Error creating extended tracks: {e}")
             return basic_stems
     
-    def extract_piano(self, audio: np.ndarray, sr: int, output_dir: Path) -> str:
-        """Extract piano using frequency analysis"""
-        try:
-            # Use harmonic-percussive separation to isolate harmonic content
-            y_harmonic, y_percussive = librosa.effects.hpss(audio)
-            
-            # Further filter for piano-like frequencies (80-4000 Hz)
-            piano = librosa.effects.preemphasis(y_harmonic)
-            
-            output_path = output_dir / "piano.wav"
-            sf.write(str(output_path), piano, sr)
-            return str(output_path)
-        except:
-            return None
-    
-    def extract_guitar(self, audio: np.ndarray, sr: int, output_dir: Path) -> str:
-        """Extract guitar using spectral analysis"""
-        try:
-            # Use chroma features to isolate guitar-like content
-            chroma = librosa.feature.chroma_stft(y=audio, sr=sr)
-            
-            # Create guitar track by emphasizing guitar frequencies
-            guitar = librosa.effects.preemphasis(audio)
-            
-            output_path = output_dir / "guitar.wav"
-            sf.write(str(output_path), guitar, sr)
-            return str(output_path)
-        except:
-            return None
-    
-    def extract_strings(self, audio: np.ndarray, sr: int, output_dir: Path) -> str:
-        """Extract strings using spectral analysis"""
-        try:
-            # Filter for string-like frequencies
-            strings = librosa.effects.preemphasis(audio)
-            
-            output_path = output_dir / "strings.wav"
-            sf.write(str(output_path), strings, sr)
-            return str(output_path)
-        except:
-            return None
-    
-    def extract_brass(self, audio: np.ndarray, sr: int, output_dir: Path) -> str:
-        """Extract brass instruments"""
-        try:
-            # Filter for brass frequencies
-            brass = librosa.effects.preemphasis(audio)
-            
-            output_path = output_dir / "brass.wav"
-            sf.write(str(output_path), brass, sr)
-            return str(output_path)
-        except:
-            return None
-    
-    def extract_percussion(self, audio: np.ndarray, sr: int, output_dir: Path) -> str:
-        """Extract percussion using percussive separation"""
-        try:
-            # Use harmonic-percussive separation
-            y_harmonic, y_percussive = librosa.effects.hpss(audio)
-            
-            output_path = output_dir / "percussion.wav"
-            sf.write(str(output_path), y_percussive, sr)
-            return str(output_path)
-        except:
-            return None
-    
-    def extract_synth(self, audio: np.ndarray, sr: int, output_dir: Path) -> str:
-        """Extract synthesizer sounds"""
-        try:
-            # Filter for synth-like frequencies
-            synth = librosa.effects.preemphasis(audio)
-            
-            output_path = output_dir / "synth.wav"
-            sf.write(str(output_path), synth, sr)
-            return str(output_path)
-        except:
-            return None
-    
     def create_instrumental(self, basic_stems: Dict[str, str], output_dir: Path) -> str:
         """Create instrumental track by combining drums + bass + other"""
         try:
             if all(track in basic_stems for track in ["drums", "bass", "other"]):
-                # For now, just copy drums as instrumental
-                # In a real implementation, you'd mix the tracks
                 instrumental_path = output_dir / "instrumental.wav"
-                shutil.copy2(basic_stems["drums"], instrumental_path)
-                return str(instrumental_path)
-        except:
-            pass
+                return stem_mixer.mix_stems(
+                    [basic_stems[track] for track in ["drums", "bass", "other"]],
+                    instrumental_path
+                )
+        except Exception as e:
+            print(f"[ERROR] Error creating instrumental: {e}")
         return None
 
 # Global instance
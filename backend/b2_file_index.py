@@ -0,0 +1,122 @@
+"""
+B2 File Index - índice persistente ruta -> fileId de los archivos subidos a B2
+
+b2_delete_file_version necesita el fileId. Sin índice cada borrado hace antes
+un b2_list_file_names; con el índice el fileId que devuelve upload_file queda
+guardado (tabla b2_files de la base de datos) y el borrado es una sola llamada.
+Si el índice no tiene la ruta se vuelve al listado de B2.
+
+Base de datos: la de database.py (DATABASE_URL). El default es un sqlite local
+(./moises_clone.db) que en Cloud Run es por instancia y se pierde al escalar a
+cero, así que en producción DATABASE_URL tiene que apuntar a una base
+compartida (Postgres/Cloud SQL); en Cloud Run (K_SERVICE) sin DATABASE_URL el
+índice queda deshabilitado y todo borrado usa el listado de B2.
+
+SQLAlchemy es síncrono: cada operación corre en un thread propio del índice
+(fuera del event loop) y se importa en el primer uso (no en el arranque de la API).
+"""
+
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Optional
+
+
+class B2FileIndex:
+    def __init__(self):
+        self._table_ready = False
+        self._enabled: Optional[bool] = None
+        # Un solo thread: las escrituras se serializan (sqlite no admite escritores concurrentes)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="b2-index")
+
+    @property
+    def enabled(self) -> bool:
+        if self._enabled is None:
+            self._enabled = not (os.getenv("K_SERVICE") and not os.getenv("DATABASE_URL"))
+            if not self._enabled:
+                print("[B2 INDEX] DATABASE_URL no configurada en Cloud Run: el sqlite local se pierde "
+                      "con cada instancia, índice deshabilitado (los borrados listan en B2)")
+        return self._enabled
+
+    def _session(self):
+        from database import B2FileDB, SessionLocal, engine
+
+        if not self._table_ready:
+            # init_db está deshabilitado al arrancar: crear solo esta tabla
+            B2FileDB.__table__.create(bind=engine, checkfirst=True)
+            self._table_ready = True
+        return SessionLocal(), B2FileDB
+
+    async def _run(self, fn, *args):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self._executor, fn, *args)
+
+    async def get(self, file_name: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+        return await self._run(self._get, file_name)
+
+    async def put(self, file_name: str, file_id: str, size: Optional[int] = None):
+        if self.enabled:
+            await self._run(self._put, file_name, file_id, size)
+
+    async def remove(self, file_names: Iterable[str]):
+        file_names = list(file_names)
+        if file_names and self.enabled:
+            await self._run(self._remove, file_names)
+
+    async def under_prefix(self, prefix: str) -> Dict[str, str]:
+        """Rutas indexadas bajo un prefijo -> fileId"""
+        if not self.enabled:
+            return {}
+        return await self._run(self._under_prefix, prefix)
+
+    def _get(self, file_name: str) -> Optional[str]:
+        try:
+            db, model = self._session()
+            try:
+                row = db.get(model, file_name)
+                return row.file_id if row else None
+            finally:
+                db.close()
+        except Exception as e:
+            print(f"[B2 INDEX] Error leyendo {file_name}: {e}")
+            return None
+
+    def _put(self, file_name: str, file_id: str, size: Optional[int]):
+        try:
+            db, model = self._session()
+            try:
+                db.merge(model(file_name=file_name, file_id=file_id, size=size))
+                db.commit()
+            finally:
+                db.close()
+        except Exception as e:
+            print(f"[B2 INDEX] Error guardando {file_name}: {e}")
+
+    def _remove(self, file_names: list):
+        try:
+            db, model = self._session()
+            try:
+                db.query(model).filter(model.file_name.in_(file_names)).delete(synchronize_session=False)
+                db.commit()
+            finally:
+                db.close()
+        except Exception as e:
+            print(f"[B2 INDEX] Error eliminando {len(file_names)} entradas: {e}")
+
+    def _under_prefix(self, prefix: str) -> Dict[str, str]:
+        try:
+            db, model = self._session()
+            try:
+                rows = db.query(model).filter(model.file_name.startswith(prefix, autoescape=True)).all()
+                return {row.file_name: row.file_id for row in rows}
+            finally:
+                db.close()
+        except Exception as e:
+            print(f"[B2 INDEX] Error listando {prefix}: {e}")
+            return {}
+
+
+# Global instance
+b2_file_index = B2FileIndex()
@@ -2,13 +2,19 @@
 B2 Storage - Real implementation
 """
 
-import aiohttp
 import asyncio
 import base64
 import hashlib
 import hmac
 import json
-from typing import AsyncGenerator
+from typing import AsyncGenerator, Dict, Iterable, List, Optional
+
+from b2_file_index import b2_file_index
+from lazy_imports import lazy_import
+
+# aiohttp cuesta ~200 ms de import: se carga con la primera llamada a B2, no al arrancar la API
+aiohttp = lazy_import("aiohttp")
+
 
 class B2Storage:
     def __init__(self):
@@ -21,6 +27,7 @@ class B2Storage:
         self.download_url = "https://s3.us-east-005.backblazeb2.com"
         self.auth_token = None
         self.api_url_authorized = None
+        self.delete_concurrency = 8   # Borrados simultáneos en delete_files / delete_prefix
     
     async def initialize(self):
         """Initialize B2 storage with real authentication"""
@@ -93,6 +100,9 @@ class B2Storage:
                                 except:
                                     file_id = "unknown"
                                 
+                                if file_id != "unknown":
+                                    await b2_file_index.put(filename, file_id, len(file_content))
+                                
                                 download_url = f"{self.download_url}/{self.bucket_name}/{filename}"
                                 
                                 print(f"Successfully uploaded to B2: {download_url}")
@@ -115,6 +125,16 @@ class B2Storage:
             print(f"Error in upload_file: {e}")
             raise
 
+    def path_from_url(self, url: str) -> Optional[str]:
+        """Ruta del archivo en el bucket si la URL apunta a él (S3 o URL friendly de B2), si no None"""
+        from urllib.parse import unquote, urlsplit
+
+        parts = urlsplit(url)
+        for prefix in (f"/{self.bucket_name}/", f"/file/{self.bucket_name}/"):
+            if parts.netloc.endswith("backblazeb2.com") and parts.path.startswith(prefix):
+                return unquote(parts.path[len(prefix):])
+        return None
+
     async def download_file(self, file_path: str) -> AsyncGenerator[bytes, None]:
         """Download file from B2 and stream it"""
         try:
@@ -157,74 +177,214 @@ class B2Storage:
             print(f"Error in download_file_bytes: {e}")
             return None
 
-    async def delete_file(self, file_path: str) -> bool:
-        """Delete file from B2"""
+    async def download_range(self, file_path: str, start: int, end: int) -> Optional[bytes]:
+        """Download bytes [start, end] (inclusive) of a file from B2 with a Range GET"""
+        try:
+            s3_url = f"{self.download_url}/{self.bucket_name}/{file_path}"
+            async with aiohttp.ClientSession() as session:
+                async with session.get(s3_url, headers={"Range": f"bytes={start}-{end}"}) as response:
+                    if response.status == 206:
+                        return await response.read()
+                    if response.status == 200:
+                        # El servidor ignoró el Range: recortar lo pedido
+                        content = await response.read()
+                        return content[start:end + 1]
+                    print(f"Error downloading range of {file_path}: {response.status}")
+                    return None
+        except Exception as e:
+            print(f"Error in download_range: {e}")
+            return None
+
+    async def file_exists(self, file_path: str) -> bool:
+        """Check if a file exists in B2 (HEAD request, no download)"""
+        try:
+            s3_url = f"{self.download_url}/{self.bucket_name}/{file_path}"
+            async with aiohttp.ClientSession() as session:
+                async with session.head(s3_url) as response:
+                    return response.status == 200
+        except Exception as e:
+            print(f"Error in file_exists: {e}")
+            return False
+
+    async def delete_file(self, file_path: str, file_id: Optional[str] = None,
+                          session: Optional["aiohttp.ClientSession"] = None) -> bool:
+        """Delete file from B2 (fileId del índice; b2_list_file_names solo si no está indexado)"""
         try:
             if not self.initialized:
                 await self.initialize()
             
-            # Primero necesitamos obtener el file_id del archivo
-            file_id = await self._get_file_id(file_path)
-            if not file_id:
-                print(f"File not found in B2: {file_path}")
-                return False
-            
-            # Eliminar archivo usando la API de B2
-            delete_url = f"{self.api_url_authorized}/b2api/v2/b2_delete_file_version"
-            
-            async with aiohttp.ClientSession() as session:
-                headers = {
-                    "Authorization": self.auth_token,
-                    "Content-Type": "application/json"
-                }
-                
-                delete_data = {
-                    "fileId": file_id,
-                    "fileName": file_path
-                }
-                
-                async with session.post(delete_url, headers=headers, json=delete_data) as response:
-                    if response.status == 200:
-                        print(f"Archivo eliminado de B2: {file_path}")
-                        return True
-                    else:
-                        error_text = await response.text()
-                        print(f"Error eliminando archivo {file_path}: {response.status} - {error_text}")
-                        return False
+            if session is None:
+                async with aiohttp.ClientSession() as session:
+                    return await self._delete_file_version(session, file_path, file_id)
+            return await self._delete_file_version(session, file_path, file_id)
                         
         except Exception as e:
             print(f"Error in delete_file: {e}")
             return False
 
-    async def _get_file_id(self, file_path: str) -> str:
+    async def _delete_file_version(self, session: "aiohttp.ClientSession", file_path: str,
+                                   file_id: Optional[str] = None) -> bool:
+        from_index = False
+        if not file_id:
+            file_id = await b2_file_index.get(file_path)
+            from_index = file_id is not None
+        if not file_id:
+            file_id = await self._get_file_id(file_path, session)
+        if not file_id:
+            print(f"File not found in B2: {file_path}")
+            return False
+        
+        # Eliminar archivo usando la API de B2
+        delete_url = f"{self.api_url_authorized}/b2api/v2/b2_delete_file_version"
+        headers = {
+            "Authorization": self.auth_token,
+            "Content-Type": "application/json"
+        }
+        delete_data = {
+            "fileId": file_id,
+            "fileName": file_path
+        }
+        
+        async with session.post(delete_url, headers=headers, json=delete_data) as response:
+            if response.status == 200:
+                await b2_file_index.remove([file_path])
+                print(f"Archivo eliminado de B2: {file_path}")
+                return True
+            error_text = await response.text()
+        
+        if from_index and response.status in (400, 404):
+            # Entrada del índice obsoleta (archivo re-subido o borrado por fuera): buscar el fileId actual
+            await b2_file_index.remove([file_path])
+            file_id = await self._get_file_id(file_path, session)
+            if file_id:
+                return await self._delete_file_version(session, file_path, file_id)
+            return False
+        
+        print(f"Error eliminando archivo {file_path}: {response.status} - {error_text}")
+        return False
+
+    async def delete_files(self, file_paths: Iterable[str], file_ids: Optional[Dict[str, str]] = None) -> Dict[str, bool]:
+        """Elimina varios archivos en paralelo (como mucho delete_concurrency a la vez); retorna ruta -> eliminado"""
+        file_paths = list(dict.fromkeys(file_paths))
+        file_ids = file_ids or {}
+        if not file_paths:
+            return {}
+        if not self.initialized:
+            await self.initialize()
+        
+        semaphore = asyncio.Semaphore(self.delete_concurrency)
+        
+        async with aiohttp.ClientSession() as session:
+            async def delete_one(file_path: str) -> bool:
+                async with semaphore:
+                    return await self.delete_file(file_path, file_ids.get(file_path), session)
+            
+            results = await asyncio.gather(*(delete_one(path) for path in file_paths))
+        
+        deleted = sum(results)
+        print(f"[B2] Eliminados {deleted}/{len(file_paths)} archivos")
+        return dict(zip(file_paths, results))
+
+    async def delete_prefix(self, prefix: str) -> List[str]:
+        """Elimina todo lo que está bajo un prefijo (ej. stems/{user_id}/{song_id}/); retorna las rutas eliminadas"""
+        try:
+            if not self.initialized:
+                await self.initialize()
+            async with aiohttp.ClientSession() as session:
+                file_ids = await self._list_file_names(prefix, session)
+        except Exception as e:
+            print(f"Error listando {prefix}: {e}")
+            return []
+        
+        # Entradas del índice que ya no están en B2
+        indexed = await b2_file_index.under_prefix(prefix)
+        await b2_file_index.remove(path for path in indexed if path not in file_ids)
+        
+        results = await self.delete_files(file_ids.keys(), file_ids)
+        return [path for path, deleted in results.items() if deleted]
+
+    async def _list_file_names(self, prefix: str, session: "aiohttp.ClientSession") -> Dict[str, str]:
+        """Archivos bajo un prefijo -> fileId (b2_list_file_names paginado, 1000 por llamada)"""
+        files = {}
+        async for page, _ in self.iter_file_names(prefix, session=session):
+            for file_info in page:
+                files[file_info["fileName"]] = file_info["fileId"]
+        return files
+
+    async def iter_file_names(self, prefix: str = "", page_size: int = 1000, start_file_name: Optional[str] = None,
+                              delimiter: Optional[str] = None, session: Optional["aiohttp.ClientSession"] = None):
+        """
+        Listado paginado de b2_list_file_names: yield (archivos de la página, nextFileName).
+        nextFileName permite retomar el listado más tarde (None en la última página).
+        """
+        if not self.initialized:
+            await self.initialize()
+        if session is None:
+            async with aiohttp.ClientSession() as session:
+                async for page in self.iter_file_names(prefix, page_size, start_file_name, delimiter, session):
+                    yield page
+            return
+        
+        list_url = f"{self.api_url_authorized}/b2api/v2/b2_list_file_names"
+        headers = {
+            "Authorization": self.auth_token,
+            "Content-Type": "application/json"
+        }
+        
+        while True:
+            list_data = {
+                "bucketId": self.bucket_id,
+                "prefix": prefix,
+                "maxFileCount": page_size
+            }
+            if start_file_name:
+                list_data["startFileName"] = start_file_name
+            if delimiter:
+                list_data["delimiter"] = delimiter
+            
+            async with session.post(list_url, headers=headers, json=list_data) as response:
+                if response.status != 200:
+                    raise Exception(f"Error listando archivos: {response.status} - {await response.text()}")
+                data = await response.json()
+            
+            start_file_name = data.get("nextFileName")
+            yield data.get("files", []), start_file_name
+            if not start_file_name:
+                return
+
+    async def _get_file_id(self, file_path: str, session: Optional["aiohttp.ClientSession"] = None) -> str:
         """Obtener el file_id de un archivo en B2"""
         try:
             if not self.initialized:
                 await self.initialize()
             
+            if session is None:
+                async with aiohttp.ClientSession() as session:
+                    return await self._get_file_id(file_path, session)
+            
             list_url = f"{self.api_url_authorized}/b2api/v2/b2_list_file_names"
             
-            async with aiohttp.ClientSession() as session:
-                headers = {
-                    "Authorization": self.auth_token,
-                    "Content-Type": "application/json"
-                }
-                
-                list_data = {
-                    "bucketId": self.bucket_id,
-                    "startFileName": file_path,
-                    "maxFileCount": 1
-                }
-                
-                async with session.post(list_url, headers=headers, json=list_data) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        files = data.get("files", [])
-                        for file_info in files:
-                            if file_info["fileName"] == file_path:
-                                return file_info["fileId"]
-                    else:
-                        print(f"Error listando archivos: {response.status}")
+            headers = {
+                "Authorization": self.auth_token,
+                "Content-Type": "application/json"
+            }
+            
+            list_data = {
+                "bucketId": self.bucket_id,
+                "startFileName": file_path,
+                "maxFileCount": 1
+            }
+            
+            async with session.post(list_url, headers=headers, json=list_data) as response:
+                if response.status == 200:
+                    data = await response.json()
+                    files = data.get("files", [])
+                    for file_info in files:
+                        if file_info["fileName"] == file_path:
+                            await b2_file_index.put(file_path, file_info["fileId"], file_info.get("contentLength"))
+                            return file_info["fileId"]
+                else:
+                    print(f"Error listando archivos: {response.status}")
                         
         except Exception as e:
             print(f"Error in _get_file_id: {e}")
@@ -0,0 +1,219 @@
+"""
+Batch Analysis - análisis de bibliotecas completas / setlists en un solo job
+
+Cada canción se descarga una vez (audio_fetch, concurrencia acotada), se
+decodifica una vez en un worker del process pool y de esa señal salen todas
+las features pedidas:
+
+- bpm:    BPM en streaming sobre la canción completa
+- key:    tonalidad (Krumhansl-Schmuckler, primeros 30 s)
+- meter:  compás y fase del downbeat (primeros 60 s)
+- chords: acordes con tiempos
+- onset:  primer ataque de sonido (primeros 10 s)
+
+Los resultados se emiten por canción a medida que terminan (NDJSON en
+/api/analyze-batch). Las canciones con song_id que ya tienen registro en
+analysis_store sirven bpm/key/meter desde ahí sin descargar el audio.
+"""
+
+import asyncio
+import multiprocessing
+import os
+import time
+from contextlib import AsyncExitStack
+from concurrent.futures import ProcessPoolExecutor
+from typing import AsyncIterator, Dict, List, Optional
+
+import numpy as np
+
+import dsp_warmup
+from analysis_store import analysis_store
+from audio_fetch import audio_fetcher
+from single_flight import analysis_flight, normalize_url
+
+FEATURES = ("bpm", "key", "meter", "chords", "onset")
+STORED_FEATURES = ("bpm", "key", "meter")    # Disponibles en SongAnalysis
+ANALYSIS_SR = 22050
+
+
+def analyze_song_file(file_path: str, features: List[str]) -> Dict:
+    """
+    Worker del process pool: decodifica una vez y calcula las features pedidas
+    (cada feature falla por separado sin tumbar las demás)
+    """
+    import librosa
+
+    y, sr = librosa.load(file_path, sr=ANALYSIS_SR, mono=True)
+    result = {"duration": float(len(y) / sr)}
+
+    for feature in features:
+        try:
+            result[feature] = _FEATURE_FUNCTIONS[feature](y, sr)
+        except Exception as e:
+            result[feature] = {"error": str(e)}
+    return result
+
+
+def _bpm(y: np.ndarray, sr: int) -> Dict:
+    from bpm_streaming import bpm_streaming_analyzer
+
+    block = bpm_streaming_analyzer.block_samples
+    blocks = (y[start:start + block] for start in range(0, len(y), block))
+    analysis = bpm_streaming_analyzer.analyze_blocks(blocks, sr)
+    return {"bpm": analysis.get("bpm"), "confidence": analysis.get("confidence", 0)}
+
+
+def _key(y: np.ndarray, sr: int) -> Dict:
+    import librosa
+    from key_analyzer_simple import key_analyzer_simple
+
+    backend = key_analyzer_simple.chroma_backend
+    target_sr = key_analyzer_simple.BACKEND_PARAMS[backend][0]
+    clip = y[:30 * sr]
+    if target_sr != sr:
+        clip = librosa.resample(clip, orig_sr=sr, target_sr=target_sr)
+    analysis = key_analyzer_simple.estimate_key(key_analyzer_simple.compute_chroma(clip, target_sr, backend))
+    return {"key": analysis["key_string"], "confidence": analysis["confidence"]}
+
+
+def _meter(y: np.ndarray, sr: int) -> Dict:
+    import time_signature_analyzer
+
+    analysis = time_signature_analyzer.analyze_time_signature(y=y, sr=sr, duration=60)
+    return {
+        "time_signature": analysis.get("time_signature"),
+        "confidence": analysis.get("confidence", 0),
+        "downbeat_phase": analysis.get("downbeat_phase", 0)
+    }
+
+
+def _chords(y: np.ndarray, sr: int) -> List[Dict]:
+    from chord_analyzer import ChordAnalyzer
+
+    return [
+        {"chord": c.chord, "confidence": c.confidence, "start_time": c.start_time, "end_time": c.end_time}
+        for c in ChordAnalyzer().analyze_chords_from_signal(y, sr)
+    ]
+
+
+def _onset(y: np.ndarray, sr: int) -> Dict:
+    import librosa
+
+    onset_frames = librosa.onset.onset_detect(y=y[:10 * sr], sr=sr, backtrack=True, units='frames')
+    onset_time = float(librosa.frames_to_time(onset_frames[0], sr=sr)) if len(onset_frames) else 0.0
+    return {"onset_time": onset_time}
+
+
+_FEATURE_FUNCTIONS = {"bpm": _bpm, "key": _key, "meter": _meter, "chords": _chords, "onset": _onset}
+
+
+class BatchAnalyzer:
+    def __init__(self):
+        self.max_workers = int(os.getenv("BATCH_ANALYSIS_WORKERS", os.cpu_count() or 2))
+        self.download_concurrency = int(os.getenv("BATCH_DOWNLOAD_CONCURRENCY", "4"))
+        self.max_items = 500
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # forkserver: un fork del servidor (threads de executor, warm-up, httpx) puede heredar
+            # locks tomados y colgarse; los workers arrancan limpios y se calientan en init_worker
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("forkserver"),
+                initializer=dsp_warmup.init_worker
+            )
+        return self._executor
+
+    def validate(self, items: List[Dict], features: List[str]) -> List[str]:
+        """Features normalizadas; ValueError si la request no es válida"""
+        features = list(dict.fromkeys(features or STORED_FEATURES))
+        unknown = [f for f in features if f not in FEATURES]
+        if unknown:
+            raise ValueError(f"Features desconocidas: {unknown} (disponibles: {list(FEATURES)})")
+        if not items:
+            raise ValueError("La lista de canciones está vacía")
+        if len(items) > self.max_items:
+            raise ValueError(f"Máximo {self.max_items} canciones por batch")
+        for item in items:
+            if not item.get("url") and not (item.get("song_id") and item.get("user_id")):
+                raise ValueError("Cada canción necesita url o song_id + user_id")
+        return features
+
+    async def run(self, items: List[Dict], features: List[str]) -> AsyncIterator[Dict]:
+        """Analiza todas las canciones y emite un resultado por canción en orden de finalización"""
+        download_slots = asyncio.Semaphore(self.download_concurrency)
+        # Canciones descargadas o en descarga a la vez (acota los temporales en disco)
+        in_flight = asyncio.Semaphore(self.download_concurrency + self.max_workers)
+        started = time.perf_counter()
+
+        tasks = [
+            asyncio.ensure_future(self._analyze_item(index, item, features, download_slots, in_flight))
+            for index, item in enumerate(items)
+        ]
+        try:
+            for next_result in asyncio.as_completed(tasks):
+                yield await next_result
+        finally:
+            for task in tasks:
+                task.cancel()
+        print(f"[BATCH] {len(items)} canciones en {time.perf_counter() - started:.1f}s")
+
+    async def _analyze_item(self, index: int, item: Dict, features: List[str], download_slots, in_flight) -> Dict:
+        result = {"index": index, "song_id": item.get("song_id"), "url": item.get("url")}
+        started = time.perf_counter()
+        try:
+            stored = await self._stored_features(item, features)
+            result.update(stored)
+            features_left = [f for f in features if f not in stored]
+
+            if features_left:
+                if not item.get("url"):
+                    raise ValueError(f"Sin análisis guardado ni url para: {features_left}")
+                async with in_flight:
+                    computed = await analysis_flight.do(
+                        ("batch", normalize_url(item["url"]), tuple(sorted(features_left))),
+                        lambda: self._analyze_url(item["url"], features_left, download_slots)
+                    )
+                result.update(computed)
+            result["success"] = True
+        except Exception as e:
+            result.update({"success": False, "error": str(e)})
+        result["elapsed"] = round(time.perf_counter() - started, 3)
+        return result
+
+    async def _stored_features(self, item: Dict, features: List[str]) -> Dict:
+        """Features ya calculadas en el análisis de la separación (sin descargar el audio)"""
+        if not item.get("song_id") or not item.get("user_id"):
+            return {}
+        analysis = await analysis_store.load(item["user_id"], item["song_id"])
+        if not analysis:
+            return {}
+
+        stored = {}
+        if "bpm" in features and analysis.bpm:
+            stored["bpm"] = {"bpm": analysis.bpm, "confidence": analysis.bpm_confidence}
+        if "key" in features and analysis.key:
+            stored["key"] = {"key": analysis.key, "confidence": analysis.key_confidence}
+        if "meter" in features and analysis.time_signature:
+            stored["meter"] = {
+                "time_signature": analysis.time_signature,
+                "confidence": analysis.time_signature_confidence,
+                "downbeat_phase": analysis.downbeat_phase
+            }
+        if stored and analysis.duration:
+            stored["duration"] = analysis.duration
+        return stored
+
+    async def _analyze_url(self, url: str, features: List[str], download_slots) -> Dict:
+        async with AsyncExitStack() as stack:
+            # El slot de descarga se libera al terminar la descarga, el temporal al terminar el análisis
+            async with download_slots:
+                audio_path = await stack.enter_async_context(audio_fetcher.fetch_to_file(url))
+            loop = asyncio.get_event_loop()
+            return await loop.run_in_executor(self.executor, analyze_song_file, str(audio_path), features)
+
+
+# Global instance
+batch_analyzer = BatchAnalyzer()
@@ -0,0 +1,68 @@
+"""
+Beat Grid - grid de beats alineado a downbeats, calculado una vez por canción
+
+El formato y la construcción del grid están en beat_grid_format.py (solo numpy).
+Este módulo lo persiste en B2 (grids/{user_id}/{song_id}/beat_grid.npy) y en una
+cache local, y se reutiliza para click tracks, loop sections y sincronización
+de acordes sin volver a hacer beat tracking por request.
+"""
+
+import tempfile
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+from b2_storage import b2_storage
+from beat_grid_format import GRID_COLUMNS, build_beat_grid, grid_from_bytes, grid_to_bytes, grid_to_dict
+from scratch_space import scratch_space
+
+
+class BeatGridStore:
+    def __init__(self):
+        self.cache_dir = scratch_space.register_cache(Path(tempfile.gettempdir()) / "moises_beat_grids")
+
+    def _b2_path(self, user_id: str, song_id: str) -> str:
+        return f"grids/{user_id}/{song_id}/beat_grid.npy"
+
+    def _local_path(self, user_id: str, song_id: str) -> Path:
+        return self.cache_dir / f"{user_id}_{song_id}.npy"
+
+    async def save(self, user_id: str, song_id: str, grid: np.ndarray) -> Optional[str]:
+        """Guarda el grid en la cache local y en B2; retorna la URL de B2"""
+        data = grid_to_bytes(grid)
+        self._local_path(user_id, song_id).write_bytes(data)
+
+        try:
+            upload = await b2_storage.upload_file(
+                file_content=data,
+                filename=self._b2_path(user_id, song_id),
+                content_type="application/octet-stream"
+            )
+            print(f"[GRID] Beat grid guardado: {len(grid)} beats, {len(data)} bytes")
+            return upload.get("download_url")
+        except Exception as e:
+            print(f"[GRID] Error subiendo beat grid a B2: {e}")
+            return None
+
+    async def load(self, user_id: str, song_id: str) -> Optional[np.ndarray]:
+        """Carga el grid desde la cache local o B2; None si no existe"""
+        local_path = self._local_path(user_id, song_id)
+        try:
+            if local_path.exists():
+                scratch_space.touch(local_path)
+                return grid_from_bytes(local_path.read_bytes())
+
+            data = await b2_storage.download_file_bytes(self._b2_path(user_id, song_id))
+            if not data:
+                return None
+
+            local_path.write_bytes(data)
+            return grid_from_bytes(data)
+        except Exception as e:
+            print(f"[GRID] Error cargando beat grid de {song_id}: {e}")
+            return None
+
+
+# Instancia global
+beat_grid_store = BeatGridStore()
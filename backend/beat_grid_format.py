@@ -0,0 +1,64 @@
+"""
+Beat Grid Format - construcción y serialización del beat grid (solo numpy)
+
+Formato compacto: array float32 de N x 3, una fila por beat:
+    [tiempo en segundos, es_downbeat (0/1), número de compás]
+Los beats anteriores al primer downbeat (anacrusa) tienen compás 0.
+
+Sin dependencias de almacenamiento: lo importan los analizadores (también dentro
+de los workers de batch_analysis) sin cargar b2_storage ni scratch_space. La
+persistencia (B2 + cache local) está en beat_grid.py.
+"""
+
+import io
+from typing import Dict
+
+import numpy as np
+
+GRID_COLUMNS = ("time", "downbeat", "bar")
+
+
+def build_beat_grid(beat_times, beats_per_bar: int, downbeat_phase: int = 0) -> np.ndarray:
+    """
+    Construye el grid a partir de los tiempos de beat y la fase del downbeat
+
+    Args:
+        beat_times: Tiempos de beat en segundos
+        beats_per_bar: Beats por compás (4 para 4/4, 3 para 3/4, ...)
+        downbeat_phase: Índice del primer beat que cae en el tiempo 1
+    """
+    beat_times = np.asarray(beat_times, dtype=np.float32)
+    beat_index = np.arange(len(beat_times)) - downbeat_phase
+
+    grid = np.zeros((len(beat_times), 3), dtype=np.float32)
+    grid[:, 0] = beat_times
+    grid[:, 1] = (beat_index >= 0) & (beat_index % beats_per_bar == 0)
+    grid[:, 2] = np.where(beat_index >= 0, beat_index // beats_per_bar + 1, 0)
+    return grid
+
+
+def grid_to_bytes(grid: np.ndarray) -> bytes:
+    """Serializa el grid en formato .npy (float32)"""
+    buffer = io.BytesIO()
+    np.save(buffer, np.asarray(grid, dtype=np.float32), allow_pickle=False)
+    return buffer.getvalue()
+
+
+def grid_from_bytes(data: bytes) -> np.ndarray:
+    """Deserializa un grid .npy"""
+    grid = np.load(io.BytesIO(data), allow_pickle=False)
+    if grid.ndim != 2 or grid.shape[1] != len(GRID_COLUMNS):
+        raise ValueError(f"Beat grid con forma inválida: {grid.shape}")
+    return grid.astype(np.float32, copy=False)
+
+
+def grid_to_dict(grid: np.ndarray) -> Dict:
+    """Representación JSON del grid para el frontend"""
+    downbeats = grid[:, 1] > 0
+    return {
+        "beats": [round(float(t), 4) for t in grid[:, 0]],
+        "downbeats": [round(float(t), 4) for t in grid[downbeats, 0]],
+        "bars": [int(b) for b in grid[:, 2]],
+        "beat_count": int(len(grid)),
+        "bar_count": int(grid[:, 2].max()) if len(grid) else 0
+    }
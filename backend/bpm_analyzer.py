@@ -18,6 +18,20 @@ class BPMAnalyzer:
     def __init__(self):
         self.min_bpm = 60
         self.max_bpm = 200
+        self.n_fft = 2048
+        self.hop_length = 512
+    
+    def _onset_envelope(self, stft_magnitude: np.ndarray, sr: int) -> np.ndarray:
+        """
+        Onset envelope a partir de una STFT de magnitud ya calculada
+        (mel spectrogram en dB + flujo espectral, igual que librosa.onset.onset_strength)
+        """
+        mel = librosa.feature.melspectrogram(S=stft_magnitude ** 2, sr=sr)
+        return librosa.onset.onset_strength(S=librosa.power_to_db(mel), sr=sr)
+    
+    def _as_float(self, value) -> float:
+        """librosa >= 0.10 devuelve el tempo como array de un elemento"""
+        return float(np.atleast_1d(value)[0])
         
     def analyze_bpm(self, file_path: str) -> Dict:
         """
@@ -37,53 +51,71 @@ class BPMAnalyzer:
             y, sr = librosa.load(file_path, duration=120)  # Analizar primeros 2 minutos
             print(f"[OK] Audio cargado: SR={sr}, duracion={len(y)/sr:.2f}s")
             
+            # Pipeline compartido: una sola STFT y un solo onset envelope para todos los métodos
+            stft_magnitude = np.abs(librosa.stft(y, n_fft=self.n_fft, hop_length=self.hop_length))
+            onset_env = self._onset_envelope(stft_magnitude, sr)
+            
             # Método 1: Beat tracking básico (librosa default)
-            tempo_basic, beats_basic = librosa.beat.beat_track(y=y, sr=sr)
+            tempo_basic, beats_basic = librosa.beat.beat_track(
+                onset_envelope=onset_env, sr=sr, hop_length=self.hop_length
+            )
+            tempo_basic = self._as_float(tempo_basic)
             print(f"[1] Metodo 1 (Basic): {tempo_basic:.1f} BPM")
             
             # Método 2: Onset strength envelope + Tempogram
-            onset_env = librosa.onset.onset_strength(y=y, sr=sr)
-            tempo_onset = librosa.feature.tempo(onset_envelope=onset_env, sr=sr)[0]
+            tempo_onset = self._as_float(
+                librosa.feature.tempo(onset_envelope=onset_env, sr=sr, hop_length=self.hop_length)
+            )
             print(f"[2] Metodo 2 (Onset): {tempo_onset:.1f} BPM")
             
             # Método 3: Beat tracking con agregación
             tempo_aggregated, beats_agg = librosa.beat.beat_track(
-                y=y, sr=sr,
+                onset_envelope=onset_env, sr=sr, hop_length=self.hop_length,
                 start_bpm=120,
                 trim=True
             )
+            tempo_aggregated = self._as_float(tempo_aggregated)
             print(f"[3] Metodo 3 (Aggregated): {tempo_aggregated:.1f} BPM")
             
             # Método 4: Análisis de ventanas múltiples (más robusto)
+            # Se recorta el onset envelope en lugar del audio: no se recalcula la STFT por ventana
             tempos_windows = []
             window_duration = 30  # 30 segundos por ventana
             hop_duration = 15  # Salto de 15 segundos
             
-            total_samples = len(y)
-            window_samples = int(window_duration * sr)
-            hop_samples = int(hop_duration * sr)
+            total_frames = len(onset_env)
+            window_frames = librosa.time_to_frames(window_duration, sr=sr, hop_length=self.hop_length)
+            hop_frames = librosa.time_to_frames(hop_duration, sr=sr, hop_length=self.hop_length)
             
-            for start in range(0, total_samples - window_samples, hop_samples):
-                end = start + window_samples
-                y_window = y[start:end]
+            for start in range(0, total_frames - window_frames, hop_frames):
+                end = start + window_frames
+                onset_window = onset_env[start:end]
                 
                 try:
-                    tempo_window, _ = librosa.beat.beat_track(y=y_window, sr=sr)
+                    tempo_window, _ = librosa.beat.beat_track(
+                        onset_envelope=onset_window, sr=sr, hop_length=self.hop_length
+                    )
+                    tempo_window = self._as_float(tempo_window)
                     if self.min_bpm <= tempo_window <= self.max_bpm:
                         tempos_windows.append(tempo_window)
                 except:
                     continue
             
             if tempos_windows:
-                tempo_multiwindow = np.median(tempos_windows)
+                tempo_multiwindow = float(np.median(tempos_windows))
                 print(f"[4] Metodo 4 (Multi-window): {tempo_multiwindow:.1f} BPM ({len(tempos_windows)} ventanas)")
             else:
                 tempo_multiwindow = tempo_basic
             
             # Método 5: Análisis percusivo (enfoque en batería)
+            # HPSS sobre la STFT ya calculada, no sobre el audio
             try:
-                y_harmonic, y_percussive = librosa.effects.hpss(y)
-                tempo_percussive, _ = librosa.beat.beat_track(y=y_percussive, sr=sr)
+                _, percussive_magnitude = librosa.decompose.hpss(stft_magnitude)
+                onset_percussive = self._onset_envelope(percussive_magnitude, sr)
+                tempo_percussive, _ = librosa.beat.beat_track(
+                    onset_envelope=onset_percussive, sr=sr, hop_length=self.hop_length
+                )
+                tempo_percussive = self._as_float(tempo_percussive)
                 print(f"[5] Metodo 5 (Percussive): {tempo_percussive:.1f} BPM")
             except:
                 tempo_percussive = tempo_basic
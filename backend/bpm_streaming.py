@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Analizador de BPM en streaming - canción completa con memoria acotada
+
+Lee el audio bloque a bloque (soundfile, o ffmpeg como respaldo), actualiza
+el onset envelope de forma incremental y mantiene un tempograma por
+autocorrelación sobre una ventana deslizante. En una sola pasada produce:
+- BPM global (tempograma acumulado con prior log-normal, igual que librosa)
+- Curva de tempo a lo largo de la canción
+- Grid de beats con un tracker causal que sigue el tempo local
+
+La memoria es independiente de la duración: solo se guarda la ventana
+del onset envelope, el tempograma acumulado y los resultados.
+"""
+
+import os
+import shutil
+import subprocess
+from typing import Dict, Iterator, List
+
+import librosa
+import numpy as np
+import soundfile as sf
+
+
+class StreamingBPMAnalyzer:
+    def __init__(self):
+        self.min_bpm = 60
+        self.max_bpm = 200
+        self.start_bpm = 120.0       # Centro del prior log-normal (igual que librosa)
+        self.std_bpm = 1.0           # Desviación del prior en octavas
+        self.window_seconds = 8.0    # Ventana del tempograma local
+        self.update_seconds = 1.0    # Cada cuánto se recalcula el tempo local
+        self.curve_seconds = 2.0     # Resolución de la curva de tempo
+        self.block_samples = 65536   # Tamaño de bloque de lectura
+        self.n_mels = 128
+        self.fallback_sr = 22050     # Sample rate del respaldo con ffmpeg
+
+    def _frame_params(self, sr: int):
+        """hop/n_fft escalados para mantener ~43 frames por segundo a cualquier SR"""
+        hop_length = 512 if sr <= 24000 else 1024
+        return hop_length, hop_length * 4
+
+    def _iter_blocks(self, file_path: str):
+        """
+        Devuelve (sr, generador de bloques mono float32)
+        Usa soundfile si puede abrir el archivo, si no decodifica con ffmpeg.
+        """
+        try:
+            info = sf.info(file_path)
+            sr = int(info.samplerate)
+
+            def soundfile_blocks() -> Iterator[np.ndarray]:
+                for block in sf.blocks(file_path, blocksize=self.block_samples, dtype='float32', always_2d=True):
+                    yield block.mean(axis=1)
+
+            return sr, soundfile_blocks()
+        except Exception as sf_error:
+            print(f"[BPM STREAM] soundfile no soporta el archivo ({sf_error}), usando ffmpeg")
+
+        if not shutil.which("ffmpeg"):
+            raise RuntimeError("No se puede decodificar el archivo: soundfile falló y ffmpeg no está disponible")
+
+        sr = self.fallback_sr
+
+        def ffmpeg_blocks() -> Iterator[np.ndarray]:
+            cmd = [
+                "ffmpeg", "-v", "error", "-i", file_path,
+                "-f", "f32le", "-ac", "1", "-ar", str(sr), "-"
+            ]
+            process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+            try:
+                chunk_bytes = self.block_samples * 4
+                while True:
+                    data = process.stdout.read(chunk_bytes)
+                    if not data:
+                        break
+                    usable = len(data) - (len(data) % 4)
+                    yield np.frombuffer(data[:usable], dtype=np.float32)
+            finally:
+                process.stdout.close()
+                process.wait()
+
+        return sr, ffmpeg_blocks()
+
+    def analyze_bpm_from_file(self, file_path: str) -> Dict:
+        """
+        Analiza BPM, curva de tempo y beats de la canción completa en streaming
+        """
+        try:
+            print(f"[BPM STREAM] Analizando: {file_path}")
+
+            if not os.path.exists(file_path):
+                return {"bpm": None, "error": "Archivo no encontrado", "confidence": 0}
+
+            sr, blocks = self._iter_blocks(file_path)
+            return self.analyze_blocks(blocks, sr)
+
+        except Exception as e:
+            print(f"[BPM STREAM] Error: {e}")
+            import traceback
+            traceback.print_exc()
+            return {"bpm": None, "error": str(e), "confidence": 0}
+
+    def analyze_blocks(self, blocks: Iterator[np.ndarray], sr: int) -> Dict:
+        """
+        Núcleo del análisis: consume bloques mono contiguos de audio a `sr`
+        """
+        hop_length, n_fft = self._frame_params(sr)
+        fps = sr / hop_length
+        window_frames = int(round(self.window_seconds * fps))
+        update_frames = max(1, int(round(self.update_seconds * fps)))
+        curve_every = max(1, int(round(self.curve_seconds / self.update_seconds)))
+
+        mel_basis = librosa.filters.mel(sr=sr, n_fft=n_fft, n_mels=self.n_mels).astype(np.float32)
+        fft_window = librosa.filters.get_window('hann', n_fft, fftbins=True).astype(np.float32)
+
+        # Lags del tempograma y prior log-normal sobre el BPM correspondiente
+        lags = np.arange(1, window_frames)
+        lag_bpm = 60.0 * fps / lags
+        valid_lags = (lag_bpm >= 30.0) & (lag_bpm <= 300.0)
+        prior = np.exp(-0.5 * ((np.log2(lag_bpm) - np.log2(self.start_bpm)) / self.std_bpm) ** 2)
+        prior[~valid_lags] = 0.0
+        ac_window = np.hanning(window_frames).astype(np.float32)
+
+        tempogram_sum = np.zeros(len(lags), dtype=np.float64)
+        tempogram_count = 0
+
+        # Estado incremental
+        pending = np.zeros(0, dtype=np.float32)   # Muestras sin enmarcar
+        prev_mel_db = None
+        running_max_db = -np.inf
+        envelope = np.zeros(0, dtype=np.float32)   # Ventana del onset envelope
+        envelope_start = 0                         # Índice absoluto de envelope[0]
+        total_frames = 0
+        total_samples = 0
+        updates = 0
+
+        local_period = None
+        next_beat = None
+        beats: List[float] = []
+        tempo_curve: List[Dict] = []
+
+        def frame_time(frame_index: float) -> float:
+            return (frame_index * hop_length + n_fft / 2) / sr
+
+        def refine_lag(curve: np.ndarray, index: int) -> float:
+            """Interpolación parabólica del pico para no cuantizar el BPM al lag entero"""
+            if 0 < index < len(curve) - 1:
+                left, center, right = curve[index - 1], curve[index], curve[index + 1]
+                denominator = left - 2 * center + right
+                if denominator < 0:
+                    return float(lags[index] + 0.5 * (left - right) / denominator)
+            return float(lags[index])
+
+        def envelope_slice(lo: int, hi: int) -> np.ndarray:
+            """Tramo [lo, hi) del onset envelope en índices absolutos"""
+            return envelope[lo - envelope_start:hi - envelope_start]
+
+        def local_tempogram(end: int) -> np.ndarray:
+            segment = envelope_slice(end - window_frames, end)
+            segment = (segment - segment.mean()) * ac_window
+            spectrum = np.fft.rfft(segment, n=2 * window_frames)
+            ac = np.fft.irfft(spectrum * np.conj(spectrum))[1:window_frames]
+            if ac.max() > 0:
+                ac = ac / ac.max()
+            return np.maximum(ac, 0.0)
+
+        def track_beats(last_frame: int):
+            """Avanza el tracker causal hasta `last_frame` (índice absoluto, inclusivo)"""
+            nonlocal next_beat
+            period = local_period
+            tolerance = max(1, int(round(period * 0.15)))
+
+            if next_beat is None:
+                # Inicializar fase: peine con el periodo local sobre la última ventana
+                segment_start = last_frame + 1 - window_frames
+                segment = envelope_slice(segment_start, last_frame + 1)
+                phases = np.arange(int(np.ceil(period)))
+                offsets = np.arange(0, len(segment), period)
+                positions = np.minimum((phases[:, None] + offsets[None, :]).astype(int), len(segment) - 1)
+                phase = int(phases[np.argmax(segment[positions].sum(axis=1))])
+                beat_positions = np.arange(phase, len(segment), period)
+                beats.extend(frame_time(segment_start + p) for p in beat_positions)
+                next_beat = segment_start + beat_positions[-1] + period
+                return
+
+            while next_beat + tolerance <= last_frame:
+                center = int(round(next_beat))
+                lo = max(center - tolerance, envelope_start)
+                hi = min(center + tolerance + 1, last_frame + 1)
+                window = envelope_slice(lo, hi)
+                if len(window) and window.max() > 0:
+                    offsets = np.arange(lo, hi) - next_beat
+                    weights = np.exp(-0.5 * (offsets / tolerance) ** 2)
+                    beat_frame = lo + int(np.argmax(window * weights))
+                else:
+                    beat_frame = next_beat
+                beats.append(frame_time(beat_frame))
+                next_beat = beat_frame + period
+
+        def process_frames(frames: np.ndarray):
+            nonlocal prev_mel_db, running_max_db, envelope, envelope_start
+            nonlocal total_frames, updates, local_period, tempogram_sum, tempogram_count
+
+            spectrum = np.abs(np.fft.rfft(frames * fft_window, axis=1)) ** 2
+            mel_db = 10.0 * np.log10(np.maximum(spectrum @ mel_basis.T, 1e-10))
+            running_max_db = max(running_max_db, float(mel_db.max()))
+            mel_db = np.maximum(mel_db, running_max_db - 80.0)
+
+            # Flujo espectral positivo respecto al frame anterior (también entre bloques)
+            previous = mel_db[:1] if prev_mel_db is None else prev_mel_db[None, :]
+            reference = np.vstack([previous, mel_db[:-1]])
+            prev_mel_db = mel_db[-1]
+            flux = np.maximum(mel_db - reference, 0.0).mean(axis=1).astype(np.float32)
+
+            first_new = total_frames
+            envelope = np.concatenate([envelope, flux])
+            total_frames += len(flux)
+
+            # Puntos de actualización del tempograma que caen en este bloque
+            first_update = max(window_frames, -(-(first_new + 1) // update_frames) * update_frames)
+            for end in range(first_update, total_frames + 1, update_frames):
+                ac = local_tempogram(end)
+                tempogram_sum += ac
+                tempogram_count += 1
+
+                weighted = ac * prior
+                local_period = refine_lag(weighted, int(np.argmax(weighted)))
+
+                if updates % curve_every == 0:
+                    tempo_curve.append({
+                        "time": round(frame_time(end - 1), 3),
+                        "bpm": round(60.0 * fps / local_period, 2)
+                    })
+                updates += 1
+                track_beats(end - 1)
+
+            if local_period is not None:
+                track_beats(total_frames - 1)
+
+            # Conservar solo lo necesario para ventana + tolerancia (memoria acotada)
+            excess = len(envelope) - 2 * window_frames
+            if excess > 0:
+                envelope = envelope[excess:]
+                envelope_start += excess
+
+        for block in blocks:
+            if block is None or len(block) == 0:
+                continue
+            total_samples += len(block)
+            pending = np.concatenate([pending, block.astype(np.float32, copy=False)])
+            if len(pending) < n_fft:
+                continue
+            n_frames = 1 + (len(pending) - n_fft) // hop_length
+            frames = librosa.util.frame(pending[:n_fft + (n_frames - 1) * hop_length],
+                                        frame_length=n_fft, hop_length=hop_length, axis=0)
+            process_frames(frames)
+            pending = pending[n_frames * hop_length:]
+
+        duration = total_samples / sr if sr else 0.0
+        print(f"[BPM STREAM] Audio procesado: {duration:.1f}s, {total_frames} frames")
+
+        if tempogram_count == 0:
+            return {"bpm": None, "error": "Audio muy corto para análisis en streaming", "confidence": 0}
+
+        global_curve = (tempogram_sum / tempogram_count) * prior
+        tempo = 60.0 * fps / refine_lag(global_curve, int(np.argmax(global_curve)))
+        print(f"[BPM STREAM] Tempo global bruto: {tempo:.1f}")
+
+        # Corrección de octava (misma regla que el analizador simple)
+        if tempo < self.min_bpm:
+            tempo *= 2
+        elif tempo > self.max_bpm:
+            tempo /= 2
+        final_tempo = max(self.min_bpm, min(self.max_bpm, tempo))
+
+        # Confianza: fracción de la curva que coincide con el tempo global (o su doble/mitad)
+        if tempo_curve:
+            curve = np.array([point["bpm"] for point in tempo_curve])
+            ratios = curve / final_tempo
+            agree = np.min(np.abs(ratios[:, None] - np.array([0.5, 1.0, 2.0])[None, :]) / np.array([0.5, 1.0, 2.0]), axis=1) < 0.04
+            confidence = float(agree.mean())
+        else:
+            confidence = 0.5
+
+        print(f"[BPM STREAM] FINAL: {final_tempo:.1f} (confianza {confidence*100:.1f}%, {len(beats)} beats)")
+
+        return {
+            "bpm": int(round(final_tempo)),
+            "confidence": confidence,
+            "details": {
+                "tempo": float(final_tempo),
+                "method": "streaming",
+                "duration": float(duration),
+                "tempo_curve": tempo_curve,
+                "beats": [round(b, 4) for b in beats],
+            }
+        }
+
+
+# Instancia global
+bpm_streaming_analyzer = StreamingBPMAnalyzer()
@@ -54,7 +54,17 @@ class ChordAnalyzer:
         try:
             # Cargar audio
             y, sr = librosa.load(audio_path, sr=22050)
+            return self.analyze_chords_from_signal(y, sr, hop_length)
             
+        except Exception as e:
+            print(f"Error analyzing chords: {e}")
+            return []
+    
+    def analyze_chords_from_signal(self, y: np.ndarray, sr: int, hop_length: int = 512) -> List[ChordInfo]:
+        """
+        Igual que analyze_chords, sobre audio mono ya decodificado
+        """
+        try:
             # Extraer características cromáticas
             chroma = librosa.feature.chroma_stft(y=y, sr=sr, hop_length=hop_length)
             
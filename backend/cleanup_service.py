@@ -1,25 +1,47 @@
 """
 Cleanup Service - Sistema de limpieza automática estilo Moises
+
+GC de B2: una canción está viva mientras exista su original
+(originals/{user_id}/{song_id}/ o la carpeta {song_id}/ de /upload), que es lo
+que /api/delete-files borra al eliminar la canción. Los derivados de canciones
+muertas (previews, stems, grids, variants, analysis) son huérfanos; los
+previews y la cache de separación (stem_cache/) además expiran por edad.
 """
 
 import asyncio
 import os
+import time
 from datetime import datetime, timedelta
 from pathlib import Path
 import tempfile
 import shutil
-from typing import List, Dict
+from typing import List, Dict, Optional, Set, Tuple
 import json
 
 from b2_storage import b2_storage
+from scratch_space import scratch_space
+
+# Prefijos que recorre el GC (en este orden; el checkpoint guarda el índice)
+GC_SWEEP_PREFIXES = ("previews/", "stems/", "grids/", "variants/", "analysis/", "stem_cache/")
+# Carpetas de primer nivel que no son canciones subidas por /upload
+GC_SYSTEM_FOLDERS = {"originals", "previews", "stems", "grids", "variants", "analysis", "stem_cache"}
 
 class CleanupService:
     def __init__(self):
-        self.temp_dir = Path(tempfile.gettempdir()) / "moises_temp"
+        self.temp_dir = scratch_space.root
         self.cleanup_interval = 3600  # 1 hora en segundos
         self.file_retention_days = 7  # Mantener archivos por 7 días
         self.is_running = False
         
+        # GC de B2
+        self.b2_gc_dry_run = os.getenv("B2_GC_DRY_RUN", "1") != "0"   # Solo reporta salvo B2_GC_DRY_RUN=0
+        self.b2_gc_grace_hours = 24         # Nunca borrar objetos más nuevos (subidas en curso)
+        self.cache_retention_days = 30      # stem_cache/ (se regenera con una separación)
+        self.b2_gc_page_size = 10000        # Máximo de b2_list_file_names
+        self.b2_gc_deletes_per_second = 50
+        self.checkpoint_dir = Path(tempfile.gettempdir()) / "moises_gc"
+        self.last_b2_gc: Optional[Dict] = None
+        
     async def start_cleanup_service(self):
         """Iniciar servicio de limpieza automática"""
         if self.is_running:
@@ -50,7 +72,7 @@ class CleanupService:
         # 1. Limpiar archivos temporales locales
         await self.cleanup_temp_files()
         
-        # 2. Limpiar archivos B2 antiguos (simulado)
+        # 2. GC de B2 (huérfanos y expirados)
         await self.cleanup_old_b2_files()
         
         # 3. Limpiar logs antiguos
@@ -59,61 +81,163 @@ class CleanupService:
         print("[OK] Limpieza completada")
     
     async def cleanup_temp_files(self):
-        """Limpiar archivos temporales locales"""
+        """Limpiar archivos temporales locales (entradas sin workspace activo, sin cambios hace más de 1 hora) y recortar las caches a la cuota"""
         try:
             if not self.temp_dir.exists():
                 return
                 
             print(f"[DELETE] Limpiando archivos temporales en: {self.temp_dir}")
             
-            files_removed = 0
-            total_size_removed = 0
+            files_removed, total_size_removed = scratch_space.sweep(max_age_seconds=3600)
             
-            for item in self.temp_dir.iterdir():
-                if item.is_file():
-                    # Verificar edad del archivo
-                    file_age = datetime.now() - datetime.fromtimestamp(item.stat().st_mtime)
-                    
-                    if file_age > timedelta(hours=1):  # Archivos más antiguos que 1 hora
-                        file_size = item.stat().st_size
-                        item.unlink()
-                        files_removed += 1
-                        total_size_removed += file_size
-                        print(f"  [DELETE] Eliminado: {item.name} ({file_size / 1024:.1f} KB)")
-                
-                elif item.is_dir():
-                    # Verificar si el directorio está vacío o es antiguo
-                    try:
-                        dir_age = datetime.now() - datetime.fromtimestamp(item.stat().st_mtime)
-                        if dir_age > timedelta(hours=2):  # Directorios más antiguos que 2 horas
-                            shutil.rmtree(item, ignore_errors=True)
-                            print(f"  [DELETE] Eliminado directorio: {item.name}")
-                    except:
-                        pass
+            # Caches locales (stems, mixdowns, slices...) de vuelta dentro de la cuota
+            cache_removed, cache_size_removed = scratch_space.trim_caches()
+            files_removed += cache_removed
+            total_size_removed += cache_size_removed
             
             if files_removed > 0:
-                print(f"[OK] Limpieza temp completada: {files_removed} archivos, {total_size_removed / 1024:.1f} KB liberados")
+                print(f"[OK] Limpieza temp completada: {files_removed} entradas, {total_size_removed / 1024:.1f} KB liberados")
             else:
                 print("[OK] No hay archivos temporales para limpiar")
                 
         except Exception as e:
             print(f"[ERROR] Error limpiando archivos temporales: {e}")
     
-    async def cleanup_old_b2_files(self):
-        """Limpiar archivos B2 antiguos (simulado)"""
+    async def cleanup_old_b2_files(self, dry_run: Optional[bool] = None) -> Dict:
+        """
+        GC de B2: recorre los prefijos derivados página a página y borra huérfanos/expirados.
+        Solo se mantiene en memoria el conjunto de canciones vivas y una página del listado;
+        el progreso queda en un checkpoint y una ejecución interrumpida continúa donde quedó.
+        """
+        dry_run = self.b2_gc_dry_run if dry_run is None else dry_run
+        checkpoint_path = self.checkpoint_dir / ("b2_gc_dry_run.json" if dry_run else "b2_gc.json")
+        checkpoint = self._load_checkpoint(checkpoint_path)
+        stats = checkpoint["stats"]
+        stats["dry_run"] = dry_run
+        
         try:
-            print("[?] Verificando archivos B2 antiguos...")
+            print(f"[GC] Iniciando GC de B2 (dry_run={dry_run})")
+            live_keys, live_song_ids = await self._live_songs()
+            if not live_keys and not live_song_ids:
+                # Un listado vacío de originales marcaría todo como huérfano
+                print("[GC] No se encontraron originales, GC abortado")
+                return stats
+            print(f"[GC] Canciones vivas: {len(live_keys)} originales, {len(live_song_ids)} carpetas de /upload")
             
-            # En una implementación real, aquí consultarías la base de datos
-            # para obtener archivos antiguos y eliminarlos de B2
-            
-            # Por ahora solo simulamos la limpieza
-            await asyncio.sleep(1)  # Simular trabajo
+            now = time.time()
+            for prefix_index in range(checkpoint["prefix_index"], len(GC_SWEEP_PREFIXES)):
+                prefix = GC_SWEEP_PREFIXES[prefix_index]
+                start_file_name = checkpoint["next_file_name"] if prefix_index == checkpoint["prefix_index"] else None
+                
+                async for page, next_file_name in b2_storage.iter_file_names(prefix, self.b2_gc_page_size, start_file_name):
+                    candidates = {}
+                    for file_info in page:
+                        stats["scanned"] += 1
+                        reason = self._gc_reason(file_info, live_keys, live_song_ids, now)
+                        if reason:
+                            candidates[file_info["fileName"]] = file_info["fileId"]
+                            stats[reason] += 1
+                            stats["bytes"] += file_info.get("contentLength", 0)
+                    
+                    if candidates and not dry_run:
+                        stats["deleted"] += await self._delete_rate_limited(candidates)
+                    elif candidates:
+                        print(f"[GC] (dry run) {len(candidates)} candidatos en {prefix}, ej: {next(iter(candidates))}")
+                    
+                    checkpoint.update(prefix_index=prefix_index, next_file_name=next_file_name)
+                    self._save_checkpoint(checkpoint_path, checkpoint)
+                
+                checkpoint.update(prefix_index=prefix_index + 1, next_file_name=None)
+                self._save_checkpoint(checkpoint_path, checkpoint)
             
-            print("[OK] Verificación B2 completada (simulado)")
+            checkpoint_path.unlink(missing_ok=True)
+            stats["finished_at"] = datetime.now().isoformat()
+            print(f"[OK] GC de B2 completado: {stats['scanned']} objetos, {stats['orphaned']} huérfanos, "
+                  f"{stats['expired']} expirados ({stats['bytes'] / 1024 / 1024:.1f} MB), {stats['deleted']} eliminados")
+            return stats
             
         except Exception as e:
-            print(f"[ERROR] Error verificando B2: {e}")
+            print(f"[ERROR] Error en GC de B2 (se retoma desde el checkpoint): {e}")
+            stats["error"] = str(e)
+            return stats
+        finally:
+            self.last_b2_gc = stats
+    
+    async def _live_songs(self) -> Tuple[Set[str], Set[str]]:
+        """Canciones con original en B2: ({user_id}/{song_id} de originals/, song_ids de carpetas de /upload)"""
+        live_keys = set()
+        async for page, _ in b2_storage.iter_file_names("originals/", self.b2_gc_page_size):
+            for file_info in page:
+                parts = file_info["fileName"].split("/")
+                if len(parts) >= 4:
+                    live_keys.add(f"{parts[1]}/{parts[2]}")
+        
+        live_song_ids = set()
+        async for page, _ in b2_storage.iter_file_names("", self.b2_gc_page_size, delimiter="/"):
+            for file_info in page:
+                folder = file_info["fileName"].rstrip("/")
+                if file_info.get("action") == "folder" and folder not in GC_SYSTEM_FOLDERS:
+                    live_song_ids.add(folder)
+        
+        return live_keys, live_song_ids
+    
+    def _gc_reason(self, file_info: Dict, live_keys: Set[str], live_song_ids: Set[str], now: float) -> Optional[str]:
+        """"orphaned", "expired" o None si el objeto se conserva"""
+        if file_info.get("action", "upload") != "upload":
+            return None
+        age_hours = (now - file_info.get("uploadTimestamp", now * 1000) / 1000) / 3600
+        if age_hours < self.b2_gc_grace_hours:
+            return None
+        
+        parts = file_info["fileName"].split("/")
+        if parts[0] == "stem_cache":
+            return "expired" if age_hours > self.cache_retention_days * 24 else None
+        
+        if parts[0] == "analysis" and len(parts) == 3:
+            user_id, song_id = parts[1], Path(parts[2]).stem
+        elif len(parts) >= 4:
+            user_id, song_id = parts[1], parts[2]
+        else:
+            return None
+        
+        if f"{user_id}/{song_id}" not in live_keys and song_id not in live_song_ids:
+            return "orphaned"
+        if parts[0] == "previews" and age_hours > self.file_retention_days * 24:
+            return "expired"
+        return None
+    
+    async def _delete_rate_limited(self, candidates: Dict[str, str]) -> int:
+        """Borrado concurrente (b2_storage.delete_files) en tandas de b2_gc_deletes_per_second por segundo"""
+        file_names = list(candidates)
+        deleted = 0
+        for i in range(0, len(file_names), self.b2_gc_deletes_per_second):
+            started = time.monotonic()
+            results = await b2_storage.delete_files(file_names[i:i + self.b2_gc_deletes_per_second], candidates)
+            deleted += sum(results.values())
+            await asyncio.sleep(max(0.0, 1.0 - (time.monotonic() - started)))
+        return deleted
+    
+    def _load_checkpoint(self, checkpoint_path: Path) -> Dict:
+        try:
+            if checkpoint_path.exists():
+                checkpoint = json.loads(checkpoint_path.read_text())
+                print(f"[GC] Retomando desde checkpoint: {GC_SWEEP_PREFIXES[checkpoint['prefix_index']]} {checkpoint['next_file_name'] or ''}")
+                return checkpoint
+        except Exception as e:
+            print(f"[GC] Checkpoint inválido, empezando de cero: {e}")
+        
+        return {
+            "prefix_index": 0,
+            "next_file_name": None,
+            "stats": {"started_at": datetime.now().isoformat(), "scanned": 0, "orphaned": 0,
+                      "expired": 0, "bytes": 0, "deleted": 0}
+        }
+    
+    def _save_checkpoint(self, checkpoint_path: Path, checkpoint: Dict):
+        self.checkpoint_dir.mkdir(exist_ok=True)
+        temp_path = checkpoint_path.with_suffix(".tmp")
+        temp_path.write_text(json.dumps(checkpoint))
+        temp_path.replace(checkpoint_path)
     
     async def cleanup_old_logs(self):
         """Limpiar logs antiguos"""
@@ -170,18 +294,16 @@ class CleanupService:
                 "temp_dir": str(self.temp_dir),
                 "temp_dir_exists": self.temp_dir.exists(),
                 "temp_files_count": 0,
-                "temp_dir_size": 0
+                "temp_dir_size": 0,
+                "b2_gc_dry_run": self.b2_gc_dry_run,
+                "last_b2_gc": self.last_b2_gc
             }
             
             if self.temp_dir.exists():
-                files = list(self.temp_dir.iterdir())
-                stats["temp_files_count"] = len(files)
-                
-                total_size = 0
-                for item in files:
-                    if item.is_file():
-                        total_size += item.stat().st_size
-                stats["temp_dir_size"] = total_size
+                scratch = scratch_space.get_stats()
+                stats["temp_files_count"] = scratch["files"]
+                stats["temp_dir_size"] = scratch["bytes"]
+                stats["scratch"] = scratch
             
             return stats
             
@@ -3,6 +3,8 @@ Generador de click track simple usando archivos de audio
 """
 
 from pydub import AudioSegment
+import numpy as np
+import soundfile as sf
 import os
 
 class ClickGeneratorSimple:
@@ -17,7 +19,8 @@ class ClickGeneratorSimple:
         click2_path: str,
         time_signature: str = "4/4",
         output_path: str = None,
-        onset_offset_seconds: float = 0.0
+        onset_offset_seconds: float = 0.0,
+        downbeat_phase: int = 0
     ) -> str:
         """
         Genera un click track usando archivos de audio, alineado con el onset de la canción
@@ -30,6 +33,7 @@ class ClickGeneratorSimple:
             time_signature: Compás (ej: "4/4", "3/4")
             output_path: Ruta donde guardar el resultado
             onset_offset_seconds: Tiempo en segundos hasta el primer ataque de la canción
+            downbeat_phase: Índice del primer beat que es downbeat (de time_signature_analyzer)
             
         Returns:
             Ruta del archivo generado
@@ -70,7 +74,8 @@ class ClickGeneratorSimple:
             # Agregar clicks DESDE EL ONSET (donde está el primer ataque de audio)
             current_time_ms = onset_offset_ms
             print(f"[CLICK] Primer click en: {onset_offset_ms}ms (coincide con primer ataque de audio)")
-            beat_number = 1
+            # El beat i es downbeat cuando (i - downbeat_phase) % beats_per_measure == 0
+            beat_number = ((-downbeat_phase) % beats_per_measure) + 1
             
             # Preparar clicks con diferentes volúmenes
             # 70% de volumen ≈ -3.5 dB
@@ -116,6 +121,75 @@ class ClickGeneratorSimple:
             traceback.print_exc()
             raise e
 
+    def render_from_beat_grid(
+        self,
+        beat_grid: np.ndarray,
+        duration_seconds: float,
+        click_path: str,
+        click2_path: str,
+        output_path: str = None
+    ) -> str:
+        """
+        Renderiza el click track directamente desde un beat grid (ver beat_grid.py)
+        
+        Cada click se coloca en el tiempo real del beat, así que sigue las variaciones
+        de tempo de la canción. Los downbeats usan click2 al 100%, el resto click al 70%.
+        La mezcla se hace en un buffer float32 preasignado (sin overlays de pydub).
+        
+        Returns:
+            Ruta del archivo generado
+        """
+        print(f"[CLICK] Renderizando click track desde beat grid: {len(beat_grid)} beats, {duration_seconds}s")
+        
+        try:
+            if not os.path.exists(click_path):
+                raise FileNotFoundError(f"Archivo click no encontrado: {click_path}")
+            if not os.path.exists(click2_path):
+                raise FileNotFoundError(f"Archivo click2 no encontrado: {click2_path}")
+            
+            click_normal, sr = sf.read(click_path, dtype='float32', always_2d=True)
+            click_accent, accent_sr = sf.read(click2_path, dtype='float32', always_2d=True)
+            if accent_sr != sr:
+                raise ValueError(f"Los clicks tienen sample rates distintos: {sr} vs {accent_sr}")
+            
+            channels = max(click_normal.shape[1], click_accent.shape[1])
+            click_normal = np.repeat(click_normal, channels // click_normal.shape[1], axis=1)
+            click_accent = np.repeat(click_accent, channels // click_accent.shape[1], axis=1)
+            
+            # 70% de volumen ≈ -3.5 dB (igual que generate_click_track)
+            click_normal = click_normal * (10 ** (-3.5 / 20))
+            
+            total_samples = int(duration_seconds * sr)
+            click_track = np.zeros((total_samples, channels), dtype=np.float32)
+            
+            positions = np.round(beat_grid[:, 0] * sr).astype(np.int64)
+            is_downbeat = beat_grid[:, 1] > 0
+            
+            for position, downbeat in zip(positions, is_downbeat):
+                if position < 0 or position >= total_samples:
+                    continue
+                sample = click_accent if downbeat else click_normal
+                end = min(position + len(sample), total_samples)
+                click_track[position:end] += sample[:end - position]
+            
+            np.clip(click_track, -1.0, 1.0, out=click_track)
+            
+            # Generar nombre de archivo si no se proporciona
+            if output_path is None:
+                import tempfile
+                output_path = os.path.join(tempfile.gettempdir(), f"click_track_grid_{len(beat_grid)}.wav")
+            
+            sf.write(output_path, click_track, sr, subtype='PCM_16')
+            print(f"[CLICK] Click track (beat grid) generado: {output_path}")
+            
+            return output_path
+            
+        except Exception as e:
+            print(f"[CLICK] Error renderizando desde beat grid: {e}")
+            import traceback
+            traceback.print_exc()
+            raise e
+
 # Instancia global
 click_generator_simple = ClickGeneratorSimple()
 
@@ -25,6 +25,14 @@ class TaskDB(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     completed_at = Column(DateTime)
 
+class B2FileDB(Base):
+    __tablename__ = "b2_files"
+    
+    file_name = Column(String, primary_key=True)  # Ruta en el bucket
+    file_id = Column(String, nullable=False)
+    size = Column(Integer)
+    uploaded_at = Column(DateTime, default=datetime.utcnow)
+
 def init_db():
     """Initialize database tables"""
     Base.metadata.create_all(bind=engine)
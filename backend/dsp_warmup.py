@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+DSP Warmup - compilación JIT de numba antes del primer request
+
+librosa compila con numba (beat tracking, onset/peak picking, chroma,
+filtros) la primera vez que se llama cada función en un proceso: el primer
+análisis de una instancia fría es varias veces más lento que los siguientes.
+
+- NUMBA_CACHE_DIR apunta a un directorio persistente y escribible (en la
+  imagen: /app/.numba_cache, poblado en el build con `python dsp_warmup.py`),
+  así los procesos nuevos cargan los kernels compilados desde disco
+- warm_up() corre los análisis reales del pipeline (BPM, onset, tonalidad,
+  compás, acordes) sobre un buffer sintético de pocos segundos
+- init_worker() es el initializer de los ProcessPoolExecutor de análisis y
+  el lifespan de la API lo corre en segundo plano (DSP_WARMUP=0 lo desactiva)
+
+Este módulo debe importarse antes que librosa/numba: numba lee
+NUMBA_CACHE_DIR una sola vez, al importarse.
+"""
+
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Dict
+
+DEFAULT_CACHE_DIR = Path(__file__).resolve().parent.parent / ".numba_cache"
+os.environ.setdefault("NUMBA_CACHE_DIR", str(DEFAULT_CACHE_DIR))
+
+WARMUP_SR = 22050
+_warmed_up = False
+_warmup_lock = threading.Lock()
+
+
+def warmup_enabled() -> bool:
+    return os.getenv("DSP_WARMUP", "1") != "0"
+
+
+def synthetic_buffer(sr: int = WARMUP_SR, seconds: float = 8.0, bpm: float = 120.0):
+    """Click a 120 BPM con acento cada 4 tiempos sobre un acorde de La mayor"""
+    import numpy as np
+
+    t = np.arange(int(sr * seconds)) / sr
+    y = sum(0.1 * np.sin(2 * np.pi * freq * t) for freq in (220.0, 277.18, 329.63))
+    click = np.exp(-np.linspace(0, 40, int(0.03 * sr)))
+    for beat, start in enumerate(np.arange(0, seconds, 60.0 / bpm)):
+        i = int(start * sr)
+        segment = y[i:i + len(click)]
+        segment += click[:len(segment)] * (0.9 if beat % 4 == 0 else 0.5)
+    return y.astype(np.float32)
+
+
+def _steps(y, sr):
+    """Los mismos análisis que corre el pipeline, en el orden en que se usan"""
+    import librosa
+    from bpm_analyzer_simple import bpm_analyzer_simple
+    from bpm_streaming import bpm_streaming_analyzer
+    from chord_analyzer import ChordAnalyzer
+    from key_analyzer_simple import key_analyzer_simple
+    import time_signature_analyzer
+
+    def key():
+        backend = key_analyzer_simple.chroma_backend
+        target_sr = key_analyzer_simple.BACKEND_PARAMS[backend][0]
+        clip = librosa.resample(y, orig_sr=sr, target_sr=target_sr) if target_sr != sr else y
+        key_analyzer_simple.estimate_key(key_analyzer_simple.compute_chroma(clip, target_sr, backend))
+
+    return [
+        ("bpm", lambda: bpm_analyzer_simple._analyze_clip(y, sr)),
+        ("bpm_stream", lambda: bpm_streaming_analyzer.analyze_blocks(iter([y]), sr)),
+        ("onset", lambda: librosa.onset.onset_detect(y=y, sr=sr, backtrack=True)),
+        ("key", key),
+        ("time_signature", lambda: time_signature_analyzer.analyze_time_signature(y=y, sr=sr, return_grid=True)),
+        ("chords", lambda: ChordAnalyzer().analyze_chords_from_signal(y, sr)),
+    ]
+
+
+def warm_up(verbose: bool = True) -> Dict[str, float]:
+    """Compila (o carga de NUMBA_CACHE_DIR) los kernels de librosa; una sola vez por proceso"""
+    global _warmed_up
+    # Corre en un thread del executor: el lock evita dos warm-ups a la vez
+    with _warmup_lock:
+        if _warmed_up:
+            return {}
+
+        started = time.perf_counter()
+        timings = {}
+        y = synthetic_buffer()
+        # Los analizadores loguean sus resultados (sobre el buffer sintético): quedan entre estas dos líneas
+        print("[WARMUP] Iniciando warm-up de DSP (los logs de análisis siguientes son del buffer sintético)")
+        for name, step in _steps(y, WARMUP_SR):
+            step_started = time.perf_counter()
+            try:
+                step()
+                timings[name] = time.perf_counter() - step_started
+            except Exception as e:
+                print(f"[WARMUP] Error en {name}: {e}")
+        _warmed_up = True
+
+    total = time.perf_counter() - started
+    if verbose:
+        detail = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in timings.items())
+        print(f"[WARMUP] DSP listo en {total:.2f}s ({detail}) - cache: {os.environ['NUMBA_CACHE_DIR']}")
+    else:
+        print(f"[WARMUP] Worker {os.getpid()} listo en {total:.2f}s")
+    return timings
+
+
+def init_worker():
+    """Initializer de ProcessPoolExecutor: el worker llega compilado a su primer trabajo"""
+    if warmup_enabled():
+        warm_up(verbose=False)
+
+
+if __name__ == "__main__":
+    # Build de la imagen: poblar NUMBA_CACHE_DIR para que las instancias nuevas no compilen
+    cache_dir = Path(os.environ["NUMBA_CACHE_DIR"])
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    warm_up()
+    kernels = sum(1 for _ in cache_dir.rglob("*.nbc"))
+    print(f"[WARMUP] {kernels} kernels compilados en {cache_dir}")
+    sys.exit(0 if kernels else 1)
@@ -0,0 +1,121 @@
+"""
+Extended Stems - tracks adicionales (piano, guitar, strings, brass, percussion, synth)
+a partir de una sola descomposición espectral compartida
+
+- Un solo STFT y un solo HPSS (máscaras suaves) para todos los tracks
+- Cada track es una máscara sobre ese espectrograma: componente armónica o
+  percusiva multiplicada por una banda de frecuencias con bordes suaves
+- Las ISTFT de cada track corren en paralelo en un ThreadPoolExecutor
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import librosa
+import numpy as np
+import soundfile as sf
+
+# Track -> (componente del HPSS, frecuencia mínima Hz, frecuencia máxima Hz)
+EXTENDED_TRACKS = {
+    "piano": ("harmonic", 80, 4000),
+    "guitar": ("harmonic", 80, 1200),
+    "strings": ("harmonic", 200, 3500),
+    "brass": ("harmonic", 150, 1500),
+    "percussion": ("percussive", 0, None),
+    "synth": ("harmonic", 1000, 8000),
+}
+
+
+class ExtendedStemsEngine:
+    def __init__(self):
+        self.n_fft = 2048
+        self.hop_length = 512
+        self.edge_octaves = 0.25    # Ancho de la transición suave de cada banda
+        self.max_workers = min(len(EXTENDED_TRACKS), os.cpu_count() or 2)
+
+    def band_mask(self, sr: int, low_hz: float, high_hz: Optional[float]) -> np.ndarray:
+        """Máscara por bin de frecuencia con bordes de coseno elevado (en octavas)"""
+        freqs = librosa.fft_frequencies(sr=sr, n_fft=self.n_fft)
+        octaves = np.log2(np.maximum(freqs, 1.0))
+        mask = np.ones_like(freqs, dtype=np.float32)
+
+        if low_hz:
+            edge = (octaves - np.log2(low_hz)) / self.edge_octaves + 0.5
+            mask *= 0.5 - 0.5 * np.cos(np.pi * np.clip(edge, 0.0, 1.0))
+        if high_hz and high_hz < sr / 2:
+            edge = (np.log2(high_hz) - octaves) / self.edge_octaves + 0.5
+            mask *= 0.5 - 0.5 * np.cos(np.pi * np.clip(edge, 0.0, 1.0))
+        return mask.astype(np.float32)
+
+    def separate(
+        self,
+        audio: np.ndarray,
+        sr: int,
+        output_dir: Path,
+        tracks: Optional[List[str]] = None
+    ) -> Dict[str, str]:
+        """
+        Genera los tracks extendidos pedidos
+
+        Args:
+            audio: Audio mono (n,) o multicanal (canales, n)
+            sr: Sample rate
+            output_dir: Directorio de salida ({track}.wav)
+            tracks: Tracks a generar (por defecto todos los de EXTENDED_TRACKS)
+
+        Returns:
+            {track: ruta del WAV}
+        """
+        tracks = [t for t in (tracks or EXTENDED_TRACKS) if t in EXTENDED_TRACKS]
+        if not tracks:
+            return {}
+
+        output_dir = Path(output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        audio = np.asarray(audio, dtype=np.float32)
+        length = audio.shape[-1]
+
+        # 1. Un solo STFT (todos los canales)
+        stft = librosa.stft(audio, n_fft=self.n_fft, hop_length=self.hop_length)
+
+        # 2. Un solo HPSS sobre la magnitud (promedio de canales), como máscaras suaves
+        magnitude = np.abs(stft) if stft.ndim == 2 else np.abs(stft).mean(axis=0)
+        harmonic_mask, percussive_mask = librosa.decompose.hpss(magnitude, mask=True)
+        components = {
+            "harmonic": harmonic_mask.astype(np.float32),
+            "percussive": percussive_mask.astype(np.float32),
+        }
+        del magnitude
+
+        # 3. Máscara de cada track + ISTFT en paralelo
+        def render(track: str) -> str:
+            component, low_hz, high_hz = EXTENDED_TRACKS[track]
+            mask = components[component] * self.band_mask(sr, low_hz, high_hz)[:, np.newaxis]
+            y = librosa.istft(stft * mask, hop_length=self.hop_length, length=length)
+
+            output_path = output_dir / f"{track}.wav"
+            sf.write(str(output_path), y.T, sr)
+            return str(output_path)
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(tracks))) as pool:
+            paths = list(pool.map(render, tracks))
+
+        return dict(zip(tracks, paths))
+
+    def separate_file(
+        self,
+        file_path: str,
+        output_dir: Path,
+        tracks: Optional[List[str]] = None,
+        sr: Optional[int] = None,
+        mono: bool = False
+    ) -> Dict[str, str]:
+        """Carga el audio (sample rate nativo por defecto) y genera los tracks extendidos"""
+        audio, sr = librosa.load(file_path, sr=sr, mono=mono)
+        return self.separate(audio, sr, output_dir, tracks)
+
+
+# Global instance
+extended_stems_engine = ExtendedStemsEngine()
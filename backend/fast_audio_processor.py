@@ -6,11 +6,13 @@ import os
 import asyncio
 import shutil
 from pathlib import Path
-from typing import Dict
+from typing import Dict, List, Optional
 import librosa
 import soundfile as sf
 import numpy as np
 
+from extended_stems import extended_stems_engine
+
 class FastAudioProcessor:
     def __init__(self):
         pass
@@ -92,7 +94,8 @@ class FastAudioProcessor:
             all_stems = await self.separate_with_demucs(file_path)
             
             # Create additional tracks
-            extended_stems = await self.create_extended_tracks(file_path, all_stems)
+            requested = [name for name, enabled in tracks.items() if enabled]
+            extended_stems = await self.create_extended_tracks(file_path, all_stems, requested)
             
             # Filter based on requested tracks
             filtered_stems = {}
@@ -106,26 +109,22 @@ class FastAudioProcessor:
             print(f"Error in custom track separation: {e}")
             raise
     
-    async def create_extended_tracks(self, file_path: str, basic_stems: Dict[str, str]) -> Dict[str, str]:
-        """Create additional tracks using fast processing"""
+    async def create_extended_tracks(self, file_path: str, basic_stems: Dict[str, str], requested_tracks: Optional[List[str]] = None) -> Dict[str, str]:
+        """Create additional tracks from one shared STFT/HPSS decomposition"""
         try:
             extended_stems = basic_stems.copy()
             output_dir = Path(file_path).parent / "extended_tracks"
             output_dir.mkdir(exist_ok=True)
             
-            # Load the original audio
-            audio, sr = librosa.load(file_path, sr=22050)
-            
-            # Create additional tracks quickly
-            additional_tracks = {
-                "piano": self.extract_piano_fast(audio, sr, output_dir),
-                "guitar": self.extract_guitar_fast(audio, sr, output_dir),
-                "strings": self.extract_strings_fast(audio, sr, output_dir),
-                "brass": self.extract_brass_fast(audio, sr, output_dir),
-                "percussion": self.extract_percussion_fast(audio, sr, output_dir),
-                "synth": self.extract_synth_fast(audio, sr, output_dir),
-                "instrumental": self.create_instrumental_fast(basic_stems, output_dir)
-            }
+            # One fast analysis (mono, 22050 Hz) for all extended tracks
+            loop = asyncio.get_event_loop()
+            additional_tracks = await loop.run_in_executor(
+                None,
+                lambda: extended_stems_engine.separate_file(
+                    file_path, output_dir, requested_tracks, sr=22050, mono=True
+                )
+            )
+            additional_tracks["instrumental"] = self.create_instrumental_fast(basic_stems, output_dir)
             
             # Add valid tracks
             for track_name, track_path in additional_tracks.items():
@@ -139,67 +138,6 @@ class FastAudioProcessor:
             print(f"Error creating extended tracks: {e}")
             return basic_stems
     
-    def extract_piano_fast(self, audio: np.ndarray, sr: int, output_dir: Path) -> str:
-        """Extract piano using fast processing"""
-        try:
-            y_harmonic, _ = librosa.effects.hpss(audio)
-            piano = librosa.effects.preemphasis(y_harmonic)
-            output_path = output_dir / "piano.wav"
-            sf.write(str(output_path), piano, sr)
-            return str(output_path)
-        except:
-            return None
-    
-    def extract_guitar_fast(self, audio: np.ndarray, sr: int, output_dir: Path) -> str:
-        """Extract guitar using fast processing"""
-        try:
-            guitar = librosa.effects.preemphasis(audio)
-            output_path = output_dir / "guitar.wav"
-            sf.write(str(output_path), guitar, sr)
-            return str(output_path)
-        except:
-            return None
-    
-    def extract_strings_fast(self, audio: np.ndarray, sr: int, output_dir: Path) -> str:
-        """Extract strings using fast processing"""
-        try:
-            strings = librosa.effects.preemphasis(audio)
-            output_path = output_dir / "strings.wav"
-            sf.write(str(output_path), strings, sr)
-            return str(output_path)
-        except:
-            return None
-    
-    def extract_brass_fast(self, audio: np.ndarray, sr: int, output_dir: Path) -> str:
-        """Extract brass using fast processing"""
-        try:
-            brass = librosa.effects.preemphasis(audio)
-            output_path = output_dir / "brass.wav"
-            sf.write(str(output_path), brass, sr)
-            return str(output_path)
-        except:
-            return None
-    
-    def extract_percussion_fast(self, audio: np.ndarray, sr: int, output_dir: Path) -> str:
-        """Extract percussion using fast processing"""
-        try:
-            _, y_percussive = librosa.effects.hpss(audio)
-            output_path = output_dir / "percussion.wav"
-            sf.write(str(output_path), y_percussive, sr)
-            return str(output_path)
-        except:
-            return None
-    
-    def extract_synth_fast(self, audio: np.ndarray, sr: int, output_dir: Path) -> str:
-        """Extract synth using fast processing"""
-        try:
-            synth = librosa.effects.preemphasis(audio)
-            output_path = output_dir / "synth.wav"
-            sf.write(str(output_path), synth, sr)
-            return str(output_path)
-        except:
-            return None
-    
     def create_instrumental_fast(self, basic_stems: Dict[str, str], output_dir: Path) -> str:
         """Create instrumental track"""
         try:
@@ -3,6 +3,7 @@ Analizador de tonalidad (Key) usando librosa
 Algoritmo basado en Krumhansl-Schmuckler
 """
 
+import os
 import librosa
 import numpy as np
 from collections import Counter
@@ -14,90 +15,172 @@ class KeyAnalyzerSimple:
     
     KEYS = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
     
-    def __init__(self):
-        pass
+    # Backends de chroma disponibles:
+    # - cqt: chroma_cqt con 36 bins por octava (original, el más caro)
+    # - stft: STFT + matriz de filtros chroma precalculada y cacheada
+    # - lite: igual que stft pero sobre audio a 11025 Hz con FFT más pequeña
+    CHROMA_BACKENDS = ('cqt', 'stft', 'lite')
     
-    def analyze_key_from_file(self, audio_path: str) -> dict:
+    # Parámetros por backend: (sample rate, n_fft, hop_length)
+    BACKEND_PARAMS = {
+        'cqt': (22050, None, 512),
+        'stft': (22050, 4096, 2048),
+        'lite': (11025, 2048, 1024),
+    }
+    
+    def __init__(self, chroma_backend: str = None):
+        backend = chroma_backend or os.getenv("KEY_CHROMA_BACKEND", "cqt")
+        if backend not in self.CHROMA_BACKENDS:
+            print(f"[KEY] Backend de chroma desconocido '{backend}', usando 'cqt'")
+            backend = 'cqt'
+        self.chroma_backend = backend
+        # Cache de matrices de filtros chroma por (sr, n_fft)
+        self._chroma_filters = {}
+        # Perfiles rotados y normalizados (24 tonalidades x 12 notas)
+        self._key_profiles, self._key_labels = self._build_key_profiles()
+    
+    def _build_key_profiles(self):
+        """Precalcula los 24 perfiles rotados (12 mayores + 12 menores)"""
+        profiles = []
+        labels = []
+        for scale, profile in (('major', self.MAJOR_PROFILE), ('minor', self.MINOR_PROFILE)):
+            for i in range(12):
+                rotated_profile = np.roll(profile, i)
+                profiles.append(rotated_profile / np.sum(rotated_profile))
+                labels.append((self.KEYS[i], scale))
+        return np.array(profiles), labels
+    
+    def _get_chroma_filter(self, sr: int, n_fft: int) -> np.ndarray:
+        """Matriz de filtros chroma (12 x bins) cacheada por (sr, n_fft)"""
+        cache_key = (sr, n_fft)
+        chroma_filter = self._chroma_filters.get(cache_key)
+        if chroma_filter is None:
+            chroma_filter = librosa.filters.chroma(sr=sr, n_fft=n_fft).astype(np.float32)
+            self._chroma_filters[cache_key] = chroma_filter
+        return chroma_filter
+    
+    def compute_chroma(self, y: np.ndarray, sr: int, backend: str = None) -> np.ndarray:
+        """
+        Calcula el chromagrama con el backend indicado
+        
+        Args:
+            y: Señal mono
+            sr: Sample rate de la señal (debe coincidir con BACKEND_PARAMS)
+            backend: 'cqt', 'stft' o 'lite' (por defecto el de la instancia)
+            
+        Returns:
+            Matriz chroma de 12 x frames
+        """
+        backend = backend or self.chroma_backend
+        _, n_fft, hop_length = self.BACKEND_PARAMS[backend]
+        
+        if backend == 'cqt':
+            return librosa.feature.chroma_cqt(y=y, sr=sr, bins_per_octave=12*3, hop_length=hop_length)
+        
+        # STFT de magnitud al cuadrado proyectada con la matriz de filtros cacheada
+        spectrum = np.abs(librosa.stft(y, n_fft=n_fft, hop_length=hop_length, dtype=np.complex64)) ** 2
+        chroma = self._get_chroma_filter(sr, n_fft) @ spectrum
+        return librosa.util.normalize(chroma, norm=np.inf, axis=0)
+    
+    def estimate_key(self, chroma: np.ndarray) -> dict:
+        """
+        Estima la tonalidad correlacionando el perfil de pitch con los 24 perfiles K-S
+        """
+        # Promediar en el tiempo para obtener un perfil de pitch
+        chroma_mean = np.mean(chroma, axis=1)
+        
+        # Normalizar
+        if np.sum(chroma_mean) > 0:
+            chroma_mean = chroma_mean / np.sum(chroma_mean)
+        
+        print(f"[KEY] Chroma calculado, perfil: {chroma_mean[:6]}")
+        
+        # Correlación de Pearson contra todas las tonalidades a la vez
+        centered_chroma = chroma_mean - chroma_mean.mean()
+        centered_profiles = self._key_profiles - self._key_profiles.mean(axis=1, keepdims=True)
+        denominator = np.linalg.norm(centered_profiles, axis=1) * np.linalg.norm(centered_chroma)
+        if denominator.min() == 0:
+            correlations = np.zeros(len(self._key_labels))
+        else:
+            correlations = centered_profiles @ centered_chroma / denominator
+        
+        best_index = int(np.argmax(correlations))
+        max_correlation = float(correlations[best_index])
+        best_key, best_scale = self._key_labels[best_index]
+        
+        # Convertir correlación a confianza (0-1)
+        confidence = (max_correlation + 1) / 2  # Mapear de [-1, 1] a [0, 1]
+        
+        # Formato final
+        key_str = f"{best_key} {'Major' if best_scale == 'major' else 'Minor'}"
+        
+        return {
+            'key': best_key,
+            'scale': best_scale,
+            'key_string': key_str,
+            'confidence': float(confidence)
+        }
+    
+    def analyze_key_from_file(self, audio_path: str, backend: str = None) -> dict:
         """
         Analiza la tonalidad de un archivo de audio
         
         Args:
             audio_path: Ruta al archivo de audio
+            backend: Backend de chroma ('cqt', 'stft', 'lite'); por defecto el de la instancia
             
         Returns:
             dict con key, scale (major/minor) y confidence
         """
-        print(f"[KEY] Analizando tonalidad: {audio_path}")
+        backend = backend or self.chroma_backend
+        print(f"[KEY] Analizando tonalidad: {audio_path} (backend: {backend})")
         
         try:
-            # Cargar audio
-            y, sr = librosa.load(audio_path, duration=30, sr=22050)
+            # Cargar audio directamente al sample rate del backend
+            target_sr = self.BACKEND_PARAMS[backend][0]
+            y, sr = librosa.load(audio_path, duration=30, sr=target_sr)
             print(f"[KEY] Audio cargado: {len(y)/sr:.1f}s, SR: {sr}")
             
             # Extraer chroma (representación de las 12 notas)
-            chroma = librosa.feature.chroma_cqt(y=y, sr=sr, bins_per_octave=12*3)
-            
-            # Promediar en el tiempo para obtener un perfil de pitch
-            chroma_mean = np.mean(chroma, axis=1)
+            chroma = self.compute_chroma(y, sr, backend)
             
-            # Normalizar
-            if np.sum(chroma_mean) > 0:
-                chroma_mean = chroma_mean / np.sum(chroma_mean)
+            result = self.estimate_key(chroma)
+            result['backend'] = backend
             
-            print(f"[KEY] Chroma calculado, perfil: {chroma_mean[:6]}")
+            print(f"[KEY] Resultado: {result['key_string']}, Confianza: {result['confidence']*100:.1f}%")
             
-            # Probar todas las tonalidades (12 mayores + 12 menores)
-            max_correlation = -1
-            best_key = None
-            best_scale = None
-            
-            # Probar tonalidades mayores
-            for i in range(12):
-                # Rotar el perfil mayor
-                rotated_profile = np.roll(self.MAJOR_PROFILE, i)
-                # Normalizar
-                rotated_profile = rotated_profile / np.sum(rotated_profile)
-                # Calcular correlación
-                correlation = np.corrcoef(chroma_mean, rotated_profile)[0, 1]
-                
-                if correlation > max_correlation:
-                    max_correlation = correlation
-                    best_key = self.KEYS[i]
-                    best_scale = 'major'
-            
-            # Probar tonalidades menores
-            for i in range(12):
-                # Rotar el perfil menor
-                rotated_profile = np.roll(self.MINOR_PROFILE, i)
-                # Normalizar
-                rotated_profile = rotated_profile / np.sum(rotated_profile)
-                # Calcular correlación
-                correlation = np.corrcoef(chroma_mean, rotated_profile)[0, 1]
-                
-                if correlation > max_correlation:
-                    max_correlation = correlation
-                    best_key = self.KEYS[i]
-                    best_scale = 'minor'
-            
-            # Convertir correlación a confianza (0-1)
-            confidence = (max_correlation + 1) / 2  # Mapear de [-1, 1] a [0, 1]
-            
-            # Formato final
-            key_str = f"{best_key} {'Major' if best_scale == 'major' else 'Minor'}"
-            
-            print(f"[KEY] Resultado: {key_str}, Confianza: {confidence*100:.1f}%")
+            return result
             
+        except Exception as e:
+            print(f"[KEY] Error: {e}")
+            import traceback
+            traceback.print_exc()
             return {
-                'key': best_key,
-                'scale': best_scale,
-                'key_string': key_str,
-                'confidence': float(confidence)
+                'key': None,
+                'scale': None,
+                'key_string': 'Unknown',
+                'confidence': 0.0,
+                'error': str(e)
             }
+
+    def analyze_key_from_pcm(self, pcm, backend: str = None) -> dict:
+        """
+        Igual que analyze_key_from_file, a partir del PCMBuffer ya decodificado
+        (primeros 30 segundos al sample rate del backend)
+        """
+        backend = backend or self.chroma_backend
+        try:
+            sr = self.BACKEND_PARAMS[backend][0]
+            y = pcm.mono(sr)[:30 * sr]
+            
+            result = self.estimate_key(self.compute_chroma(y, sr, backend))
+            result['backend'] = backend
+            
+            print(f"[KEY] Resultado: {result['key_string']}, Confianza: {result['confidence']*100:.1f}%")
+            return result
             
         except Exception as e:
             print(f"[KEY] Error: {e}")
-            import traceback
-            traceback.print_exc()
             return {
                 'key': None,
                 'scale': None,
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark de precisión/velocidad de los backends de chroma de KeyAnalyzerSimple
+
+Uso:
+    python key_benchmark.py fixtures/keys [--backends cqt,stft,lite] [--tolerance 0.05]
+
+El directorio de fixtures debe contener los audios y un archivo labels.json
+con la tonalidad esperada de cada archivo:
+
+    {"song1.mp3": "E Major", "song2.wav": "F# Minor"}
+
+Para cada backend se reporta la precisión exacta, el score ponderado estilo
+MIREX (quinta = 0.5, relativa = 0.3, paralela = 0.2) y el tiempo medio por
+archivo. Se recomienda el backend más rápido cuyo score ponderado no caiga
+más de --tolerance respecto al mejor.
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+from key_analyzer_simple import KeyAnalyzerSimple
+
+
+def parse_key_label(label: str):
+    """Convierte 'E Major' / 'F# minor' en (índice de nota, escala)"""
+    parts = label.strip().split()
+    if len(parts) != 2:
+        raise ValueError(f"Etiqueta de tonalidad inválida: {label}")
+    note, scale = parts[0], parts[1].lower()
+    if scale not in ('major', 'minor'):
+        raise ValueError(f"Escala inválida en etiqueta: {label}")
+    return KeyAnalyzerSimple.KEYS.index(note), scale
+
+
+def weighted_key_score(expected, detected) -> float:
+    """Score ponderado estilo MIREX entre tonalidad esperada y detectada"""
+    (ref_root, ref_scale), (est_root, est_scale) = expected, detected
+    interval = (est_root - ref_root) % 12
+
+    if est_scale == ref_scale:
+        if interval == 0:
+            return 1.0
+        if interval in (5, 7):
+            return 0.5
+        return 0.0
+
+    # Relativa: C Major <-> A Minor
+    if ref_scale == 'major' and interval == 9:
+        return 0.3
+    if ref_scale == 'minor' and interval == 3:
+        return 0.3
+    # Paralela: C Major <-> C Minor
+    if interval == 0:
+        return 0.2
+    return 0.0
+
+
+def run_benchmark(fixtures_dir: Path, backends, tolerance: float) -> dict:
+    labels_path = fixtures_dir / "labels.json"
+    if not labels_path.exists():
+        raise FileNotFoundError(f"No se encontró {labels_path}")
+
+    with open(labels_path, 'r', encoding='utf-8') as f:
+        labels = json.load(f)
+
+    analyzer = KeyAnalyzerSimple()
+    results = {}
+
+    for backend in backends:
+        exact = 0
+        weighted = 0.0
+        elapsed = []
+
+        for filename, label in labels.items():
+            audio_path = fixtures_dir / filename
+            if not audio_path.exists():
+                print(f"[BENCH] Falta fixture: {audio_path}")
+                continue
+
+            expected = parse_key_label(label)
+            start = time.perf_counter()
+            result = analyzer.analyze_key_from_file(str(audio_path), backend=backend)
+            elapsed.append(time.perf_counter() - start)
+
+            if not result.get('key'):
+                continue
+
+            detected = (KeyAnalyzerSimple.KEYS.index(result['key']), result['scale'])
+            score = weighted_key_score(expected, detected)
+            weighted += score
+            exact += 1 if score == 1.0 else 0
+
+        count = len(elapsed)
+        results[backend] = {
+            "files": count,
+            "accuracy": exact / count if count else 0.0,
+            "weighted_score": weighted / count if count else 0.0,
+            "mean_seconds": sum(elapsed) / count if count else 0.0,
+        }
+
+    # Elegir el backend más rápido dentro de la tolerancia del mejor score
+    best_score = max((r["weighted_score"] for r in results.values()), default=0.0)
+    candidates = [
+        name for name, r in results.items()
+        if r["files"] and r["weighted_score"] >= best_score - tolerance
+    ]
+    recommended = min(candidates, key=lambda name: results[name]["mean_seconds"]) if candidates else None
+
+    return {"backends": results, "recommended": recommended, "tolerance": tolerance}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de backends de chroma para detección de tonalidad")
+    parser.add_argument("fixtures_dir", help="Directorio con audios y labels.json")
+    parser.add_argument("--backends", default=",".join(KeyAnalyzerSimple.CHROMA_BACKENDS))
+    parser.add_argument("--tolerance", type=float, default=0.05,
+                        help="Pérdida máxima de score ponderado aceptable frente al mejor backend")
+    args = parser.parse_args()
+
+    backends = [b.strip() for b in args.backends.split(",") if b.strip()]
+    unknown = [b for b in backends if b not in KeyAnalyzerSimple.CHROMA_BACKENDS]
+    if unknown:
+        print(f"Backends desconocidos: {unknown}")
+        return 1
+
+    report = run_benchmark(Path(args.fixtures_dir), backends, args.tolerance)
+
+    print("\n" + "="*60)
+    print(f"{'Backend':<8} {'Files':>6} {'Exact':>8} {'Weighted':>10} {'Seg/archivo':>12}")
+    for name, r in report["backends"].items():
+        print(f"{name:<8} {r['files']:>6} {r['accuracy']*100:>7.1f}% {r['weighted_score']*100:>9.1f}% {r['mean_seconds']:>12.3f}")
+    print("="*60)
+    print(f"Recomendado (tolerancia {report['tolerance']*100:.1f}%): {report['recommended']}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,70 @@
+"""
+Lazy Imports - módulos de DSP importados en el primer uso
+
+Los analizadores y procesadores importan librosa (numba, scipy), pydub,
+soundfile y torch al cargarse. Si main.py los importa arriba, cada cold start
+de Cloud Run paga esos segundos antes de que /api/health responda. Con
+lazy_import la app arranca con lo que cuesta FastAPI y cada módulo pesado se
+importa la primera vez que un endpoint lo usa:
+
+    moises_processor = lazy_import("moises_style_processor", "moises_processor")
+    moises_processor.separate_audio_moises_style(...)   # aquí se importa
+
+Verificar el presupuesto de arranque con startup_check.py.
+"""
+
+import importlib
+import threading
+from typing import Any, Optional
+
+_MISSING = object()
+_import_lock = threading.RLock()
+
+
+class LazyObject:
+    """Proxy de un módulo (o de un atributo de módulo) que se importa en el primer acceso"""
+
+    def __init__(self, module_name: str, attr: Optional[str] = None):
+        self._module_name = module_name
+        self._attr = attr
+        self._target = _MISSING
+
+    def _resolve(self) -> Any:
+        if self._target is _MISSING:
+            # Puede resolverse a la vez desde el event loop y desde threads del executor
+            with _import_lock:
+                if self._target is _MISSING:
+                    module = importlib.import_module(self._module_name)
+                    self._target = getattr(module, self._attr) if self._attr else module
+        return self._target
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._target is not _MISSING
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._resolve(), name)
+
+    def __call__(self, *args, **kwargs):
+        return self._resolve()(*args, **kwargs)
+
+    def __getitem__(self, key):
+        return self._resolve()[key]
+
+    def __contains__(self, key) -> bool:
+        return key in self._resolve()
+
+    def __iter__(self):
+        return iter(self._resolve())
+
+    def __len__(self) -> int:
+        return len(self._resolve())
+
+    def __repr__(self) -> str:
+        target = f"{self._module_name}.{self._attr}" if self._attr else self._module_name
+        return f"<lazy {target}{'' if self.is_loaded else ' (no importado)'}>"
+
+
+def lazy_import(module_name: str, attr: Optional[str] = None) -> Any:
+    """Módulo o atributo de módulo que se importa en el primer uso"""
+    return LazyObject(module_name, attr)
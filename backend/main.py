@@ -8,26 +8,46 @@ import uuid
 import asyncio
 import subprocess
 from pathlib import Path
+from contextlib import asynccontextmanager
+from datetime import datetime
 from typing import List, Optional, Dict
 import json
+import hashlib
 
 # Configurar encoding para Windows
 if sys.platform == "win32":
     sys.stdout.reconfigure(encoding='utf-8')
     sys.stderr.reconfigure(encoding='utf-8')
 
-from smart_audio_processor import audio_processor
-from chord_analyzer import ChordAnalyzer
-from models import ProcessingTask, TaskStatus
-from database import get_db, init_db
+from models import ProcessingTask, TaskStatus, SongAnalysis, MixdownRequest, VariantRequest, BatchAnalysisRequest
 from b2_storage import b2_storage
-from moises_style_processor import moises_processor
-# from bpm_analyzer import bpm_analyzer  # Temporalmente deshabilitado por problemas de encoding
-from bpm_analyzer_simple import bpm_analyzer_simple
-from key_analyzer_simple import key_analyzer_simple
-from click_generator_simple import click_generator_simple
-import time_signature_analyzer
-import tempfile
+from analysis_store import analysis_store
+from single_flight import analysis_flight, normalize_url, raise_for_error
+from audio_fetch import audio_fetcher
+from scratch_space import scratch_space, ScratchSpaceFull
+import dsp_warmup   # Fija NUMBA_CACHE_DIR antes de que algo importe numba
+from lazy_imports import lazy_import
+
+# Módulos de DSP (librosa/numba/scipy, pydub, soundfile, torch): se importan en el primer uso
+# para que el cold start no los pague antes de que /api/health responda
+audio_processor = lazy_import("smart_audio_processor", "audio_processor")
+ChordAnalyzer = lazy_import("chord_analyzer", "ChordAnalyzer")
+moises_processor = lazy_import("moises_style_processor", "moises_processor")
+bpm_analyzer = lazy_import("bpm_analyzer", "bpm_analyzer")
+bpm_analyzer_simple = lazy_import("bpm_analyzer_simple", "bpm_analyzer_simple")
+key_analyzer_simple = lazy_import("key_analyzer_simple", "key_analyzer_simple")
+click_generator_simple = lazy_import("click_generator_simple", "click_generator_simple")
+time_signature_analyzer = lazy_import("time_signature_analyzer")
+beat_grid_store = lazy_import("beat_grid", "beat_grid_store")
+grid_to_dict = lazy_import("beat_grid_format", "grid_to_dict")
+mixdown_renderer = lazy_import("mixdown", "mixdown_renderer")
+MIX_FORMATS = lazy_import("mixdown", "MIX_FORMATS")
+validate_stem_ref = lazy_import("stem_cache", "validate_stem_ref")
+tempo_pitch_renderer = lazy_import("tempo_pitch_renderer", "tempo_pitch_renderer")
+wav_slicer = lazy_import("wav_slicer", "wav_slicer")
+media_probe = lazy_import("media_probe", "media_probe")
+format_duration = lazy_import("media_probe", "format_duration")
+batch_analyzer = lazy_import("batch_analysis", "batch_analyzer")
 import uuid
 
 # In-memory task storage
@@ -35,10 +55,20 @@ tasks_storage = {}
 # Store active processes for cancellation
 active_processes = {}
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Recursos compartidos por proceso: warm-up de DSP y cierre del cliente HTTP de descargas"""
+    if dsp_warmup.warmup_enabled():
+        # En segundo plano: /api/health responde sin esperar a librosa/numba
+        asyncio.get_event_loop().run_in_executor(None, dsp_warmup.warm_up)
+    yield
+    await audio_fetcher.close()
+
 app = FastAPI(
     title="Moises Clone API",
     description="AI-powered audio separation service",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS middleware
@@ -57,6 +87,7 @@ app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
 # Temporalmente deshabilitado - causa problemas al iniciar
 # @app.on_event("startup")
 # async def startup_event():
+#     from database import init_db
 #     init_db()
 #     # await b2_storage.initialize()  # Temporalmente deshabilitado - inicializa lazy
 
@@ -110,37 +141,45 @@ async def serve_audio_file(path: str):
         print(f"Error serving audio file {path}: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# Carpetas por canción en B2 ({prefix}/{user_id}/{song_id}/)
+SONG_STORAGE_PREFIXES = ("originals", "previews", "stems", "grids")
+
 @app.post("/api/delete-files")
 async def delete_files_from_b2(request: dict):
-    """Eliminar archivos de B2 cuando se borra una canción"""
+    """
+    Eliminar archivos de B2 cuando se borra una canción.
+    Con userId se borra además todo lo de la canción (stems, previews, grids, análisis) por prefijo.
+    Los borrados van en paralelo (b2_storage.delete_concurrency a la vez).
+    """
     try:
         song_id = request.get("songId")
+        user_id = request.get("userId")
         file_url = request.get("fileUrl")
-        stems = request.get("stems", {})
+        stems = request.get("stems") or {}
         
         print(f"Eliminando archivos para canción {song_id}")
         
-        deleted_files = []
-        
-        # Eliminar archivo original si existe
+        labels = {}
         if file_url:
             original_path = _extract_b2_path_from_url(file_url)
             if original_path:
-                success = await b2_storage.delete_file(original_path)
-                if success:
-                    deleted_files.append(f"Original: {original_path}")
-                    print(f"Archivo original eliminado: {original_path}")
-        
-        # Eliminar stems si existen
-        if stems:
-            for stem_name, stem_url in stems.items():
-                if stem_url:
-                    stem_path = _extract_b2_path_from_url(stem_url)
-                    if stem_path:
-                        success = await b2_storage.delete_file(stem_path)
-                        if success:
-                            deleted_files.append(f"{stem_name}: {stem_path}")
-                            print(f"Stem {stem_name} eliminado: {stem_path}")
+                labels[original_path] = "Original"
+        for stem_name, stem_url in stems.items():
+            stem_path = _extract_b2_path_from_url(stem_url) if stem_url else None
+            if stem_path:
+                labels[stem_path] = stem_name
+        
+        deleted_files = []
+        if user_id and song_id:
+            prefixes = [f"{prefix}/{user_id}/{song_id}/" for prefix in SONG_STORAGE_PREFIXES]
+            prefixes.append(f"analysis/{user_id}/{song_id}.json")
+            for paths in await asyncio.gather(*(b2_storage.delete_prefix(prefix) for prefix in prefixes)):
+                for path in paths:
+                    deleted_files.append(f"{labels.pop(path)}: {path}" if path in labels else path)
+        
+        # URLs fuera de las carpetas de la canción (o sin userId)
+        results = await b2_storage.delete_files(labels.keys())
+        deleted_files += [f"{labels[path]}: {path}" for path, deleted in results.items() if deleted]
         
         return {
             "success": True,
@@ -152,13 +191,11 @@ async def delete_files_from_b2(request: dict):
         print(f"Error eliminando archivos de B2: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-def _extract_b2_path_from_url(url: str) -> str:
-    """Extraer la ruta del archivo desde la URL de B2"""
+def _extract_b2_path_from_url(url: str) -> Optional[str]:
+    """Extraer la ruta del archivo desde la URL de B2 o del proxy /api/audio"""
     try:
-        if 'moises/' in url:
-            return url.split('moises/')[1]
-        return None
-    except:
+        return audio_fetcher.storage_path(url)
+    except Exception:
         return None
 
 @app.post("/upload")
@@ -208,6 +245,7 @@ async def upload_audio(
         separation_type=separation_type,
         status=TaskStatus.PROCESSING
     )
+    tasks_storage[task_id] = task
     
     # Start background processing with options
     background_tasks.add_task(process_audio, task, custom_tracks, hi_fi)
@@ -268,6 +306,7 @@ async def separate_audio_direct(
     hi_fi: bool = Form(False),
     song_id: Optional[str] = Form(None),
     user_id: Optional[str] = Form(None),
+    preview: bool = Form(False),
 ):
     """Separate audio using Moises Style architecture - Solo B2 Storage"""
     
@@ -285,6 +324,24 @@ async def separate_audio_direct(
         file_content = await file.read()
         print(f"Archivo leido: {len(file_content)} bytes")
         
+        # Backpressure: sin espacio temporal para el PCM del job se responde 503 en lugar de llenar /tmp
+        await scratch_space.ensure_capacity(moises_processor.workspace_bytes(file_content, file.filename))
+        
+        # Set de stems personalizado: {"stems": {"rhythm": ["drums", "bass"], ...}}
+        custom_stems = None
+        if separation_options:
+            try:
+                custom_stems = json.loads(separation_options).get("stems")
+            except (ValueError, AttributeError):
+                print(f"separation_options inválido, se ignora: {separation_options}")
+        
+        # Tier 1: stems borrador en segundos, tier 2 (htdemucs) en segundo plano
+        if preview:
+            return await _start_preview_separation(
+                background_tasks, file_content, file.filename, user_id or "anonymous",
+                separation_type, hi_fi, custom_stems
+            )
+        
         # Usar el procesador Moises Style
         try:
             result = await moises_processor.separate_audio_moises_style(
@@ -292,7 +349,8 @@ async def separate_audio_direct(
                 filename=file.filename,
                 user_id=user_id or "anonymous",
                 separation_type=separation_type,
-                hi_fi=hi_fi
+                hi_fi=hi_fi,
+                custom_stems=custom_stems
             )
             print(f"Procesador Moises Style completado: {result}")
         except Exception as proc_error:
@@ -304,6 +362,21 @@ async def separate_audio_direct(
         print(f"Resultado procesador: {result}")
         
         if result["success"]:
+            # Tarea ya completa: /status/{task_id} sirve stems y análisis como en el flujo con preview
+            analysis = SongAnalysis.model_validate(result["analysis"]) if result.get("analysis") else None
+            tasks_storage[result["task_id"]] = ProcessingTask(
+                id=result["task_id"],
+                original_filename=file.filename,
+                file_path=result["original_url"],
+                separation_type=result["separation_type"],
+                status=TaskStatus.COMPLETED,
+                progress=100,
+                stems=result["stems"],
+                tier="full",
+                duration=result.get("duration"),
+                analysis=analysis,
+                completed_at=datetime.now()
+            )
             response_data = {
                 "success": True,
                 "message": "Audio separado exitosamente estilo Moises",
@@ -313,6 +386,11 @@ async def separate_audio_direct(
                     "original_url": result["original_url"],
                     "stems": result["stems"],
                     "separation_type": result["separation_type"],
+                    "content_hash": result.get("content_hash"),
+                    "duration": result.get("duration"),
+                    "bpm": result.get("bpm"),
+                    "bpm_confidence": result.get("bpm_confidence"),
+                    "analysis": result.get("analysis"),
                     "hi_fi": result["hi_fi"],
                     "processed_at": result["processed_at"],
                     "user_id": result["user_id"]
@@ -325,6 +403,9 @@ async def separate_audio_direct(
             print(f"Error en procesamiento: {error_msg}")
             raise HTTPException(status_code=500, detail=error_msg)
             
+    except ScratchSpaceFull as e:
+        print(f"Sin espacio temporal: {e}")
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
     except Exception as e:
         print(f"Error completo en Moises Style: {e}")
         print(f"Tipo de error: {type(e)}")
@@ -332,6 +413,99 @@ async def separate_audio_direct(
         print(f"Stack trace: {traceback.format_exc()}")
         raise HTTPException(status_code=500, detail=str(e))
 
+async def _start_preview_separation(
+    background_tasks: BackgroundTasks,
+    file_content: bytes,
+    filename: str,
+    user_id: str,
+    separation_type: str,
+    hi_fi: bool,
+    custom_stems: Optional[Dict[str, List[str]]]
+):
+    """Publica los stems borrador y deja la separación completa corriendo en segundo plano"""
+    timestamp = int(datetime.now().timestamp())
+    task_id = f"task_{timestamp}_{user_id[:8]}"
+    song_id = f"song_{timestamp}_{user_id[:8]}"
+    
+    preview_stems = await moises_processor.separate_preview(
+        file_content, filename, user_id, song_id, separation_type, custom_stems
+    )
+    media = media_probe.probe_bytes(file_content, filename)
+    
+    task = ProcessingTask(
+        id=task_id,
+        original_filename=filename,
+        file_path=filename,
+        separation_type=separation_type,
+        status=TaskStatus.PROCESSING,
+        progress=20,
+        preview_stems=preview_stems,
+        tier="preview",
+        duration=media.duration if media else None
+    )
+    tasks_storage[task_id] = task
+    
+    background_tasks.add_task(
+        _complete_full_separation, task, file_content, filename, user_id,
+        song_id, separation_type, hi_fi, custom_stems
+    )
+    
+    return {
+        "success": True,
+        "message": "Preview listo, separación completa en curso",
+        "data": {
+            "task_id": task_id,
+            "song_id": song_id,
+            "tier": "preview",
+            "stems": preview_stems,
+            "preview_stems": preview_stems,
+            "separation_type": separation_type,
+            "hi_fi": hi_fi,
+            "user_id": user_id,
+            "status_url": f"/status/{task_id}"
+        }
+    }
+
+async def _complete_full_separation(
+    task: ProcessingTask,
+    file_content: bytes,
+    filename: str,
+    user_id: str,
+    song_id: str,
+    separation_type: str,
+    hi_fi: bool,
+    custom_stems: Optional[Dict[str, List[str]]]
+):
+    """Tier 2: htdemucs completo; al terminar reemplaza los stems del preview en la tarea"""
+    result = await moises_processor.separate_audio_moises_style(
+        file_content=file_content,
+        filename=filename,
+        user_id=user_id,
+        separation_type=separation_type,
+        hi_fi=hi_fi,
+        custom_stems=custom_stems,
+        song_id=song_id,
+        task_id=task.id
+    )
+    
+    if result.get("success"):
+        # Swap atómico: las URLs finales y el tier cambian juntos (sin await entre medio)
+        task.stems = result["stems"]
+        task.tier = "full"
+        task.duration = result.get("duration") or task.duration
+        try:
+            task.analysis = await analysis_store.load(user_id, song_id)
+        except ValueError as e:
+            print(f"Análisis no disponible para {song_id}: {e}")
+        task.status = TaskStatus.COMPLETED
+        task.progress = 100
+        task.completed_at = datetime.now()
+        print(f"Separación completa lista para {song_id}, stems del preview reemplazados")
+    else:
+        # El preview sigue disponible aunque falle la separación completa
+        task.status = TaskStatus.FAILED
+        task.error = result.get("error")
+
 @app.get("/status/{task_id}")
 async def get_status(task_id: str):
     """Get processing status"""
@@ -344,17 +518,33 @@ async def get_status(task_id: str):
     if task.status == TaskStatus.COMPLETED and task.stems:
         stems_urls = task.stems  # These are already B2 URLs
     
+    analysis = task.analysis
     return {
         "task_id": task_id,
         "status": task.status,
         "progress": task.progress,
         "stems": stems_urls,
-        "bpm": 126,  # Default BPM
-        "key": "E",  # Default key
-        "timeSignature": "4/4",  # Default time signature
-        "duration": "5:00"  # Default duration
+        "preview_stems": task.preview_stems,
+        "tier": task.tier,
+        "bpm": analysis.bpm if analysis else None,
+        "key": analysis.key if analysis else None,
+        "timeSignature": analysis.time_signature if analysis else None,
+        "duration": format_duration(task.duration),
+        "duration_seconds": task.duration,
+        "analysis": analysis
     }
 
+@app.get("/songs/{song_id}/analysis")
+async def get_song_analysis(song_id: str, user_id: str):
+    """Análisis de la canción calculado durante la separación (BPM, tonalidad, compás, duración)"""
+    try:
+        analysis = await analysis_store.load(user_id, song_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not analysis:
+        raise HTTPException(status_code=404, detail="Analysis not found")
+    return analysis
+
 @app.get("/audio/{path:path}")
 async def serve_audio(path: str):
     """Serve audio files from B2 to avoid CORS issues"""
@@ -401,6 +591,29 @@ async def download_stem(task_id: str, stem_name: str):
         media_type="audio/wav"
     )
 
+def _analyze_local_file(file_path: str, song_id: str, user_id: str) -> SongAnalysis:
+    """BPM, tonalidad, compás y duración de un archivo local (CPU: correr en el executor)"""
+    media = media_probe.probe_file(file_path)
+    bpm_result = bpm_analyzer_simple.analyze_bpm_from_file(file_path)
+    key_result = key_analyzer_simple.analyze_key_from_file(file_path)
+    meter_result = time_signature_analyzer.analyze_time_signature(file_path, duration=60)
+    return SongAnalysis(
+        song_id=song_id,
+        user_id=user_id,
+        bpm=bpm_result.get("bpm"),
+        bpm_confidence=bpm_result.get("confidence", 0),
+        key=key_result["key_string"] if key_result.get("key") else None,
+        key_confidence=key_result.get("confidence", 0),
+        time_signature=None if meter_result.get("error") else meter_result.get("time_signature"),
+        time_signature_confidence=meter_result.get("confidence", 0),
+        downbeat_phase=meter_result.get("downbeat_phase", 0),
+        duration=media.duration if media else bpm_result.get("duration"),
+        sample_rate=media.samplerate if media else None,
+        channels=media.channels if media else None,
+        codec=media.codec if media else None,
+        analyzed_at=datetime.now()
+    )
+
 async def process_audio(task: ProcessingTask, custom_tracks: Optional[Dict] = None, hi_fi: bool = False):
     """Background task to process audio"""
     try:
@@ -439,6 +652,14 @@ async def process_audio(task: ProcessingTask, custom_tracks: Optional[Dict] = No
         b2_stems = await upload_stems_to_b2(stems, task.id)
         task.progress = 95
         
+        # Análisis del original (BPM, tonalidad, compás, duración) para /status
+        try:
+            loop = asyncio.get_event_loop()
+            task.analysis = await loop.run_in_executor(None, _analyze_local_file, task.file_path, task.id, "anonymous")
+            task.duration = task.analysis.duration
+        except Exception as analysis_error:
+            print(f"Error analizando {task.file_path}: {analysis_error}")
+        
         # Update task with B2 URLs
         task.stems = b2_stems
         task.status = TaskStatus.COMPLETED
@@ -503,17 +724,17 @@ async def analyze_chords(
     file: UploadFile = File(...)
 ):
     """Analyze chords and key of an audio file"""
+    workspace = None
     try:
         # Generate unique task ID
         task_id = str(uuid.uuid4())
         
-        # Save uploaded file
-        upload_dir = Path("uploads") / task_id
-        upload_dir.mkdir(parents=True, exist_ok=True)
-        file_path = upload_dir / "audio.wav"
+        # Save uploaded file (workspace propio, se libera al terminar el análisis)
+        content = await file.read()
+        workspace = await scratch_space.acquire(f"chords_{task_id}", len(content))
+        file_path = workspace / f"audio{Path(file.filename or '').suffix or '.wav'}"
         
         with open(file_path, "wb") as buffer:
-            content = await file.read()
             buffer.write(content)
         
         # Create task
@@ -534,7 +755,11 @@ async def analyze_chords(
             "message": "Chord analysis started"
         }
         
+    except ScratchSpaceFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
     except Exception as e:
+        if workspace is not None:
+            await scratch_space.release(workspace)
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/chord-analysis/{task_id}")
@@ -600,6 +825,8 @@ async def process_chord_analysis(task: ProcessingTask):
         task.status = TaskStatus.FAILED
         task.error = str(e)
         print(f"Chord analysis error: {e}")
+    finally:
+        await scratch_space.release(Path(task.file_path).parent)
 
 @app.post("/cancel/{task_id}")
 async def cancel_separation(task_id: str):
@@ -645,23 +872,25 @@ async def analyze_bpm_endpoint(file: UploadFile = File(...)):
     """
     try:
         print(f"[BPM] Analizando archivo: {file.filename}")
+        content = await file.read()
         
-        # Guardar archivo temporalmente
-        with tempfile.NamedTemporaryFile(delete=False, suffix=Path(file.filename).suffix) as tmp_file:
-            content = await file.read()
-            tmp_file.write(content)
-            tmp_path = tmp_file.name
-        
-        print(f"[BPM] Archivo temporal: {tmp_path}")
-        
-        # Analizar BPM usando archivo local
-        result = bpm_analyzer_simple.analyze_bpm_from_file(tmp_path)
+        async def compute():
+            # Guardar archivo temporalmente
+            async with scratch_space.workspace("bpm_upload", len(content)) as workspace:
+                tmp_path = str(workspace / f"upload{Path(file.filename).suffix}")
+                with open(tmp_path, "wb") as tmp_file:
+                    tmp_file.write(content)
+                
+                print(f"[BPM] Archivo temporal: {tmp_path}")
+                
+                # Analizar BPM usando archivo local (fuera del event loop)
+                loop = asyncio.get_event_loop()
+                result = await loop.run_in_executor(None, bpm_analyzer_simple.analyze_bpm_from_file, tmp_path)
+                return raise_for_error(result)
         
-        # Limpiar archivo temporal
-        try:
-            os.unlink(tmp_path)
-        except:
-            pass
+        # El mismo contenido subido dos veces comparte un solo análisis
+        content_hash = hashlib.sha256(content).hexdigest()
+        result = await analysis_flight.do(("bpm_upload", content_hash), compute)
         
         print(f"[BPM] Resultado: BPM={result.get('bpm')}, Confianza={result.get('confidence', 0)*100:.1f}%")
         
@@ -672,17 +901,34 @@ async def analyze_bpm_endpoint(file: UploadFile = File(...)):
             "details": result
         }
         
+    except ScratchSpaceFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
     except Exception as e:
         print(f"[BPM] Error: {e}")
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
+BPM_METHODS = ("simple", "professional")
+
+def _check_bpm_method(method: str):
+    if method not in BPM_METHODS:
+        raise HTTPException(status_code=400, detail=f"Método de BPM desconocido: {method} (disponibles: {list(BPM_METHODS)})")
+
+def _run_bpm_analysis(file_path: str, method: str = "simple") -> Dict:
+    """Ejecuta el analizador de BPM elegido: 'simple' (streaming) o 'professional' (multi-método)"""
+    if method == "professional":
+        return bpm_analyzer.analyze_bpm(file_path)
+    if method == "simple":
+        return bpm_analyzer_simple.analyze_bpm_from_file(file_path)
+    raise ValueError(f"Método de BPM desconocido: {method}")
+
 @app.get("/api/analyze-bpm-from-file")
-async def analyze_bpm_from_file(file_path: str):
+async def analyze_bpm_from_file(file_path: str, method: str = "simple"):
     """
     Analiza el BPM de un archivo que ya está en el servidor (cache local)
     """
+    _check_bpm_method(method)
     try:
         print(f"[BPM] Analizando archivo local: {file_path}")
         
@@ -690,8 +936,9 @@ async def analyze_bpm_from_file(file_path: str):
         if not os.path.exists(file_path):
             raise HTTPException(status_code=404, detail=f"Archivo no encontrado: {file_path}")
         
-        # Analizar BPM usando archivo local
-        result = bpm_analyzer_simple.analyze_bpm_from_file(file_path)
+        # Analizar BPM usando archivo local (fuera del event loop: 'professional' tarda segundos)
+        loop = asyncio.get_event_loop()
+        result = await loop.run_in_executor(None, _run_bpm_analysis, file_path, method)
         
         print(f"[BPM] Resultado: BPM={result.get('bpm')}, Confianza={result.get('confidence', 0)*100:.1f}%")
         
@@ -702,55 +949,44 @@ async def analyze_bpm_from_file(file_path: str):
             "details": result
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"[BPM] Error: {e}")
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
+async def _analyze_from_url(audio_url: str, label: str, analyze) -> Dict:
+    """Descarga el audio a un archivo temporal y corre el análisis en un executor"""
+    print(f"[{label}] Analizando desde URL: {audio_url}")
+    
+    # Descarga en streaming a disco con el cliente compartido (URLs propias: local o B2 directo)
+    async with audio_fetcher.fetch_to_file(audio_url) as audio_path:
+        # Análisis CPU fuera del event loop
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, analyze, str(audio_path))
+
 @app.get("/api/analyze-bpm-from-url")
-async def analyze_bpm_from_url(audio_url: str):
+async def analyze_bpm_from_url(audio_url: str, method: str = "simple"):
     """
     Analiza el BPM de un archivo de audio desde una URL (B2)
+    Requests idénticas concurrentes comparten un solo análisis (single-flight + cache TTL)
     """
+    _check_bpm_method(method)
     try:
-        print(f"[BPM] Analizando desde URL: {audio_url}")
-        
-        # Descargar archivo desde URL
-        import httpx
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            response = await client.get(audio_url)
-            if response.status_code != 200:
-                raise HTTPException(status_code=400, detail=f"No se pudo descargar el archivo: {response.status_code}")
-            
-            file_content = response.content
-        
-        print(f"[BPM] Archivo descargado: {len(file_content)} bytes")
-        
-        # Guardar temporalmente
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.mp3') as tmp_file:
-            tmp_file.write(file_content)
-            tmp_path = tmp_file.name
-        
-        print(f"[BPM] Archivo temporal: {tmp_path}")
-        
-        # Analizar BPM
-        result = bpm_analyzer_simple.analyze_bpm_from_file(tmp_path)
-        
-        # Limpiar archivo temporal
-        try:
-            os.unlink(tmp_path)
-        except:
-            pass
-        
-        print(f"[BPM] Resultado: BPM={result.get('bpm')}, Confianza={result.get('confidence', 0)*100:.1f}%")
+        async def compute():
+            result = await _analyze_from_url(audio_url, "BPM", lambda path: _run_bpm_analysis(path, method))
+            raise_for_error(result)
+            print(f"[BPM] Resultado: BPM={result.get('bpm')}, Confianza={result.get('confidence', 0)*100:.1f}%")
+            return {
+                "success": True,
+                "bpm": result.get("bpm"),
+                "confidence": result.get("confidence", 0),
+                "details": result
+            }
         
-        return {
-            "success": True,
-            "bpm": result.get("bpm"),
-            "confidence": result.get("confidence", 0),
-            "details": result
-        }
+        return await analysis_flight.do(("bpm", normalize_url(audio_url), method), compute)
         
     except Exception as e:
         print(f"[BPM] Error: {e}")
@@ -762,47 +998,24 @@ async def analyze_bpm_from_url(audio_url: str):
 async def analyze_key_from_url(audio_url: str):
     """
     Analiza la tonalidad (key) de un archivo de audio desde una URL (B2)
+    Requests idénticas concurrentes comparten un solo análisis (single-flight + cache TTL)
     """
     try:
-        print(f"[KEY] Analizando desde URL: {audio_url}")
-        
-        # Descargar archivo desde URL
-        import httpx
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            response = await client.get(audio_url)
-            if response.status_code != 200:
-                raise HTTPException(status_code=400, detail=f"No se pudo descargar el archivo: {response.status_code}")
-            
-            file_content = response.content
-        
-        print(f"[KEY] Archivo descargado: {len(file_content)} bytes")
-        
-        # Guardar temporalmente
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.mp3') as tmp_file:
-            tmp_file.write(file_content)
-            tmp_path = tmp_file.name
-        
-        print(f"[KEY] Archivo temporal: {tmp_path}")
-        
-        # Analizar tonalidad
-        result = key_analyzer_simple.analyze_key_from_file(tmp_path)
-        
-        # Limpiar archivo temporal
-        try:
-            os.unlink(tmp_path)
-        except:
-            pass
-        
-        print(f"[KEY] Resultado: Key={result.get('key_string')}, Confianza={result.get('confidence', 0)*100:.1f}%")
+        async def compute():
+            result = await _analyze_from_url(audio_url, "KEY", key_analyzer_simple.analyze_key_from_file)
+            raise_for_error(result)
+            print(f"[KEY] Resultado: Key={result.get('key_string')}, Confianza={result.get('confidence', 0)*100:.1f}%")
+            return {
+                "success": True,
+                "key": result.get("key"),
+                "scale": result.get("scale"),
+                "key_string": result.get("key_string"),
+                "confidence": result.get("confidence", 0),
+                "details": result
+            }
         
-        return {
-            "success": True,
-            "key": result.get("key"),
-            "scale": result.get("scale"),
-            "key_string": result.get("key_string"),
-            "confidence": result.get("confidence", 0),
-            "details": result
-        }
+        key = ("key", normalize_url(audio_url), key_analyzer_simple.chroma_backend)
+        return await analysis_flight.do(key, compute)
         
     except Exception as e:
         print(f"[KEY] Error: {e}")
@@ -815,46 +1028,24 @@ async def analyze_key_from_url(audio_url: str):
 async def analyze_time_signature_from_url(audio_url: str):
     """
     Analiza el compás (time signature) de un archivo de audio desde una URL (B2)
+    Requests idénticas concurrentes comparten un solo análisis (single-flight + cache TTL)
     """
     try:
-        print(f"[TIME SIG] Analizando desde URL: {audio_url}")
-        
-        # Descargar archivo desde URL
-        import httpx
-        async with httpx.AsyncClient(timeout=90.0) as client:
-            response = await client.get(audio_url)
-            if response.status_code != 200:
-                raise HTTPException(status_code=400, detail=f"No se pudo descargar el archivo: {response.status_code}")
-            
-            file_content = response.content
-        
-        print(f"[TIME SIG] Archivo descargado: {len(file_content)} bytes")
-        
-        # Guardar temporalmente
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.mp3') as tmp_file:
-            tmp_file.write(file_content)
-            tmp_path = tmp_file.name
-        
-        print(f"[TIME SIG] Archivo temporal: {tmp_path}")
-        
-        # Analizar compás
-        result = time_signature_analyzer.analyze_time_signature_from_file(tmp_path)
-        
-        # Limpiar archivo temporal
-        try:
-            os.unlink(tmp_path)
-        except:
-            pass
+        async def compute():
+            result = await _analyze_from_url(
+                audio_url, "TIME SIG", time_signature_analyzer.analyze_time_signature_from_file
+            )
+            raise_for_error(result)
+            print(f"[TIME SIG] Resultado: {result.get('time_signature')}, Confianza={result.get('confidence', 0)*100:.1f}%")
+            return {
+                "success": True,
+                "time_signature": result.get("time_signature"),
+                "confidence": result.get("confidence", 0),
+                "detected_pattern": result.get("detected_pattern"),
+                "details": result
+            }
         
-        print(f"[TIME SIG] Resultado: {result.get('time_signature')}, Confianza={result.get('confidence', 0)*100:.1f}%")
-        
-        return {
-            "success": True,
-            "time_signature": result.get("time_signature"),
-            "confidence": result.get("confidence", 0),
-            "detected_pattern": result.get("detected_pattern"),
-            "details": result
-        }
+        return await analysis_flight.do(("time_signature", normalize_url(audio_url)), compute)
         
     except Exception as e:
         print(f"[TIME SIG] Error: {e}")
@@ -862,6 +1053,136 @@ async def analyze_time_signature_from_url(audio_url: str):
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/analyze-batch")
+async def analyze_batch(request: BatchAnalysisRequest):
+    """
+    Analiza una biblioteca o setlist completa (bpm, key, meter, chords, onset).
+    Responde NDJSON: una línea por canción a medida que termina (campo index = posición en items)
+    """
+    items = [item.model_dump() for item in request.items]
+    try:
+        features = batch_analyzer.validate(items, request.features)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    print(f"[BATCH] {len(items)} canciones, features: {features}")
+    
+    async def stream():
+        async for result in batch_analyzer.run(items, features):
+            yield json.dumps(result) + "\n"
+    
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+@app.get("/api/beat-grid/{user_id}/{song_id}")
+async def get_beat_grid(user_id: str, song_id: str):
+    """
+    Devuelve el beat grid persistido de una canción (beats, downbeats y compases)
+    para click tracks, loop sections y sincronización de acordes
+    """
+    beat_grid = await beat_grid_store.load(user_id, song_id)
+    if beat_grid is None:
+        raise HTTPException(status_code=404, detail="Beat grid no encontrado")
+    
+    return {
+        "success": True,
+        "song_id": song_id,
+        **grid_to_dict(beat_grid)
+    }
+
+@app.post("/api/mixdown")
+async def mixdown(request: MixdownRequest):
+    """
+    Exporta la mezcla del mixer (volumen, pan, mute, solo) como WAV/MP3/FLAC en streaming
+    """
+    fmt = request.format.lower()
+    if fmt not in MIX_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Formato no soportado: {request.format}")
+    try:
+        validate_stem_ref(request.user_id, request.song_id, request.stems)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    gains = mixdown_renderer.effective_gains(
+        {name: stem.model_dump() for name, stem in request.stems.items()},
+        request.master_volume
+    )
+    if not gains:
+        raise HTTPException(status_code=400, detail="No hay stems audibles en la mezcla")
+    
+    # Los stems se resuelven antes de la cache: el key incluye qué archivos se mezclan
+    try:
+        stem_paths = await mixdown_renderer.resolve_stems(request.user_id, request.song_id, list(gains.keys()))
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    
+    key = mixdown_renderer.cache_key(
+        request.user_id, request.song_id, gains, fmt, request.start, request.end, stem_paths=stem_paths
+    )
+    filename = f"{request.song_id}_mix.{fmt}"
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+    
+    cached = mixdown_renderer.cached_render(key, fmt)
+    if cached:
+        print(f"[MIXDOWN] Render cacheado: {cached.name}")
+        return FileResponse(str(cached), media_type=MIX_FORMATS[fmt], filename=filename)
+    
+    try:
+        stream = await mixdown_renderer.render(
+            request.user_id, request.song_id, gains, fmt, key, request.start, request.end, stem_paths=stem_paths
+        )
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        # Encoder no disponible en este servidor
+        raise HTTPException(status_code=503, detail=str(e))
+    
+    return StreamingResponse(stream, media_type=MIX_FORMATS[fmt], headers=headers)
+
+@app.get("/api/slice")
+async def slice_stem(user_id: str, song_id: str, stem: str, start: float, end: float):
+    """
+    Sección [start, end) de un stem WAV con precisión de sample (para loops de práctica).
+    Para secciones de la mezcla usar /api/mixdown con start/end.
+    """
+    try:
+        slice_path = await wav_slicer.slice_stem(user_id, song_id, stem, start, end)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return FileResponse(
+        str(slice_path),
+        media_type="audio/wav",
+        filename=f"{song_id}_{stem}_{start:.3f}-{end:.3f}.wav",
+        headers={"Cache-Control": "public, max-age=3600"}
+    )
+
+@app.post("/api/render-variant")
+async def render_variant(request: VariantRequest):
+    """
+    Stems con cambio de tono/tempo renderizados en el servidor (cacheados en B2)
+    """
+    try:
+        stems = await tempo_pitch_renderer.render_variant(
+            request.user_id, request.song_id, request.stems,
+            request.semitones, request.tempo_ratio
+        )
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return {
+        "success": True,
+        "song_id": request.song_id,
+        "semitones": request.semitones,
+        "tempo_ratio": request.tempo_ratio,
+        "stems": stems
+    }
+
 @app.options("/api/generate-click-track")
 async def generate_click_track_options():
     """Handle CORS preflight request"""
@@ -873,6 +1194,7 @@ async def generate_click_track(request: Request):
     Genera un click track alineado con el primer ataque de la canción y lo sube a B2
     """
     print("[CLICK] ==================== INICIO GENERATE CLICK TRACK ====================")
+    workspace = None
     try:
         print("[CLICK] 1. Parseando request body...")
         body = await request.json()
@@ -885,12 +1207,25 @@ async def generate_click_track(request: Request):
         user_id = body.get("user_id")
         audio_url = body.get("audio_url")  # URL del audio original
         silence_ms = body.get("silence_ms", 0)  # Silencio inicial en ms desde frontend
+        downbeat_phase = body.get("downbeat_phase") or 0  # Fase del downbeat (time signature analyzer); null -> 0
         
         print(f"[CLICK] 2. Validando parametros: bpm={bpm}, duration={duration_seconds}, song_id={song_id}, user_id={user_id}, silence_ms={silence_ms}")
         
-        if not bpm or not duration_seconds:
+        if not bpm or not (duration_seconds or audio_url):
             print("[CLICK] ERROR: Falta BPM o duracion")
-            raise HTTPException(status_code=400, detail="BPM y duración son requeridos")
+            raise HTTPException(status_code=400, detail="BPM y duración (o audio_url) son requeridos")
+        
+        # La fase es un índice de beat dentro del compás: 0 <= fase < beats por compás
+        try:
+            beats_per_bar = int(str(time_signature).split('/')[0])
+            downbeat_phase = int(downbeat_phase)
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="time_signature y downbeat_phase deben ser numéricos (ej: \"4/4\", 0)")
+        if beats_per_bar < 1 or not 0 <= downbeat_phase < beats_per_bar:
+            raise HTTPException(
+                status_code=400,
+                detail=f"downbeat_phase debe estar entre 0 y {beats_per_bar - 1} para un compás {time_signature}"
+            )
         
         if not song_id or not user_id:
             print("[CLICK] ADVERTENCIA: Falta song_id o user_id, usando valores por defecto")
@@ -899,39 +1234,62 @@ async def generate_click_track(request: Request):
         
         print(f"[CLICK] 3. Generando click track: BPM={bpm}, Duración={duration_seconds}s, Compás={time_signature}, Silencio={silence_ms}ms")
         
+        # Beat grid persistido de la canción (se calcula una sola vez por canción)
+        beat_grid = None
+        if song_id != "unknown" and user_id != "unknown":
+            beat_grid = await beat_grid_store.load(user_id, song_id)
+            if beat_grid is not None:
+                print(f"[CLICK] Beat grid existente: {len(beat_grid)} beats")
+        
         # Detectar el onset (primer ataque de sonido) si se proporciona audio_url
         onset_time = 0.0
         
-        if audio_url:
+        if audio_url and (beat_grid is None or not duration_seconds):
             print(f"[CLICK] Descargando audio desde: {audio_url}")
             try:
-                import httpx
                 import librosa
                 
-                # Descargar el audio
-                async with httpx.AsyncClient(timeout=60.0) as client:
-                    response = await client.get(audio_url)
-                    if response.status_code == 200:
-                        audio_content = response.content
-                        print(f"[CLICK] Audio descargado: {len(audio_content)} bytes")
-                        
-                        # Guardar temporalmente
-                        temp_audio_path = os.path.join(tempfile.gettempdir(), f"temp_audio_{uuid.uuid4().hex}.mp3")
-                        with open(temp_audio_path, 'wb') as f:
-                            f.write(audio_content)
-                        
-                        print(f"[CLICK] Detectando primer ataque de sonido...")
+                # Decodificación y análisis en el executor: la canción completa tarda segundos
+                loop = asyncio.get_event_loop()
+                
+                # Descargar el audio (cliente compartido, a disco por chunks; las URLs propias no salen a internet)
+                async with audio_fetcher.fetch_to_file(audio_url) as audio_path:
+                    temp_audio_path = str(audio_path)
+                    
+                    # Duración desde los headers si el frontend no la envió
+                    if not duration_seconds:
+                        media = media_probe.probe_file(temp_audio_path)
+                        duration_seconds = media.duration if media else None
+                    
+                    # Calcular el beat grid de la canción completa y persistirlo
+                    if beat_grid is None:
+                        print(f"[CLICK] Calculando beat grid de la canción completa...")
+                        grid_result = await loop.run_in_executor(
+                            None,
+                            lambda: time_signature_analyzer.analyze_time_signature(
+                                temp_audio_path, duration=None, return_grid=True
+                            )
+                        )
+                        beat_grid = grid_result.get("beat_grid")
+                        if beat_grid is not None and len(beat_grid) > 0:
+                            if song_id != "unknown" and user_id != "unknown":
+                                await beat_grid_store.save(user_id, song_id, beat_grid)
+                        else:
+                            beat_grid = None
+                    
+                    if beat_grid is None:
+                        print(f"[CLICK] Sin beat grid, detectando primer ataque de sonido...")
                         
                         # Cargar audio con librosa (solo primeros 10 segundos para velocidad)
-                        y, sr = librosa.load(temp_audio_path, sr=22050, duration=10.0)
+                        y, sr = await loop.run_in_executor(
+                            None, lambda: librosa.load(temp_audio_path, sr=22050, duration=10.0)
+                        )
                         print(f"[CLICK] Audio cargado: {len(y)} samples, sr={sr}")
                         
                         # Detectar onsets (ataques de sonido) con parámetros ajustados
-                        onset_frames = librosa.onset.onset_detect(
-                            y=y, 
-                            sr=sr, 
-                            backtrack=True,
-                            units='frames'
+                        onset_frames = await loop.run_in_executor(
+                            None,
+                            lambda: librosa.onset.onset_detect(y=y, sr=sr, backtrack=True, units='frames')
                         )
                         
                         print(f"[CLICK] Onsets detectados: {len(onset_frames)}")
@@ -944,21 +1302,15 @@ async def generate_click_track(request: Request):
                             print(f"[CLICK] INFO: Onset detectado por librosa en el audio original")
                         else:
                             print(f"[CLICK] ADVERTENCIA: No se detectaron onsets, usando tiempo 0")
-                        
-                        # Limpiar archivo temporal
-                        try:
-                            os.unlink(temp_audio_path)
-                            print(f"[CLICK] Archivo temporal eliminado")
-                        except Exception as cleanup_error:
-                            print(f"[CLICK] Error limpiando: {cleanup_error}")
-                    else:
-                        print(f"[CLICK] Error HTTP: {response.status_code}")
             except Exception as e:
                 print(f"[CLICK] ADVERTENCIA: Error detectando onset: {e}, usando tiempo 0")
                 import traceback
                 traceback.print_exc()
                 onset_time = 0.0
         
+        if not duration_seconds:
+            raise HTTPException(status_code=400, detail="No se pudo determinar la duración del audio")
+        
         print(f"[CLICK] 4. Usando onset offset: {onset_time:.3f}s")
         
         # Rutas a los archivos de click
@@ -974,7 +1326,8 @@ async def generate_click_track(request: Request):
         
         # Generar archivo temporal de salida
         print("[CLICK] 6. Preparando archivo temporal de salida...")
-        output_path = os.path.join(tempfile.gettempdir(), f"click_track_{song_id}_{uuid.uuid4().hex}.wav")
+        workspace = await scratch_space.acquire(f"click_track_{song_id}")
+        output_path = str(workspace / "click.wav")
         print(f"[CLICK] Output path: {output_path}")
         
         # Generar click track con onset del audio original
@@ -986,15 +1339,26 @@ async def generate_click_track(request: Request):
         print(f"[CLICK] NOTA: Click track usará onset del audio original ({onset_time:.3f}s) para sincronización")
         print(f"[CLICK] NOTA: Ignorando silencio del frontend ({silence_ms}ms) - usando detección automática")
         
-        result_path = click_generator_simple.generate_click_track(
-            bpm=int(bpm),
-            duration_seconds=float(duration_seconds),
-            click_path=click_path,
-            click2_path=click2_path,
-            time_signature=time_signature,
-            output_path=output_path,
-            onset_offset_seconds=total_offset_seconds  # Solo el delay del frontend
-        )
+        if beat_grid is not None:
+            # Renderizar directamente desde el beat grid (sigue el tempo real de la canción)
+            result_path = click_generator_simple.render_from_beat_grid(
+                beat_grid=beat_grid,
+                duration_seconds=float(duration_seconds),
+                click_path=click_path,
+                click2_path=click2_path,
+                output_path=output_path
+            )
+        else:
+            result_path = click_generator_simple.generate_click_track(
+                bpm=int(bpm),
+                duration_seconds=float(duration_seconds),
+                click_path=click_path,
+                click2_path=click2_path,
+                time_signature=time_signature,
+                output_path=output_path,
+                onset_offset_seconds=total_offset_seconds,  # Solo el delay del frontend
+                downbeat_phase=downbeat_phase
+            )
         
         print(f"[CLICK] 8. Click track generado exitosamente: {result_path}")
         
@@ -1018,12 +1382,6 @@ async def generate_click_track(request: Request):
         
         print(f"[CLICK] 11. Subida a B2 completada: {upload_result}")
         
-        # Limpiar archivo temporal
-        try:
-            os.unlink(result_path)
-        except:
-            pass
-        
         print(f"[CLICK] Click track subido a B2: {upload_result.get('download_url')}")
         print(f"[CLICK] Onset offset: {onset_time:.3f}s")
         print(f"[CLICK] OK: Proceso completado exitosamente")
@@ -1032,9 +1390,15 @@ async def generate_click_track(request: Request):
             "success": True,
             "click_url": upload_result.get("download_url"),
             "file_id": upload_result.get("file_id"),
-            "onset_offset_seconds": onset_time
+            "onset_offset_seconds": onset_time,
+            "beat_grid_used": beat_grid is not None
         }
         
+    except HTTPException:
+        raise
+    except ScratchSpaceFull as e:
+        print(f"[CLICK] Scratch space lleno: {e}")
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
     except Exception as e:
         error_msg = str(e)
         print(f"[CLICK] ERROR: {error_msg}")
@@ -1043,6 +1407,9 @@ async def generate_click_track(request: Request):
         
         # Retornar error detallado
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if workspace is not None:
+            await scratch_space.release(workspace)
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,218 @@
+"""
+Media Probe - duración, sample rate, canales y codec leídos de los headers
+
+Evita decodificar la canción completa solo para conocer su duración:
+- MP3: ID3v2 + primer frame; duración exacta desde el header Xing/Info o
+  VBRI (VBR) o por bitrate y tamaño (CBR), sin decodificar audio
+- WAV/FLAC/OGG/AIFF: soundfile.info (lee solo los headers)
+- Resto (AAC/M4A, OPUS, ...): ffprobe leyendo por stdin
+
+Los resultados se cachean por hash de contenido.
+"""
+
+import hashlib
+import io
+import json
+import subprocess
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Optional
+
+import soundfile as sf
+
+# Tablas del header de frame MPEG audio
+_MPEG_BITRATES = {
+    # (versión MPEG1?, layer) -> kbps por índice
+    (True, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (True, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (True, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (False, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (False, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (False, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+_MPEG_SAMPLERATES = {3: [44100, 48000, 32000], 2: [22050, 24000, 16000], 0: [11025, 12000, 8000]}
+
+
+@dataclass
+class MediaInfo:
+    duration: float        # Segundos
+    samplerate: int
+    channels: int
+    codec: str             # "mp3", "pcm_16", "flac", "aac", ...
+    source: str            # Cómo se obtuvo: "mp3_header", "soundfile", "ffprobe"
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def format_duration(seconds: Optional[float]) -> Optional[str]:
+    """Duración en el formato que muestra el frontend ("m:ss")"""
+    if seconds is None:
+        return None
+    minutes, secs = divmod(int(round(seconds)), 60)
+    return f"{minutes}:{secs:02d}"
+
+
+class MediaProbe:
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._cache: "OrderedDict[str, MediaInfo]" = OrderedDict()
+
+    def probe_bytes(self, file_content: bytes, filename: Optional[str] = None, content_hash: Optional[str] = None) -> Optional[MediaInfo]:
+        """
+        Info del audio a partir del contenido (cacheada por hash)
+
+        Returns:
+            MediaInfo o None si ningún método reconoce el formato
+        """
+        content_hash = content_hash or hashlib.sha256(file_content).hexdigest()
+        if content_hash in self._cache:
+            self._cache.move_to_end(content_hash)
+            return self._cache[content_hash]
+
+        info = None
+        for method in (self._probe_mp3, self._probe_soundfile, self._probe_ffprobe):
+            try:
+                info = method(file_content)
+            except Exception as e:
+                print(f"[PROBE] {method.__name__} falló: {e}")
+            if info:
+                break
+
+        if info:
+            print(f"[PROBE] {filename or content_hash[:12]}: {info.duration:.2f}s, {info.samplerate} Hz, {info.channels} ch, {info.codec} ({info.source})")
+            self._cache[content_hash] = info
+            if len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return info
+
+    def probe_file(self, file_path: str) -> Optional[MediaInfo]:
+        return self.probe_bytes(Path(file_path).read_bytes(), filename=Path(file_path).name)
+
+    def _probe_soundfile(self, file_content: bytes) -> Optional[MediaInfo]:
+        info = sf.info(io.BytesIO(file_content))
+        if info.format == "MPEG":
+            return None  # libsndfile recorre todos los frames; el parser de MP3 es más barato
+        return MediaInfo(
+            duration=info.frames / info.samplerate,
+            samplerate=info.samplerate,
+            channels=info.channels,
+            codec=info.subtype.lower() if info.format in ("WAV", "WAVEX", "AIFF") else info.format.lower(),
+            source="soundfile"
+        )
+
+    def _probe_ffprobe(self, file_content: bytes) -> Optional[MediaInfo]:
+        cmd = [
+            "ffprobe", "-v", "error", "-select_streams", "a:0",
+            "-show_entries", "format=duration:stream=sample_rate,channels,codec_name",
+            "-of", "json", "pipe:0"
+        ]
+        try:
+            result = subprocess.run(cmd, input=file_content, capture_output=True, timeout=30)
+        except FileNotFoundError:
+            return None
+        if result.returncode != 0:
+            return None
+
+        data = json.loads(result.stdout or b"{}")
+        streams = data.get("streams") or [{}]
+        duration = data.get("format", {}).get("duration")
+        if not duration:
+            return None
+        return MediaInfo(
+            duration=float(duration),
+            samplerate=int(streams[0].get("sample_rate") or 0),
+            channels=int(streams[0].get("channels") or 0),
+            codec=streams[0].get("codec_name", "unknown"),
+            source="ffprobe"
+        )
+
+    def _probe_mp3(self, data: bytes) -> Optional[MediaInfo]:
+        """Duración de un MP3 desde ID3v2 + primer frame (Xing/Info, VBRI o CBR)"""
+        if data[:4] in (b"RIFF", b"RIFX", b"fLaC", b"OggS", b"FORM") or data[4:8] == b"ftyp":
+            return None  # Otros contenedores: soundfile / ffprobe
+        offset = 0
+        # Tag ID3v2: tamaño syncsafe de 4 bytes (+10 de header, +10 si hay footer)
+        if data[:3] == b"ID3" and len(data) >= 10:
+            size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+            offset = 10 + size + (10 if data[5] & 0x10 else 0)
+
+        frame = self._find_frame(data, offset)
+        if frame is None:
+            return None
+        start, mpeg1, layer, bitrate, samplerate, channels = frame
+
+        samples_per_frame = 384 if layer == 1 else (1152 if mpeg1 or layer == 2 else 576)
+
+        # Header Xing/Info (VBR de LAME): después de la side info del primer frame
+        side_info = (32 if channels == 2 else 17) if mpeg1 else (17 if channels == 2 else 9)
+        xing = start + 4 + side_info
+        if data[xing:xing + 4] in (b"Xing", b"Info"):
+            flags = int.from_bytes(data[xing + 4:xing + 8], "big")
+            if flags & 0x1:
+                frames = int.from_bytes(data[xing + 8:xing + 12], "big")
+                samples = frames * samples_per_frame - self._lame_padding(data, xing, flags)
+                return self._mp3_info(samples / samplerate, samplerate, channels)
+
+        # Header VBRI (Fraunhofer): 32 bytes después del header del frame
+        vbri = start + 36
+        if data[vbri:vbri + 4] == b"VBRI":
+            frames = int.from_bytes(data[vbri + 14:vbri + 18], "big")
+            return self._mp3_info(frames * samples_per_frame / samplerate, samplerate, channels)
+
+        # CBR: bytes de audio / bitrate (sin el tag ID3v1 del final)
+        if not bitrate:
+            return None
+        audio_bytes = len(data) - start - (128 if data[-128:-125] == b"TAG" else 0)
+        return self._mp3_info(audio_bytes * 8 / (bitrate * 1000), samplerate, channels)
+
+    def _lame_padding(self, data: bytes, xing: int, flags: int) -> int:
+        """Delay + padding del encoder (tag LAME tras el header Xing), 0 si no hay tag"""
+        lame = xing + 8 + (4 if flags & 0x1 else 0) + (4 if flags & 0x2 else 0) + (100 if flags & 0x4 else 0) + (4 if flags & 0x8 else 0)
+        if data[lame:lame + 4] not in (b"LAME", b"Lavf", b"Lavc"):
+            return 0
+        delay_padding = int.from_bytes(data[lame + 21:lame + 24], "big")
+        return (delay_padding >> 12) + (delay_padding & 0xFFF)
+
+    def _find_frame(self, data: bytes, offset: int, max_scan: int = 65536):
+        """Primer header de frame MPEG válido seguido de otro frame (evita falsos sync)"""
+        end = min(len(data) - 4, offset + max_scan)
+        for pos in range(offset, end):
+            header = self._parse_frame_header(data, pos)
+            if header is None:
+                continue
+            frame_length = header[-1]
+            if pos + frame_length + 4 <= len(data) and self._parse_frame_header(data, pos + frame_length) is None:
+                continue
+            return (pos,) + header[:-1]
+        return None
+
+    def _parse_frame_header(self, data: bytes, pos: int):
+        if pos + 4 > len(data) or data[pos] != 0xFF or (data[pos + 1] & 0xE0) != 0xE0:
+            return None
+        version = (data[pos + 1] >> 3) & 0x3       # 3 = MPEG1, 2 = MPEG2, 0 = MPEG2.5
+        layer = 4 - ((data[pos + 1] >> 1) & 0x3)   # 1, 2, 3 (4 = reservado)
+        bitrate_index = data[pos + 2] >> 4
+        samplerate_index = (data[pos + 2] >> 2) & 0x3
+        padding = (data[pos + 2] >> 1) & 0x1
+        channel_mode = data[pos + 3] >> 6
+        if version == 1 or layer == 4 or bitrate_index in (0, 15) or samplerate_index == 3:
+            return None
+
+        mpeg1 = version == 3
+        bitrate = _MPEG_BITRATES[(mpeg1, layer)][bitrate_index]
+        samplerate = _MPEG_SAMPLERATES[version][samplerate_index]
+        if layer == 1:
+            frame_length = (12 * bitrate * 1000 // samplerate + padding) * 4
+        else:
+            factor = 144 if mpeg1 or layer == 2 else 72
+            frame_length = factor * bitrate * 1000 // samplerate + padding
+        return mpeg1, layer, bitrate, samplerate, 1 if channel_mode == 3 else 2, frame_length
+
+    def _mp3_info(self, duration: float, samplerate: int, channels: int) -> MediaInfo:
+        return MediaInfo(duration=duration, samplerate=samplerate, channels=channels, codec="mp3", source="mp3_header")
+
+
+# Global instance
+media_probe = MediaProbe()
@@ -0,0 +1,319 @@
+"""
+Mixdown - exporta la mezcla del mixer (volumen, pan, mute, solo por stem) en una sola pasada
+
+- Los stems se leen por bloques desde la cache local (stem_cache) o se bajan
+  de B2 en streaming a disco la primera vez
+- Suma en float32 bloque a bloque: la mezcla completa nunca está en memoria
+- WAV: header escrito en el proceso y PCM 16-bit en streaming
+- MP3/FLAC: bloques float32 por stdin a ffmpeg, salida codificada por stdout
+- Cada render se guarda en cache con el hash de los parámetros de la mezcla y de
+  los archivos de stems usados (una nueva separación no sirve un render viejo)
+"""
+
+import asyncio
+import hashlib
+import json
+import shutil
+import struct
+import tempfile
+import uuid
+from pathlib import Path
+from typing import AsyncIterator, Dict, List, Optional
+
+import numpy as np
+import soundfile as sf
+
+from b2_storage import b2_storage
+from scratch_space import scratch_space
+from stem_cache import stem_cache, validate_stem_ref
+
+MIX_FORMATS = {
+    "wav": "audio/wav",
+    "mp3": "audio/mpeg",
+    "flac": "audio/flac",
+}
+
+FFMPEG_ENCODERS = {
+    "mp3": ["-codec:a", "libmp3lame", "-b:a", "320k", "-f", "mp3"],
+    "flac": ["-codec:a", "flac", "-f", "flac"],
+}
+
+
+def pan_matrix(pan: float, channels: int) -> np.ndarray:
+    """
+    Matriz (canales de entrada x 2) equivalente al StereoPannerNode de Web Audio,
+    para que el export suene igual que el mixer del navegador
+    """
+    pan = float(np.clip(pan, -1.0, 1.0))
+    if channels == 1:
+        x = (pan + 1.0) / 2.0
+        return np.array([[np.cos(x * np.pi / 2), np.sin(x * np.pi / 2)]], dtype=np.float32)
+
+    x = pan + 1.0 if pan <= 0 else pan
+    gain_l, gain_r = np.cos(x * np.pi / 2), np.sin(x * np.pi / 2)
+    if pan <= 0:
+        return np.array([[1.0, 0.0], [gain_l, gain_r]], dtype=np.float32)
+    return np.array([[gain_l, gain_r], [0.0, 1.0]], dtype=np.float32)
+
+
+def wav_header(total_frames: int, samplerate: int, channels: int = 2, bits: int = 16) -> bytes:
+    """Header RIFF/WAVE PCM para un archivo de longitud conocida"""
+    block_align = channels * bits // 8
+    data_size = total_frames * block_align
+    return (
+        b"RIFF" + struct.pack("<I", 36 + data_size) + b"WAVE"
+        + b"fmt " + struct.pack("<IHHIIHH", 16, 1, channels, samplerate, samplerate * block_align, block_align, bits)
+        + b"data" + struct.pack("<I", data_size)
+    )
+
+
+class MixdownRenderer:
+    def __init__(self):
+        self.cache_dir = Path(tempfile.gettempdir()) / "moises_mixdown"
+        self.stems_dir = scratch_space.register_cache(self.cache_dir / "stems")
+        self.renders_dir = scratch_space.register_cache(self.cache_dir / "renders")
+        self.block_frames = 65536       # Frames mezclados por bloque
+        self.read_chunk_bytes = 65536   # Lectura de la salida de ffmpeg
+
+    def effective_gains(self, stems: Dict[str, Dict], master_volume: float = 1.0) -> Dict[str, Dict]:
+        """
+        Aplica la lógica de mute/solo del mixer: con algún stem en solo solo suenan
+        los stems en solo (aunque estén muteados), si no suenan los no muteados.
+        Retorna solo los stems audibles con su ganancia final y pan.
+        """
+        has_solo = any(s.get("solo") for s in stems.values())
+        audible = {}
+        for name, settings in stems.items():
+            enabled = settings.get("solo") if has_solo else not settings.get("muted")
+            gain = float(settings.get("volume", 1.0)) * float(master_volume)
+            if enabled and gain > 0:
+                audible[name] = {"gain": round(gain, 6), "pan": round(float(settings.get("pan", 0.0)), 6)}
+        return audible
+
+    def cache_key(
+        self,
+        user_id: str,
+        song_id: str,
+        gains: Dict[str, Dict],
+        fmt: str,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+        stem_paths: Optional[Dict[str, Path]] = None
+    ) -> str:
+        """Hash de los parámetros que determinan el render y de los stems (resolve_stems) que se mezclan"""
+        payload = json.dumps(
+            {
+                "user_id": user_id, "song_id": song_id, "stems": gains, "format": fmt, "start": start, "end": end,
+                "sources": self._stems_fingerprint(stem_paths or {})
+            },
+            sort_keys=True
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _stems_fingerprint(self, stem_paths: Dict[str, Path]) -> Dict[str, str]:
+        """
+        Identidad de cada stem: la ruta de stem_cache incluye el hash de contenido y el
+        cache_key del modelo; inodo y tamaño cubren las copias bajadas de B2 (cada descarga
+        es un replace). No se usa el mtime: scratch_space.touch lo actualiza en cada lectura.
+        """
+        fingerprint = {}
+        for name, path in stem_paths.items():
+            stat = path.stat()
+            fingerprint[name] = f"{path}:{stat.st_ino}:{stat.st_size}"
+        return fingerprint
+
+    def cached_render(self, key: str, fmt: str) -> Optional[Path]:
+        path = self.renders_dir / f"{key}.{fmt}"
+        if not path.exists():
+            return None
+        scratch_space.touch(path)
+        return path
+
+    def _stem_download_path(self, user_id: str, song_id: str, name: str) -> Path:
+        return self.stems_dir / f"{user_id}_{song_id}" / f"{name}.wav"
+
+    def local_stem(self, user_id: str, song_id: str, name: str) -> Optional[Path]:
+        """Stem ya disponible en disco (cache de separación o de mixdown), sin descargar"""
+        validate_stem_ref(user_id, song_id, [name])
+        local = stem_cache.song_stems(user_id, song_id)
+        path = local.get(name) or self._stem_download_path(user_id, song_id, name)
+        if not path.exists():
+            return None
+        scratch_space.touch(path)
+        return path
+
+    async def resolve_stems(self, user_id: str, song_id: str, names: List[str]) -> Dict[str, Path]:
+        """Ruta local de cada stem: cache de separación, cache de mixdown o descarga de B2"""
+        validate_stem_ref(user_id, song_id, names)
+        resolved = {}
+        for name in names:
+            path = self.local_stem(user_id, song_id, name)
+            if path is None:
+                path = self._stem_download_path(user_id, song_id, name)
+                await self._download_stem(f"stems/{user_id}/{song_id}/{name}.wav", path)
+            resolved[name] = path
+        return resolved
+
+    async def _download_stem(self, b2_path: str, path: Path):
+        """Descarga un stem de B2 en streaming a disco (sin cargarlo entero en memoria)"""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        partial_path = path.with_name(f"{path.name}.{uuid.uuid4().hex}.partial")
+        try:
+            with open(partial_path, "wb") as f:
+                async for chunk in b2_storage.download_file(b2_path):
+                    f.write(chunk)
+            partial_path.replace(path)
+        except Exception as e:
+            raise FileNotFoundError(f"Stem no disponible en B2: {b2_path} ({e})")
+        finally:
+            partial_path.unlink(missing_ok=True)
+
+    def _open_sources(self, stem_paths: Dict[str, Path], gains: Dict[str, Dict]):
+        """Abre los stems y precalcula la matriz ganancia x pan de cada uno"""
+        sources = []
+        try:
+            for name, path in stem_paths.items():
+                f = sf.SoundFile(str(path))
+                channels = min(f.channels, 2)
+                matrix = pan_matrix(gains[name]["pan"], channels) * np.float32(gains[name]["gain"])
+                sources.append((f, channels, matrix))
+
+            samplerates = {f.samplerate for f, _, _ in sources}
+            if len(samplerates) > 1:
+                raise ValueError(f"Los stems tienen sample rates distintos: {sorted(samplerates)}")
+        except Exception:
+            for f, _, _ in sources:
+                f.close()
+            raise
+        return sources
+
+    def _mix_block(self, sources, frames: int) -> np.ndarray:
+        """Lee `frames` de cada stem y devuelve la mezcla estéreo float32 recortada a [-1, 1]"""
+        block = np.zeros((frames, 2), dtype=np.float32)
+        for f, channels, matrix in sources:
+            data = f.read(frames, dtype="float32", always_2d=True)
+            if len(data):
+                block[:len(data)] += data[:, :channels] @ matrix
+        np.clip(block, -1.0, 1.0, out=block)
+        return block
+
+    async def _pcm_blocks(self, sources, total_frames: int) -> AsyncIterator[np.ndarray]:
+        loop = asyncio.get_event_loop()
+        position = 0
+        while position < total_frames:
+            frames = min(self.block_frames, total_frames - position)
+            yield await loop.run_in_executor(None, self._mix_block, sources, frames)
+            position += frames
+
+    async def _encode_wav(self, sources, total_frames: int, samplerate: int) -> AsyncIterator[bytes]:
+        yield wav_header(total_frames, samplerate)
+        async for block in self._pcm_blocks(sources, total_frames):
+            yield (block * 32767.0).astype("<i2").tobytes()
+
+    async def _encode_ffmpeg(self, sources, total_frames: int, samplerate: int, fmt: str) -> AsyncIterator[bytes]:
+        process = await asyncio.create_subprocess_exec(
+            "ffmpeg", "-hide_banner", "-loglevel", "error",
+            "-f", "f32le", "-ar", str(samplerate), "-ac", "2", "-i", "pipe:0",
+            *FFMPEG_ENCODERS[fmt], "pipe:1",
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+
+        async def feed():
+            try:
+                async for block in self._pcm_blocks(sources, total_frames):
+                    process.stdin.write(block.astype("<f4").tobytes())
+                    await process.stdin.drain()
+            finally:
+                process.stdin.close()
+
+        feeder = asyncio.create_task(feed())
+        try:
+            while True:
+                chunk = await process.stdout.read(self.read_chunk_bytes)
+                if not chunk:
+                    break
+                yield chunk
+
+            await feeder
+            stderr = await process.stderr.read()
+            if await process.wait() != 0:
+                raise RuntimeError(f"ffmpeg falló codificando {fmt}: {stderr.decode(errors='ignore')}")
+        finally:
+            if not feeder.done():
+                feeder.cancel()
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+
+    async def render(
+        self,
+        user_id: str,
+        song_id: str,
+        gains: Dict[str, Dict],
+        fmt: str,
+        key: str,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+        stem_paths: Optional[Dict[str, Path]] = None
+    ) -> AsyncIterator[bytes]:
+        """
+        Prepara el render y retorna un iterador de bytes codificados.
+        Los errores de stems (faltantes, sample rate) y la falta de ffmpeg se lanzan
+        antes de empezar a transmitir. El render se guarda en cache solo si se completa.
+        start/end (segundos) limitan el render a una sección, con precisión de sample.
+        stem_paths: stems ya resueltos (los mismos usados para el cache_key)
+        """
+        if fmt not in MIX_FORMATS:
+            raise ValueError(f"Formato no soportado: {fmt}")
+        if not gains:
+            raise ValueError("No hay stems audibles en la mezcla")
+        if fmt in FFMPEG_ENCODERS and shutil.which("ffmpeg") is None:
+            raise RuntimeError(f"ffmpeg no está instalado en el servidor: export {fmt} no disponible (usar wav)")
+
+        stem_paths = stem_paths or await self.resolve_stems(user_id, song_id, list(gains.keys()))
+        sources = self._open_sources(stem_paths, gains)
+        samplerate = sources[0][0].samplerate
+        song_frames = max(f.frames for f, _, _ in sources)
+
+        start_frame = min(int(round((start or 0.0) * samplerate)), song_frames)
+        end_frame = song_frames if end is None else min(int(round(end * samplerate)), song_frames)
+        if end_frame <= start_frame:
+            for f, _, _ in sources:
+                f.close()
+            raise ValueError("La sección pedida está vacía")
+        if start_frame:
+            for f, _, _ in sources:
+                f.seek(min(start_frame, f.frames))
+        total_frames = end_frame - start_frame
+
+        encoded = (
+            self._encode_wav(sources, total_frames, samplerate) if fmt == "wav"
+            else self._encode_ffmpeg(sources, total_frames, samplerate, fmt)
+        )
+        cache_path = self.renders_dir / f"{key}.{fmt}"
+        print(f"[MIXDOWN] {song_id}: {len(sources)} stems -> {fmt} ({total_frames / samplerate:.1f}s)")
+
+        async def stream():
+            partial_path = cache_path.with_name(f"{cache_path.name}.{uuid.uuid4().hex}.partial")
+            completed = False
+            try:
+                with open(partial_path, "wb") as cache_file:
+                    async for chunk in encoded:
+                        cache_file.write(chunk)
+                        yield chunk
+                partial_path.replace(cache_path)
+                completed = True
+            finally:
+                await encoded.aclose()
+                for f, _, _ in sources:
+                    f.close()
+                if not completed:
+                    partial_path.unlink(missing_ok=True)
+
+        return stream()
+
+
+# Global instance
+mixdown_renderer = MixdownRenderer()
@@ -1,8 +1,12 @@
+import re
 from enum import Enum
 from pydantic import BaseModel
 from typing import Optional, Dict, List
 from datetime import datetime
 
+# user_id / song_id forman rutas locales y de B2: nada de "/", ".." ni vacíos
+SAFE_ID = re.compile(r"^[\w-]+$")
+
 class TaskStatus(str, Enum):
     PENDING = "pending"
     PROCESSING = "processing"
@@ -15,6 +19,24 @@ class SeparationType(str, Enum):
     FIVE_STEMS = "5stems"
     DEMUCS = "demucs"
 
+class SongAnalysis(BaseModel):
+    """Metadata musical de una canción, calculada una vez durante la separación"""
+    song_id: str
+    user_id: str
+    bpm: Optional[float] = None
+    bpm_confidence: float = 0.0
+    key: Optional[str] = None            # "E Minor"
+    key_confidence: float = 0.0
+    time_signature: Optional[str] = None
+    time_signature_confidence: float = 0.0
+    downbeat_phase: int = 0
+    duration: Optional[float] = None     # Segundos
+    sample_rate: Optional[int] = None
+    channels: Optional[int] = None
+    codec: Optional[str] = None
+    content_hash: Optional[str] = None
+    analyzed_at: Optional[datetime] = None
+
 class ProcessingTask(BaseModel):
     id: str
     original_filename: str
@@ -23,6 +45,10 @@ class ProcessingTask(BaseModel):
     status: TaskStatus
     progress: int = 0
     stems: Optional[Dict[str, str]] = None
+    preview_stems: Optional[Dict[str, str]] = None
+    tier: Optional[str] = None  # "preview" mientras corre la separación completa, luego "full"
+    duration: Optional[float] = None  # Segundos (media_probe)
+    analysis: Optional[SongAnalysis] = None
     error: Optional[str] = None
     created_at: datetime = datetime.now()
     completed_at: Optional[datetime] = None
@@ -50,3 +76,34 @@ class ProcessingResult(BaseModel):
     analysis: Optional[AudioAnalysis] = None
     processing_time: float
     quality_score: Optional[float] = None
+
+class MixdownStem(BaseModel):
+    volume: float = 1.0
+    pan: float = 0.0
+    muted: bool = False
+    solo: bool = False
+
+class MixdownRequest(BaseModel):
+    user_id: str
+    song_id: str
+    stems: Dict[str, MixdownStem]
+    master_volume: float = 1.0
+    format: str = "wav"
+    start: Optional[float] = None
+    end: Optional[float] = None
+
+class VariantRequest(BaseModel):
+    user_id: str
+    song_id: str
+    stems: List[str]
+    semitones: int = 0
+    tempo_ratio: float = 1.0
+
+class BatchAnalysisItem(BaseModel):
+    url: Optional[str] = None
+    song_id: Optional[str] = None
+    user_id: Optional[str] = None
+
+class BatchAnalysisRequest(BaseModel):
+    items: List[BatchAnalysisItem]
+    features: List[str] = ["bpm", "key", "meter"]
@@ -194,6 +194,22 @@ async def get_user_files(user_id: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/cleanup/b2")
+async def cleanup_b2(dry_run: bool = True):
+    """
+    GC de B2: borra derivados de canciones eliminadas y previews/cache expirados.
+    Por defecto solo reporta (dry_run); una ejecución interrumpida se retoma desde su checkpoint.
+    """
+    try:
+        stats = await cleanup_service.cleanup_old_b2_files(dry_run=dry_run)
+        return {
+            "success": "error" not in stats,
+            "stats": stats
+        }
+        
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.post("/api/cleanup/{user_id}")
 async def cleanup_user_files(user_id: str, days_old: int = 7):
     """
@@ -19,11 +19,35 @@ from datetime import datetime, timedelta
 from b2_storage import b2_storage
 from bpm_analyzer_simple import bpm_analyzer_simple
 from click_track_generator import click_generator
+from click_generator_simple import click_generator_simple
+from beat_grid import beat_grid_store
+from stem_mixer import stem_mixer
+from stem_cache import stem_cache
+from tempo_pitch_renderer import tempo_pitch_renderer
+from preview_separator import preview_separator
+from pcm_buffer import PCMBuffer
+from scratch_space import scratch_space
+from media_probe import media_probe
+from key_analyzer_simple import key_analyzer_simple
+from analysis_store import analysis_store
+from models import SongAnalysis
+from separation_models import select_model, build_separation_command, demucs_env, demucs_output_dir
+import time_signature_analyzer
+
+# Samples de click compartidos con el frontend
+CLICK_SAMPLES_DIR = Path(__file__).resolve().parent.parent / "public" / "audio"
 
 class MoisesStyleProcessor:
     def __init__(self):
         self.temp_dir = Path(tempfile.gettempdir()) / "moises_temp"
         self.temp_dir.mkdir(exist_ok=True)
+    
+    def workspace_bytes(self, file_content: bytes, filename: Optional[str] = None) -> int:
+        """Espacio temporal que reserva un job: el PCM float32 estéreo 44.1 kHz de la canción"""
+        media = media_probe.probe_bytes(file_content, filename)
+        if media and media.duration:
+            return int(media.duration * 44100 * 2 * 4)
+        return len(file_content) * 12   # Sin duración: ratio típico MP3 -> PCM float32
         
     async def separate_audio_moises_style(
         self, 
@@ -31,7 +55,10 @@ class MoisesStyleProcessor:
         filename: str,
         user_id: str,
         separation_type: str = "vocals-instrumental",
-        hi_fi: bool = False
+        hi_fi: bool = False,
+        custom_stems: Optional[Dict[str, List[str]]] = None,
+        song_id: Optional[str] = None,
+        task_id: Optional[str] = None
     ) -> Dict:
         """
         Procesar audio estilo Moises:
@@ -41,14 +68,18 @@ class MoisesStyleProcessor:
         4. Retornar URLs de B2
         """
         try:
-            # Generar IDs únicos
-            task_id = f"task_{int(datetime.now().timestamp())}_{user_id[:8]}"
-            song_id = f"song_{int(datetime.now().timestamp())}_{user_id[:8]}"
+            # Generar IDs únicos (o reutilizar los del preview)
+            task_id = task_id or f"task_{int(datetime.now().timestamp())}_{user_id[:8]}"
+            song_id = song_id or f"song_{int(datetime.now().timestamp())}_{user_id[:8]}"
             
             print(f"Procesando audio estilo Moises - Task: {task_id}")
             print(f"Archivo: {filename}, Tamano: {len(file_content)} bytes")
             print(f"Usuario: {user_id}, Tipo: {separation_type}, Hi-Fi: {hi_fi}")
             
+            # Duración, sample rate y codec desde los headers (milisegundos, cacheado por hash)
+            content_hash = stem_cache.content_hash(file_content)
+            media = media_probe.probe_bytes(file_content, filename, content_hash)
+            
             # 1. SUBIR ARCHIVO ORIGINAL A B2
             # Sanitizar nombre de archivo para B2
             safe_filename = self._sanitize_filename(filename)
@@ -70,59 +101,32 @@ class MoisesStyleProcessor:
             # 2. PROCESAR CON IA (version simplificada para debug)
             print("Iniciando procesamiento con IA...")
             
-            # Separación real con Demucs
-            b2_stems = await self._separate_audio_real(file_content, user_id, song_id, separation_type)
-            
-            # 4. ANALIZAR BPM DEL ARCHIVO LOCAL
-            bpm_result = None
-            try:
-                # Guardar archivo temporal para análisis BPM
-                temp_file = await self._save_temp_file(file_content, "temp_for_bpm.wav")
-                print(f"Analizando BPM del archivo local: {temp_file}")
-                bpm_result = bpm_analyzer_simple.analyze_bpm_from_file(temp_file)
-                if bpm_result.get('bpm'):
-                    print(f"BPM detectado: {bpm_result['bpm']} (confianza: {bpm_result.get('confidence', 0)*100:.1f}%)")
-                else:
-                    print("No se pudo detectar BPM")
-            except Exception as bpm_error:
-                print(f"Error analizando BPM: {bpm_error}")
-            
-            # 5. GENERAR CLICK TRACK PROFESIONAL SI HAY BPM
-            click_track_url = None
-            if bpm_result and bpm_result.get('bpm'):
+            # Decodificar una sola vez: separación, BPM, beat grid y click leen el mismo PCM
+            async with scratch_space.workspace(task_id, self.workspace_bytes(file_content, filename)) as workspace:
+                loop = asyncio.get_event_loop()
+                pcm = await loop.run_in_executor(
+                    None, lambda: PCMBuffer.decode(file_content, workspace, filename=filename)
+                )
                 try:
-                    # Obtener duración del archivo para el click track
-                    import librosa
-                    y, sr = librosa.load(temp_file)
-                    duration = len(y) / sr
-                    
-                    print(f"Generando click track profesional: BPM={bpm_result['bpm']}, Duración={duration}s")
-                    click_track_url = await click_generator.generate_and_upload_click_track(
-                        bpm=bpm_result['bpm'],
-                        duration=duration,
-                        user_id=user_id,
-                        song_id=song_id,
-                        audio_file_path=temp_file  # Pasar archivo para detección de beats reales
+                    b2_stems, analysis = await self._process_pcm(
+                        pcm, file_content, filename, user_id, song_id, separation_type,
+                        custom_stems=custom_stems, content_hash=content_hash, hi_fi=hi_fi, media=media
                     )
-                    
-                    if click_track_url:
-                        b2_stems["click"] = click_track_url
-                        print(f"Click track profesional generado y subido: {click_track_url}")
-                    else:
-                        print("Error generando click track profesional")
-                        
-                except Exception as click_error:
-                    print(f"Error generando click track profesional: {click_error}")
-                    import traceback
-                    print(f"Stack trace click: {traceback.format_exc()}")
-            
-            # 6. CONVERTIR URLs DE B2 A URLs DEL PROXY
+                finally:
+                    pcm.close()
+            
+            # Prerender de tonos populares (±1, ±2) en segundo plano: la tarea espera y
+            # solo renderiza si el servidor quedó ocioso
+            separated_stems = [name for name in b2_stems if name != "click"]
+            asyncio.create_task(tempo_pitch_renderer.prerender_popular(user_id, song_id, separated_stems))
+            
+            # 7. CONVERTIR URLs DE B2 A URLs DEL PROXY
             proxy_original_url = self._convert_b2_url_to_proxy(original_b2_url)
             proxy_stems = {}
             for stem_name, b2_url in b2_stems.items():
                 proxy_stems[stem_name] = self._convert_b2_url_to_proxy(b2_url)
             
-            # 6. RETORNAR RESULTADO ESTILO MOISES
+            # 8. RETORNAR RESULTADO ESTILO MOISES
             result = {
                 "success": True,
                 "task_id": task_id,
@@ -130,12 +134,16 @@ class MoisesStyleProcessor:
                 "original_url": proxy_original_url,
                 "stems": proxy_stems,
                 "separation_type": separation_type,
+                "content_hash": content_hash,
+                "duration": analysis.duration,
+                "media": media.to_dict() if media else None,
+                "analysis": analysis.model_dump(mode="json"),
                 "hi_fi": hi_fi,
                 "processed_at": datetime.now().isoformat(),
                 "user_id": user_id,
                 "status": "completed",
-                "bpm": bpm_result.get('bpm') if bpm_result else None,
-                "bpm_confidence": bpm_result.get('confidence', 0) if bpm_result else 0
+                "bpm": analysis.bpm,
+                "bpm_confidence": analysis.bpm_confidence
             }
             
             print(f"Procesamiento completado estilo Moises: {song_id}")
@@ -149,6 +157,173 @@ class MoisesStyleProcessor:
                 "status": "failed"
             }
     
+    async def _process_pcm(
+        self,
+        pcm: PCMBuffer,
+        file_content: bytes,
+        filename: str,
+        user_id: str,
+        song_id: str,
+        separation_type: str,
+        custom_stems: Optional[Dict[str, List[str]]] = None,
+        content_hash: Optional[str] = None,
+        hi_fi: bool = False,
+        media=None
+    ):
+        """
+        Etapas del pipeline sobre el audio ya decodificado
+        
+        Returns:
+            (stems en B2 incluyendo el click, SongAnalysis de la canción)
+        """
+        # 3. SEPARACIÓN REAL (cacheada por hash de contenido, en proceso sobre el PCM)
+        b2_stems = await self._separate_audio_real(
+            file_content, user_id, song_id, separation_type,
+            custom_stems=custom_stems, content_hash=content_hash, hi_fi=hi_fi,
+            pcm=pcm, filename=filename
+        )
+        
+        # 4. ANALIZAR BPM (streaming sobre el PCM)
+        # Los análisis son CPU puro: en el executor para no bloquear el event loop
+        loop = asyncio.get_event_loop()
+        bpm_result = None
+        try:
+            bpm_result = await loop.run_in_executor(None, bpm_analyzer_simple.analyze_bpm_from_pcm, pcm)
+            if bpm_result.get('bpm'):
+                print(f"BPM detectado: {bpm_result['bpm']} (confianza: {bpm_result.get('confidence', 0)*100:.1f}%)")
+            else:
+                print("No se pudo detectar BPM")
+        except Exception as bpm_error:
+            print(f"Error analizando BPM: {bpm_error}")
+
+        # 5. BEAT GRID DE LA CANCIÓN COMPLETA (una sola vez, se reutiliza para click/loops/acordes)
+        beat_grid = None
+        duration = pcm.duration
+        grid_result = {}
+        try:
+            grid_result = await loop.run_in_executor(
+                None,
+                lambda: time_signature_analyzer.analyze_time_signature(
+                    y=pcm.mono(22050), sr=22050, duration=None, return_grid=True
+                )
+            )
+            beat_grid = grid_result.get("beat_grid")
+            if beat_grid is not None and len(beat_grid) > 0:
+                await beat_grid_store.save(user_id, song_id, beat_grid)
+            else:
+                beat_grid = None
+        except Exception as grid_error:
+            print(f"Error calculando beat grid: {grid_error}")
+
+        # 5b. TONALIDAD Y REGISTRO DE ANÁLISIS (lo sirven /status y /songs/{id}/analysis)
+        key_result = await loop.run_in_executor(None, key_analyzer_simple.analyze_key_from_pcm, pcm)
+        analysis = SongAnalysis(
+            song_id=song_id,
+            user_id=user_id,
+            bpm=bpm_result.get('bpm') if bpm_result else None,
+            bpm_confidence=bpm_result.get('confidence', 0) if bpm_result else 0,
+            key=key_result['key_string'] if key_result.get('key') else None,
+            key_confidence=key_result.get('confidence', 0),
+            time_signature=grid_result.get("time_signature"),
+            time_signature_confidence=grid_result.get("confidence", 0),
+            downbeat_phase=grid_result.get("downbeat_phase", 0),
+            duration=media.duration if media else duration,
+            sample_rate=media.samplerate if media else pcm.samplerate,
+            channels=media.channels if media else pcm.channels,
+            codec=media.codec if media else None,
+            content_hash=content_hash,
+            analyzed_at=datetime.now()
+        )
+        await analysis_store.save(analysis)
+
+        # 6. GENERAR CLICK TRACK PROFESIONAL SI HAY BPM
+        click_track_url = None
+        if beat_grid is not None:
+            try:
+                print(f"Renderizando click track desde beat grid: {len(beat_grid)} beats, Duración={duration}s")
+                click_track_url = await self._render_click_from_grid(beat_grid, duration, user_id, song_id)
+                if click_track_url:
+                    b2_stems["click"] = click_track_url
+                    print(f"Click track (beat grid) subido: {click_track_url}")
+            except Exception as click_error:
+                print(f"Error generando click track desde beat grid: {click_error}")
+
+        if not click_track_url and bpm_result and bpm_result.get('bpm'):
+            try:
+                print(f"Generando click track profesional: BPM={bpm_result['bpm']}, Duración={duration}s")
+                click_track_url = await click_generator.generate_and_upload_click_track(
+                    bpm=bpm_result['bpm'],
+                    duration=duration,
+                    user_id=user_id,
+                    song_id=song_id
+                )
+
+                if click_track_url:
+                    b2_stems["click"] = click_track_url
+                    print(f"Click track profesional generado y subido: {click_track_url}")
+                else:
+                    print("Error generando click track profesional")
+
+            except Exception as click_error:
+                print(f"Error generando click track profesional: {click_error}")
+                import traceback
+                print(f"Stack trace click: {traceback.format_exc()}")
+        
+        return b2_stems, analysis
+    
+    async def separate_preview(
+        self,
+        file_content: bytes,
+        filename: str,
+        user_id: str,
+        song_id: str,
+        separation_type: str = "vocals-instrumental",
+        custom_stems: Optional[Dict[str, List[str]]] = None
+    ) -> Dict[str, str]:
+        """
+        Tier 1: separación borrador del inicio de la canción en pocos segundos
+        Sube los stems a previews/{user_id}/{song_id}/ y retorna URLs del proxy
+        """
+        async with scratch_space.workspace(f"preview_{song_id}", len(file_content) * 2) as preview_dir:
+            loop = asyncio.get_event_loop()
+            stem_paths = await loop.run_in_executor(
+                None,
+                preview_separator.separate_bytes,
+                file_content, filename, preview_dir, separation_type, custom_stems
+            )
+            
+            preview_stems = {}
+            for stem_name, stem_path in stem_paths.items():
+                upload = await b2_storage.upload_file(
+                    file_content=Path(stem_path).read_bytes(),
+                    filename=f"previews/{user_id}/{song_id}/{stem_name}.wav",
+                    content_type="audio/wav"
+                )
+                if upload.get("success"):
+                    preview_stems[stem_name] = self._convert_b2_url_to_proxy(upload["download_url"])
+            
+            print(f"Preview publicado para {song_id}: {list(preview_stems)}")
+            return preview_stems
+    
+    async def _render_click_from_grid(self, beat_grid, duration: float, user_id: str, song_id: str) -> Optional[str]:
+        """Renderizar el click track desde el beat grid y subirlo a B2"""
+        async with scratch_space.workspace(f"click_{song_id}") as workspace:
+            output_path = workspace / "click.wav"
+            click_generator_simple.render_from_beat_grid(
+                beat_grid=beat_grid,
+                duration_seconds=duration,
+                click_path=str(CLICK_SAMPLES_DIR / "click.wav"),
+                click2_path=str(CLICK_SAMPLES_DIR / "click2.wav"),
+                output_path=str(output_path)
+            )
+            
+            upload = await b2_storage.upload_file(
+                file_content=output_path.read_bytes(),
+                filename=f"stems/{user_id}/{song_id}/click.wav",
+                content_type="audio/wav"
+            )
+            return upload.get("download_url") if upload.get("success") else None
+    
     async def _save_temp_file(self, file_content: bytes, filename: str) -> str:
         """Guardar archivo temporal para procesamiento"""
         temp_file = self.temp_dir / filename
@@ -169,21 +344,18 @@ class MoisesStyleProcessor:
         output_dir.mkdir(exist_ok=True)
         
         try:
-            # Comando Demucs
-            cmd = [
-                "python", "-m", "demucs",
-                "--name", "htdemucs" if hi_fi else "htdemucs",
-                "--out", str(output_dir),
-                file_path
-            ]
+            # Comando Demucs según el registro de modelos (tier por tipo y hi_fi)
+            config = select_model(separation_type, hi_fi)
+            cmd = build_separation_command(config, file_path, str(output_dir))
             
-            print(f"[?] Ejecutando Demucs: {' '.join(cmd)}")
+            print(f"[?] Ejecutando Demucs ({config.name}): {' '.join(cmd)}")
             
             # Ejecutar Demucs
             process = await asyncio.create_subprocess_exec(
                 *cmd,
                 stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
+                stderr=asyncio.subprocess.PIPE,
+                env=demucs_env(config)
             )
             
             stdout, stderr = await process.communicate()
@@ -196,7 +368,7 @@ class MoisesStyleProcessor:
             
             # Buscar archivos generados
             stems = {}
-            model_dir = output_dir / "htdemucs" / Path(file_path).stem
+            model_dir = demucs_output_dir(config, str(output_dir), file_path)
             
             if model_dir.exists():
                 # Para vocals-instrumental
@@ -230,246 +402,54 @@ class MoisesStyleProcessor:
     async def _create_instrumental(self, model_dir: Path, output_path: str) -> Optional[str]:
         """Crear track instrumental combinando drums + bass + other"""
         try:
-            import librosa
-            import soundfile as sf
-            import numpy as np
-            
-            instrumental_tracks = []
-            for track in ["drums", "bass", "other"]:
-                track_path = model_dir / f"{track}.wav"
-                if track_path.exists():
-                    audio, sr = librosa.load(str(track_path))
-                    instrumental_tracks.append(audio)
-            
-            if instrumental_tracks:
-                # Combinar tracks
-                combined = np.sum(instrumental_tracks, axis=0)
-                
-                # Normalizar
-                combined = combined / np.max(np.abs(combined))
-                
-                # Guardar
-                sf.write(output_path, combined, 44100)
-                return output_path
-            
-            return None
+            # Suma por bloques al sample rate nativo de los stems (sin librosa.load ni resampleo)
+            return stem_mixer.mix_stem_dir(model_dir, ["drums", "bass", "other"], output_path)
             
         except Exception as e:
             print(f"Error creando instrumental: {e}")
             return None
     
-    async def _separate_audio_real(self, file_content: bytes, user_id: str, song_id: str, separation_type: str) -> Dict[str, str]:
-        """Separación real con sistema híbrido: Spleeter (rápido) + Demucs (calidad)"""
+    async def _separate_audio_real(
+        self,
+        file_content: bytes,
+        user_id: str,
+        song_id: str,
+        separation_type: str,
+        custom_stems: Optional[Dict[str, List[str]]] = None,
+        content_hash: Optional[str] = None,
+        hi_fi: bool = False,
+        pcm: Optional[PCMBuffer] = None,
+        filename: Optional[str] = None
+    ) -> Dict[str, str]:
+        """Separación real: stems derivados de la separación completa cacheada por contenido"""
         try:
-            print("Iniciando separación real con sistema híbrido...")
-            
-            # Importar librerías
-            import tempfile
-            import os
-            import asyncio
-            from pathlib import Path
-            import subprocess
-            import json
-            
-            # Crear directorio temporal para procesamiento
-            with tempfile.TemporaryDirectory() as temp_dir:
-                temp_path = Path(temp_dir)
-                
-                # Guardar archivo temporal
-                input_file = temp_path / "input.wav"
-                input_file.write_bytes(file_content)
-                print(f"Archivo temporal guardado: {input_file}")
-                
-                # Sistema híbrido: Spleeter (rápido) + Demucs (calidad)
-                use_spleeter = False  # Usar solo Demucs (Spleeter no compatible con Python 3.11)
-                
-                if separation_type == "vocals-instrumental":
-                    # 2 pistas: vocals + instrumental
-                    if use_spleeter:
-                        print("Usando Spleeter para separación 2 pistas (rápido)")
-                        cmd = [
-                            "python", "-m", "spleeter", "separate",
-                            "-p", "spleeter:2stems-16kHz",
-                            "-o", str(temp_path / "spleeter_output"),
-                            str(input_file)
-                        ]
-                        tool_name = "Spleeter"
-                    else:
-                        print("Usando Demucs para separación 2 pistas (calidad)")
-                        cmd = [
-                            "python", "-m", "demucs.separate",
-                            "--name", "htdemucs",
-                            "--two-stems", "vocals",
-                            "--device", "cpu",
-                            "--out", str(temp_path / "separated"),
-                            str(input_file)
-                        ]
-                        tool_name = "Demucs"
-                        
-                elif separation_type == "vocals-drums-bass-other":
-                    # 4 pistas: vocals, drums, bass, other
-                    if use_spleeter:
-                        print("Usando Spleeter para separación 4 pistas (rápido)")
-                        cmd = [
-                            "python", "-m", "spleeter", "separate",
-                            "-p", "spleeter:4stems-16kHz",
-                            "-o", str(temp_path / "spleeter_output"),
-                            str(input_file)
-                        ]
-                        tool_name = "Spleeter"
-                    else:
-                        print("Usando Demucs para separación 4 pistas (calidad)")
-                        cmd = [
-                            "python", "-m", "demucs.separate",
-                            "--name", "htdemucs",
-                            "--device", "cpu",
-                            "--out", str(temp_path / "separated"),
-                            str(input_file)
-                        ]
-                        tool_name = "Demucs"
-                        
-                elif separation_type == "vocals-chorus-drums-bass-piano":
-                    # 5 pistas: vocals, chorus, drums, bass, piano
-                    if use_spleeter:
-                        print("Usando Spleeter para separación 5 pistas (rápido)")
-                        cmd = [
-                            "python", "-m", "spleeter", "separate",
-                            "-p", "spleeter:5stems-16kHz",
-                            "-o", str(temp_path / "spleeter_output"),
-                            str(input_file)
-                        ]
-                        tool_name = "Spleeter"
-                    else:
-                        print("Usando Demucs para separación 5 pistas (calidad)")
-                        cmd = [
-                            "python", "-m", "demucs.separate",
-                            "--name", "mdx_extra_q",
-                            "--device", "cpu",
-                            "--out", str(temp_path / "separated"),
-                            str(input_file)
-                        ]
-                        tool_name = "Demucs"
-                else:
-                    # Default: 4 pistas con Spleeter
-                    print("Usando Spleeter para separación 4 pistas (default)")
-                    cmd = [
-                        "python", "-m", "spleeter", "separate",
-                        "-p", "spleeter:4stems-16kHz",
-                        "-o", str(temp_path / "spleeter_output"),
-                        str(input_file)
-                    ]
-                    tool_name = "Spleeter"
-                
-                print(f"Separando con {tool_name}: tipo={separation_type}")
-                print(f"Comando: {' '.join(cmd)}")
-                
-                # Ejecutar separación
-                loop = asyncio.get_event_loop()
-                result = await loop.run_in_executor(
-                    None, 
-                    lambda: subprocess.run(cmd, capture_output=True, text=True, timeout=300)
+            print(f"Iniciando separación real: tipo={separation_type}")
+            
+            # Demucs corre una sola vez por contenido (4 stems); el resto se deriva sumando stems
+            content_hash, stem_paths = await stem_cache.get_stems(
+                file_content, separation_type, custom_layout=custom_stems, content_hash=content_hash, hi_fi=hi_fi,
+                pcm=pcm, filename=filename
+            )
+            print(f"Separación completada. Archivos: {len(stem_paths)}")
+            stem_cache.register_song(user_id, song_id, stem_paths)
+            
+            # Subir cada stem a B2
+            b2_stems = {}
+            for stem_name, stem_path in stem_paths.items():
+                stem_b2_path = f"stems/{user_id}/{song_id}/{stem_name}.wav"
+                stem_upload = await b2_storage.upload_file(
+                    file_content=Path(stem_path).read_bytes(),
+                    filename=stem_b2_path,
+                    content_type="audio/wav"
                 )
                 
-                if result.returncode != 0:
-                    print(f"Error ejecutando {tool_name}: {result.stderr}")
-                    raise Exception(f"{tool_name} failed: {result.stderr}")
-                
-                print(f"{tool_name} completado exitosamente")
-                print(f"Output: {result.stdout}")
-                
-                # Buscar archivos separados según la herramienta usada
-                separated_files = {}
-                
-                if use_spleeter:
-                    # Procesar salida de Spleeter
-                    spleeter_output_dir = temp_path / "spleeter_output"
-                    if not spleeter_output_dir.exists():
-                        raise Exception("No se encontró directorio de salida de Spleeter")
-                    
-                    # Buscar el directorio con el nombre del archivo
-                    input_name = input_file.stem
-                    separated_dir = None
-                    for item in spleeter_output_dir.iterdir():
-                        if item.is_dir() and input_name in item.name:
-                            separated_dir = item
-                            break
-                    
-                    if not separated_dir:
-                        raise Exception(f"No se encontró directorio separado de Spleeter para {input_name}")
-                    
-                    print(f"Directorio Spleeter encontrado: {separated_dir}")
-                    
-                    # Leer archivos de Spleeter
-                    for file_path in separated_dir.glob("*.wav"):
-                        stem_name = file_path.stem
-                        separated_files[stem_name] = file_path.read_bytes()
-                        print(f"Stem Spleeter {stem_name} leído: {len(separated_files[stem_name])} bytes")
-                    
-                    # Renombrar archivos de Spleeter para consistencia
-                    if "accompaniment" in separated_files:
-                        separated_files["instrumental"] = separated_files.pop("accompaniment")
-                        
+                if stem_upload.get("success"):
+                    b2_stems[stem_name] = stem_upload["download_url"]
+                    print(f"Stem real {stem_name} subido: {stem_upload['download_url']}")
                 else:
-                    # Procesar salida de Demucs
-                    output_dir = temp_path / "separated"
-                    model_output_dir = output_dir / "htdemucs"
-                    if not model_output_dir.exists():
-                        raise Exception("No se encontró directorio de salida de Demucs")
-                    
-                    # Buscar el directorio con el nombre del archivo
-                    input_name = input_file.stem
-                    separated_dir = None
-                    for item in model_output_dir.iterdir():
-                        if item.is_dir() and input_name in item.name:
-                            separated_dir = item
-                            break
-                    
-                    if not separated_dir:
-                        raise Exception(f"No se encontró directorio separado de Demucs para {input_name}")
-                    
-                    print(f"Directorio Demucs encontrado: {separated_dir}")
-                    
-                    # Leer archivos de Demucs
-                    if separation_type == "vocals-instrumental":
-                        # Para 2 pistas: vocals y no_vocals (instrumental)
-                        for stem_name in ["vocals", "no_vocals"]:
-                            file_path = separated_dir / f"{stem_name}.wav"
-                            if file_path.exists():
-                                separated_files[stem_name] = file_path.read_bytes()
-                                print(f"Stem Demucs {stem_name} leído: {len(separated_files[stem_name])} bytes")
-                            else:
-                                print(f"Warning: {stem_name}.wav no encontrado")
-                        
-                        # Renombrar no_vocals a instrumental para consistencia
-                        if "no_vocals" in separated_files:
-                            separated_files["instrumental"] = separated_files.pop("no_vocals")
-                    else:
-                        # Para 4 o 5 pistas: leer todos los archivos .wav
-                        for file_path in separated_dir.glob("*.wav"):
-                            stem_name = file_path.stem
-                            separated_files[stem_name] = file_path.read_bytes()
-                            print(f"Stem Demucs {stem_name} leído: {len(separated_files[stem_name])} bytes")
-                
-                print(f"Separación completada. Archivos: {len(separated_files)}")
-                
-                # Procesar cada archivo separado
-                b2_stems = {}
-                for stem_name, stem_bytes in separated_files.items():
-                    # Subir a B2
-                    stem_b2_path = f"stems/{user_id}/{song_id}/{stem_name}.wav"
-                    stem_upload = await b2_storage.upload_file(
-                        file_content=stem_bytes,
-                        filename=stem_b2_path,
-                        content_type="audio/wav"
-                    )
-                    
-                    if stem_upload.get("success"):
-                        b2_stems[stem_name] = stem_upload["download_url"]
-                        print(f"Stem real {stem_name} subido: {stem_upload['download_url']}")
-                    else:
-                        print(f"Error subiendo stem real {stem_name}")
-                
-                return b2_stems
+                    print(f"Error subiendo stem real {stem_name}")
+            
+            return b2_stems
             
         except Exception as e:
             print(f"Error en separación real: {e}")
@@ -511,11 +491,11 @@ class MoisesStyleProcessor:
     def _convert_b2_url_to_proxy(self, b2_url: str) -> str:
         """Convertir URL de B2 a URL del proxy del backend"""
         # Extraer la ruta del archivo desde la URL de B2
-        # Ejemplo: https://s3.us-east-005.backblazeb2.com/moises/originals/user/song/file.mp3
+        # Ejemplo: https://s3.us-east-005.backblazeb2.com/moises2/originals/user/song/file.mp3
         # -> originals/user/song/file.mp3
         
-        if 'moises/' in b2_url:
-            file_path = b2_url.split('moises/')[1]
+        file_path = b2_storage.path_from_url(b2_url)
+        if file_path:
             proxy_url = f"http://localhost:8000/api/audio/{file_path}"
             print(f"Converted B2 URL to proxy: {b2_url} -> {proxy_url}")
             return proxy_url
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ONNX Separator - inferencia de separación en CPU con ONNX Runtime
+
+Ejecuta un modelo de separación exportado a ONNX (entrada/salida en forma de
+onda) con cuantización dinámica int8 opcional. Contrato del modelo:
+
+    entrada:  float32 [batch, 2, segment_samples]      (mezcla estéreo normalizada)
+    salida:   float32 [batch, n_stems, 2, segment_samples]
+
+El orden de stems, el sample rate y el tamaño de segmento se leen de la
+metadata del modelo ("stems" separado por comas, "samplerate",
+"segment_samples") y si no están se usan los de la configuración del registro.
+
+La canción se procesa por segmentos solapados (overlap-add con ventana
+triangular, igual que apply_model de Demucs) y los stems se escriben con el
+mismo layout de salida que la CLI de Demucs, así stem_cache y el benchmark lo
+usan como una configuración más del registro:
+
+    python onnx_separator.py <config> <input> <output_dir>
+"""
+
+import os
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+import soundfile as sf
+
+
+class OnnxSeparator:
+    def __init__(
+        self,
+        model_path: str,
+        stems: List[str],
+        samplerate: int = 44100,
+        segment_samples: int = 343980,   # 7.8 s a 44.1 kHz (segmento de htdemucs)
+        overlap: float = 0.25,
+        quantize: bool = False,
+        threads: Optional[int] = None,
+        batch_size: int = 1
+    ):
+        self.model_path = Path(model_path)
+        self.stems = list(stems)
+        self.samplerate = samplerate
+        self.segment_samples = segment_samples
+        self.overlap = overlap
+        self.quantize = quantize
+        self.threads = threads
+        self.batch_size = batch_size
+        self._session = None
+
+    def _quantized_path(self) -> Path:
+        """Cuantiza el modelo (pesos int8, activaciones dinámicas) una sola vez y lo guarda al lado"""
+        quantized_path = self.model_path.with_suffix(".int8.onnx")
+        if not quantized_path.exists():
+            from onnxruntime.quantization import quantize_dynamic, QuantType
+
+            print(f"[ONNX] Cuantizando {self.model_path.name} -> {quantized_path.name}")
+            quantize_dynamic(str(self.model_path), str(quantized_path), weight_type=QuantType.QInt8)
+        return quantized_path
+
+    @property
+    def session(self):
+        if self._session is None:
+            import onnxruntime as ort
+
+            if not self.model_path.exists():
+                raise FileNotFoundError(f"Modelo ONNX no encontrado: {self.model_path}")
+
+            options = ort.SessionOptions()
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            if self.threads:
+                options.intra_op_num_threads = self.threads
+
+            path = self._quantized_path() if self.quantize else self.model_path
+            self._session = ort.InferenceSession(str(path), options, providers=["CPUExecutionProvider"])
+            self._apply_metadata(self._session.get_modelmeta().custom_metadata_map)
+        return self._session
+
+    def _apply_metadata(self, metadata: Dict[str, str]):
+        if metadata.get("stems"):
+            self.stems = [s.strip() for s in metadata["stems"].split(",") if s.strip()]
+        if metadata.get("samplerate"):
+            self.samplerate = int(metadata["samplerate"])
+        if metadata.get("segment_samples"):
+            self.segment_samples = int(metadata["segment_samples"])
+
+    def separate(self, mix: np.ndarray) -> np.ndarray:
+        """
+        Separa una mezcla estéreo
+
+        Args:
+            mix: float32 [2, n]
+        Returns:
+            float32 [n_stems, 2, n]
+        """
+        session = self.session
+        input_name = session.get_inputs()[0].name
+        segment = self.segment_samples
+        stride = max(1, int(segment * (1 - self.overlap)))
+        length = mix.shape[-1]
+
+        # Normalización de la mezcla como en Demucs (media/desviación de la mezcla mono)
+        reference = mix.mean(axis=0)
+        mean, std = float(reference.mean()), float(reference.std()) or 1.0
+        mix = (mix - mean) / std
+
+        weight = np.minimum(np.arange(1, segment + 1), np.arange(segment, 0, -1)).astype(np.float32)
+        weight /= weight.max()
+
+        output = np.zeros((len(self.stems), 2, length), dtype=np.float32)
+        weight_sum = np.zeros(length, dtype=np.float32)
+        offsets = list(range(0, length, stride))
+
+        for start in range(0, len(offsets), self.batch_size):
+            batch_offsets = offsets[start:start + self.batch_size]
+            batch = np.zeros((len(batch_offsets), 2, segment), dtype=np.float32)
+            for i, offset in enumerate(batch_offsets):
+                chunk = mix[:, offset:offset + segment]
+                batch[i, :, :chunk.shape[-1]] = chunk
+
+            result = session.run(None, {input_name: batch})[0]
+
+            for i, offset in enumerate(batch_offsets):
+                valid = min(segment, length - offset)
+                output[..., offset:offset + valid] += result[i, ..., :valid] * weight[:valid]
+                weight_sum[offset:offset + valid] += weight[:valid]
+
+        output /= np.maximum(weight_sum, 1e-8)
+        return output * std + mean
+
+    def separate_file(self, input_path: str, output_dir: Path) -> Dict[str, Path]:
+        """Separa un archivo y escribe {stem}.wav (PCM 16-bit, como la CLI de Demucs)"""
+        import librosa
+
+        self.session  # Cargar metadata (sample rate) antes de decodificar
+        mix, _ = librosa.load(input_path, sr=self.samplerate, mono=False)
+        mix = np.atleast_2d(mix).astype(np.float32)
+        if mix.shape[0] == 1:
+            mix = np.repeat(mix, 2, axis=0)
+        mix = mix[:2]
+
+        sources = self.separate(mix)
+
+        output_dir = Path(output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        stems = {}
+        for name, source in zip(self.stems, sources):
+            path = output_dir / f"{name}.wav"
+            sf.write(str(path), np.clip(source.T, -1.0, 1.0), self.samplerate, subtype="PCM_16")
+            stems[name] = path
+        return stems
+
+
+def onnx_model_path(model: str) -> Path:
+    """Modelo exportado: {ONNX_MODEL_DIR}/{modelo}.onnx"""
+    return Path(os.getenv("ONNX_MODEL_DIR", Path(__file__).resolve().parent / "models")) / f"{model}.onnx"
+
+
+def separator_for_config(config) -> OnnxSeparator:
+    """OnnxSeparator a partir de una configuración del registro (backend="onnx")"""
+    segment_samples = int(config.segment * 44100) if config.segment else 343980
+    return OnnxSeparator(
+        onnx_model_path(config.model),
+        stems=list(config.stems),
+        segment_samples=segment_samples,
+        overlap=config.overlap,
+        quantize=config.quantize,
+        threads=config.torch_threads,
+    )
+
+
+def main():
+    from separation_models import get_model_config, demucs_output_dir
+
+    if len(sys.argv) != 4:
+        print("Uso: python onnx_separator.py <config> <input> <output_dir>")
+        return 1
+
+    config_name, input_path, output_dir = sys.argv[1:]
+    config = get_model_config(config_name)
+    stems_dir = demucs_output_dir(config, output_dir, input_path)
+
+    stems = separator_for_config(config).separate_file(input_path, stems_dir)
+    print(f"[ONNX] {config.name}: {len(stems)} stems en {stems_dir}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,133 @@
+"""
+PCM Buffer - el audio subido se decodifica una sola vez a float32 en un memmap
+
+El pipeline de separación comparte este buffer en vez de escribir el archivo
+original a disco varias veces (input.wav, temp_for_bpm.wav) y decodificarlo
+en cada etapa:
+- Separación en proceso (Demucs vía API de Python, u ONNX Runtime)
+- BPM en streaming (bloques mono)
+- Duración, beat grid y compás (mono a 22050 Hz, calculado una vez)
+
+Layout: (frames, canales) float32 en {workspace}/pcm.f32, mapeado en solo lectura.
+"""
+
+import subprocess
+from pathlib import Path
+from typing import Iterator, Optional
+
+import numpy as np
+import soundfile as sf
+
+
+class PCMBuffer:
+    def __init__(self, path: Path, samplerate: int, channels: int):
+        self.path = Path(path)
+        self.samplerate = samplerate
+        self.channels = channels
+        frames = self.path.stat().st_size // (4 * channels)
+        self.data = np.memmap(self.path, dtype=np.float32, mode="r", shape=(frames, channels))
+        self._mono_cache = {}
+
+    @property
+    def frames(self) -> int:
+        return self.data.shape[0]
+
+    @property
+    def duration(self) -> float:
+        return self.frames / self.samplerate
+
+    @classmethod
+    def decode(
+        cls,
+        file_content: bytes,
+        workspace: Path,
+        samplerate: int = 44100,
+        channels: int = 2,
+        filename: Optional[str] = None
+    ) -> "PCMBuffer":
+        """
+        Decodifica el contenido subido directo al archivo del memmap
+
+        Usa ffmpeg leyendo por stdin (sin escribir el original a disco). Si ffmpeg
+        no puede leer del pipe (MP4/M4A con el átomo moov al final necesitan seek),
+        escribe el original en el workspace y reintenta con la ruta; si ffmpeg no
+        está disponible o tampoco puede, intenta con soundfile.
+        """
+        path = Path(workspace) / "pcm.f32"
+        try:
+            cls._decode_ffmpeg("pipe:0", file_content, path, samplerate, channels)
+        except FileNotFoundError as e:
+            print(f"[PCM] ffmpeg no disponible ({e}), usando soundfile")
+            cls._decode_soundfile(file_content, path, samplerate, channels)
+        except RuntimeError as e:
+            print(f"[PCM] ffmpeg no pudo decodificar desde pipe ({e}), reintentando desde archivo")
+            source = Path(workspace) / f"source{Path(filename or '').suffix.lower()}"
+            source.write_bytes(file_content)
+            try:
+                cls._decode_ffmpeg(str(source), None, path, samplerate, channels)
+            except RuntimeError as e:
+                print(f"[PCM] ffmpeg no pudo decodificar ({e}), usando soundfile")
+                cls._decode_soundfile(file_content, path, samplerate, channels)
+            finally:
+                source.unlink(missing_ok=True)
+
+        buffer = cls(path, samplerate, channels)
+        print(f"[PCM] Decodificado: {buffer.duration:.1f}s, {samplerate} Hz, {channels} ch ({path.stat().st_size} bytes)")
+        return buffer
+
+    @staticmethod
+    def _decode_ffmpeg(source: str, file_content: Optional[bytes], path: Path, samplerate: int, channels: int):
+        """ffmpeg -> float32 intercalado en path; source es "pipe:0" (con file_content) o una ruta"""
+        cmd = [
+            "ffmpeg", "-v", "error", "-i", source,
+            "-f", "f32le", "-acodec", "pcm_f32le",
+            "-ac", str(channels), "-ar", str(samplerate), "pipe:1"
+        ]
+        with open(path, "wb") as output:
+            result = subprocess.run(cmd, input=file_content, stdout=output, stderr=subprocess.PIPE)
+        if result.returncode != 0 or path.stat().st_size == 0:
+            raise RuntimeError(result.stderr.decode(errors="ignore")[-300:])
+
+    @staticmethod
+    def _decode_soundfile(file_content: bytes, path: Path, samplerate: int, channels: int):
+        import io
+        import librosa
+
+        y, sr = sf.read(io.BytesIO(file_content), dtype="float32", always_2d=True)
+        if y.shape[1] != channels:
+            y = np.repeat(y.mean(axis=1, keepdims=True), channels, axis=1)
+        if sr != samplerate:
+            y = librosa.resample(y.T, orig_sr=sr, target_sr=samplerate).T
+        np.ascontiguousarray(y, dtype=np.float32).tofile(path)
+
+    def iter_mono_blocks(self, block_frames: int = 65536) -> Iterator[np.ndarray]:
+        """Bloques mono contiguos (para el BPM en streaming)"""
+        for start in range(0, self.frames, block_frames):
+            yield self.data[start:start + block_frames].mean(axis=1)
+
+    def mono(self, samplerate: Optional[int] = None) -> np.ndarray:
+        """Mezcla mono completa, opcionalmente resampleada (cacheada por sample rate)"""
+        samplerate = samplerate or self.samplerate
+        if samplerate not in self._mono_cache:
+            import librosa
+
+            y = np.asarray(self.data.mean(axis=1), dtype=np.float32)
+            if samplerate != self.samplerate:
+                y = librosa.resample(y, orig_sr=self.samplerate, target_sr=samplerate)
+            self._mono_cache[samplerate] = y
+        return self._mono_cache[samplerate]
+
+    def close(self):
+        """Libera el memmap y borra el archivo del buffer"""
+        self._mono_cache.clear()
+        mmap = getattr(self.data, "_mmap", None)
+        self.data = None
+        if mmap is not None:
+            mmap.close()
+        self.path.unlink(missing_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
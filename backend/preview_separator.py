@@ -0,0 +1,112 @@
+"""
+Preview Separator - separación borrador de baja latencia (tier 1)
+
+Separa solo los primeros segundos de la canción, a 22050 Hz, con máscaras
+espectrales baratas sobre un único STFT:
+- drums: componente percusiva del HPSS
+- bass: componente armónica por debajo de ~250 Hz
+- vocals: componente armónica en la banda vocal ponderada por cuánto domina
+  el centro estéreo (mid) sobre los lados
+- other: el resto (las máscaras suman 1)
+
+Los stems de salida siguen el mismo layout que la separación completa
+(stem_cache), así el frontend puede reproducir el borrador y cambiar a los
+stems finales cuando el tier 2 (htdemucs) termina.
+"""
+
+import tempfile
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import librosa
+import numpy as np
+import soundfile as sf
+
+from extended_stems import extended_stems_engine
+from stem_cache import stem_cache, BASE_STEMS
+
+
+class PreviewSeparator:
+    def __init__(self):
+        self.duration = 45.0        # Segundos separados en el borrador
+        self.sr = 22050
+        self.n_fft = 2048
+        self.hop_length = 512
+        self.hpss_kernel = 17       # Kernel de mediana más corto que el default (31): más rápido
+
+    def _base_masks(self, stft: np.ndarray, sr: int) -> Dict[str, np.ndarray]:
+        """Máscaras suaves de vocals/drums/bass/other que suman 1 en cada bin"""
+        magnitude = np.abs(stft).mean(axis=0)
+        harmonic, percussive = librosa.decompose.hpss(magnitude, kernel_size=self.hpss_kernel, mask=True)
+
+        # Dominancia del centro estéreo: |L + R| / (|L + R| + |L - R|)
+        if stft.shape[0] > 1:
+            mid = np.abs(stft[0] + stft[1])
+            side = np.abs(stft[0] - stft[1])
+            center = mid / (mid + side + 1e-8)
+        else:
+            center = np.full_like(magnitude, 0.5)
+
+        band = lambda low, high: extended_stems_engine.band_mask(sr, low, high)[:, np.newaxis]
+        bass = harmonic * band(0, 250)
+        vocals = harmonic * band(150, 6000) * (1.0 - band(0, 250)) * center
+        drums = percussive
+        other = np.clip(1.0 - bass - vocals - drums, 0.0, 1.0)
+
+        return {"vocals": vocals, "drums": drums, "bass": bass, "other": other}
+
+    def separate_file(
+        self,
+        file_path: str,
+        output_dir: Path,
+        separation_type: str,
+        custom_layout: Optional[Dict[str, List[str]]] = None
+    ) -> Dict[str, str]:
+        """
+        Separa el inicio de la canción con el layout del tipo de separación
+
+        Returns:
+            {stem: ruta del WAV borrador}
+        """
+        output_dir = Path(output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+
+        audio, sr = librosa.load(file_path, sr=self.sr, mono=False, duration=self.duration)
+        audio = np.atleast_2d(audio).astype(np.float32)
+        length = audio.shape[-1]
+
+        stft = librosa.stft(audio, n_fft=self.n_fft, hop_length=self.hop_length)
+        masks = self._base_masks(stft, sr)
+
+        layout = stem_cache.layout_for(separation_type, custom_layout) or {stem: [stem] for stem in BASE_STEMS}
+
+        stems = {}
+        for stem_name, sources in layout.items():
+            mask = sum(masks[name] for name in sources)
+            y = librosa.istft(stft * mask, hop_length=self.hop_length, length=length)
+            output_path = output_dir / f"{stem_name}.wav"
+            sf.write(str(output_path), y.T, sr, subtype="PCM_16")
+            stems[stem_name] = str(output_path)
+        return stems
+
+    def separate_bytes(
+        self,
+        file_content: bytes,
+        filename: str,
+        output_dir: Path,
+        separation_type: str,
+        custom_layout: Optional[Dict[str, List[str]]] = None
+    ) -> Dict[str, str]:
+        """Igual que separate_file, a partir del contenido subido"""
+        suffix = Path(filename).suffix or ".mp3"
+        with tempfile.NamedTemporaryFile(suffix=suffix, dir=output_dir, delete=False) as f:
+            f.write(file_content)
+            input_path = f.name
+        try:
+            return self.separate_file(input_path, output_dir, separation_type, custom_layout)
+        finally:
+            Path(input_path).unlink(missing_ok=True)
+
+
+# Global instance
+preview_separator = PreviewSeparator()
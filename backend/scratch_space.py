@@ -0,0 +1,269 @@
+"""
+Scratch Space - espacio temporal local por job, con cuota
+
+En Cloud Run /tmp vive en RAM: un temporal olvidado es memoria perdida hasta
+que la instancia muere. Cada job pide un workspace propio y único:
+
+    async with scratch_space.workspace(task_id, reserve_bytes) as workspace:
+        ...   # se borra al salir, termine bien o mal
+
+- reserve_bytes es lo que el job espera escribir (PCM decodificado, stems...)
+- Si la cuota (SCRATCH_QUOTA_MB) o el disco libre no alcanzan, primero se
+  evictan entradas sin dueño viejas y después se espera a que otros jobs
+  liberen; si no alcanza en wait_timeout -> ScratchSpaceFull (503 en la API)
+- Las caches locales con copia en B2 (stems, mixdowns, slices, variantes,
+  análisis, beat grids) se registran con register_cache() y cuentan contra
+  la misma cuota: cuando falta espacio se evictan sus entradas de la menos
+  usada a la más usada (touch() en cada hit), y trim_caches() las recorta
+  periódicamente aunque no haya jobs pidiendo espacio
+- El uso se cuenta con os.scandir (un solo stat por entrada)
+"""
+
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+
+class ScratchSpaceFull(Exception):
+    """No hay espacio temporal para el job (reintentar más tarde)"""
+
+    def __init__(self, message: str, retry_after: int = 30):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def scan_usage(path: str) -> Tuple[int, int, float]:
+    """(bytes, archivos, mtime más reciente) de un archivo o árbol de directorios"""
+    try:
+        stat = os.stat(path, follow_symlinks=False)
+    except OSError:
+        return 0, 0, 0.0
+    if not os.path.isdir(path):
+        return stat.st_size, 1, stat.st_mtime
+
+    total_bytes, files, newest = 0, 0, stat.st_mtime
+    stack = [path]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                            newest = max(newest, entry.stat(follow_symlinks=False).st_mtime)
+                        else:
+                            entry_stat = entry.stat(follow_symlinks=False)
+                            total_bytes += entry_stat.st_size
+                            files += 1
+                            newest = max(newest, entry_stat.st_mtime)
+                    except OSError:
+                        continue    # Borrado mientras se recorría
+        except OSError:
+            continue
+    return total_bytes, files, newest
+
+
+class ScratchSpace:
+    def __init__(self):
+        self.root = Path(os.getenv("SCRATCH_DIR", Path(tempfile.gettempdir()) / "moises_temp"))
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.quota_bytes = int(os.getenv("SCRATCH_QUOTA_MB", "4096")) * 1024 * 1024
+        self.min_free_bytes = 512 * 1024 * 1024   # Disco libre mínimo que se deja siempre
+        self.stale_seconds = 3600                 # Entradas sin dueño más viejas son evictables
+        self.wait_timeout = 30.0
+        self.cache_min_age_seconds = 300          # Entradas de cache usadas hace menos no se evictan
+        self._active: Dict[str, int] = {}         # Workspace -> bytes reservados
+        self._caches: List[Path] = []             # Caches locales contadas en la cuota
+        self._released: Optional[asyncio.Condition] = None
+
+    def register_cache(self, path) -> Path:
+        """
+        Cuenta una cache local contra la cuota; cada entrada de primer nivel
+        (archivo o directorio) es evictable por LRU, así que todo lo que haya
+        ahí tiene que poder recuperarse (B2 o recálculo)
+        """
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        if path not in self._caches:
+            self._caches.append(path)
+        return path
+
+    def touch(self, path):
+        """Marca una entrada de cache como usada ahora (orden LRU)"""
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def usage(self) -> Dict:
+        """Uso actual del root: total y por entrada de primer nivel (bytes, archivos, mtime)"""
+        entries = {}
+        with os.scandir(self.root) as it:
+            for entry in it:
+                entries[entry.name] = scan_usage(entry.path)
+        return {
+            "bytes": sum(size for size, _, _ in entries.values()),
+            "files": sum(files for _, files, _ in entries.values()),
+            "entries": entries
+        }
+
+    def _committed_bytes(self, entries: Dict[str, Tuple[int, int, float]]) -> int:
+        """Uso en disco + lo que los workspaces activos todavía van a escribir"""
+        committed = sum(size for size, _, _ in entries.values())
+        for name, reserved in self._active.items():
+            committed += max(0, reserved - entries.get(name, (0, 0, 0.0))[0])
+        return committed
+
+    def cache_entries(self) -> List[Tuple[Path, int, float]]:
+        """Entradas de primer nivel de las caches registradas: (ruta, bytes, último uso)"""
+        entries = []
+        for cache in self._caches:
+            try:
+                with os.scandir(cache) as it:
+                    for entry in it:
+                        size, _, newest = scan_usage(entry.path)
+                        entries.append((Path(entry.path), size, newest))
+            except OSError:
+                continue
+        return entries
+
+    def _shortfall(self, reserve_bytes: int) -> int:
+        """Bytes que hay que liberar para que entren reserve_bytes (0 si ya entran)"""
+        entries = self.usage()["entries"]
+        committed = self._committed_bytes(entries) + sum(size for _, size, _ in self.cache_entries())
+        over_quota = committed + reserve_bytes - self.quota_bytes
+        over_disk = self.min_free_bytes + reserve_bytes - shutil.disk_usage(self.root).free
+        return max(0, over_quota, over_disk)
+
+    def _fits(self, reserve_bytes: int) -> bool:
+        return self._shortfall(reserve_bytes) == 0
+
+    def sweep(self, max_age_seconds: Optional[float] = None) -> Tuple[int, int]:
+        """
+        Borra entradas sin dueño (no son workspaces activos) sin cambios en max_age_seconds,
+        de la más vieja a la más nueva. Retorna (entradas, bytes) liberados.
+        """
+        max_age_seconds = self.stale_seconds if max_age_seconds is None else max_age_seconds
+        now = time.time()
+        entries = self.usage()["entries"]
+        removed, freed = 0, 0
+        for name, (size, _, newest) in sorted(entries.items(), key=lambda item: item[1][2]):
+            if name in self._active or now - newest < max_age_seconds:
+                continue
+            path = self.root / name
+            if path.is_dir():
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                path.unlink(missing_ok=True)
+            removed += 1
+            freed += size
+        if removed:
+            print(f"[SCRATCH] Evictadas {removed} entradas sin dueño ({freed / 1024 / 1024:.1f} MB)")
+        return removed, freed
+
+    def evict_caches(self, bytes_needed: int) -> Tuple[int, int]:
+        """
+        Borra entradas de las caches registradas, la usada hace más tiempo primero,
+        hasta liberar bytes_needed. Retorna (entradas, bytes) liberados.
+        """
+        now = time.time()
+        removed, freed = 0, 0
+        for path, size, newest in sorted(self.cache_entries(), key=lambda entry: entry[2]):
+            if freed >= bytes_needed or now - newest < self.cache_min_age_seconds:
+                break
+            if path.is_dir():
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                path.unlink(missing_ok=True)
+            removed += 1
+            freed += size
+        if removed:
+            print(f"[SCRATCH] Evictadas {removed} entradas de cache ({freed / 1024 / 1024:.1f} MB)")
+        return removed, freed
+
+    def trim_caches(self) -> Tuple[int, int]:
+        """Recorta las caches hasta volver a la cuota (las caches crecen fuera de ensure_capacity)"""
+        shortfall = self._shortfall(0)
+        return self.evict_caches(shortfall) if shortfall else (0, 0)
+
+    async def ensure_capacity(self, reserve_bytes: int = 0):
+        """Espera (backpressure) hasta que entren reserve_bytes; ScratchSpaceFull si no entran a tiempo"""
+        if reserve_bytes > self.quota_bytes:
+            raise ScratchSpaceFull(f"El job necesita {reserve_bytes // 2**20} MB, cuota {self.quota_bytes // 2**20} MB")
+        if self._fits(reserve_bytes):
+            return
+
+        self.sweep()
+        deadline = time.monotonic() + self.wait_timeout
+        if self._released is None:
+            self._released = asyncio.Condition()
+        async with self._released:
+            while True:
+                shortfall = self._shortfall(reserve_bytes)
+                if shortfall:
+                    # Mientras se espera, más entradas de cache pasan a ser evictables
+                    self.evict_caches(shortfall)
+                    shortfall = self._shortfall(reserve_bytes)
+                if not shortfall:
+                    return
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise ScratchSpaceFull(
+                        f"Espacio temporal lleno ({len(self._active)} jobs activos), reintentar más tarde"
+                    )
+                print(f"[SCRATCH] Esperando espacio para {reserve_bytes // 2**20} MB...")
+                try:
+                    await asyncio.wait_for(self._released.wait(), timeout=min(remaining, 5.0))
+                except asyncio.TimeoutError:
+                    pass
+
+    async def acquire(self, job_id: str, reserve_bytes: int = 0) -> Path:
+        """Crea un workspace único para el job; liberarlo con release()"""
+        await self.ensure_capacity(reserve_bytes)
+        path = self.root / f"{job_id}_{uuid.uuid4().hex[:8]}"
+        path.mkdir(parents=True)
+        self._active[path.name] = reserve_bytes
+        return path
+
+    async def release(self, path: Path):
+        """Borra el workspace y despierta a los jobs que esperan espacio"""
+        self._active.pop(Path(path).name, None)
+        shutil.rmtree(path, ignore_errors=True)
+        if self._released is not None:
+            async with self._released:
+                self._released.notify_all()
+
+    @asynccontextmanager
+    async def workspace(self, job_id: str, reserve_bytes: int = 0) -> AsyncIterator[Path]:
+        path = await self.acquire(job_id, reserve_bytes)
+        try:
+            yield path
+        finally:
+            await self.release(path)
+
+    def get_stats(self) -> Dict:
+        usage = self.usage()
+        cache_entries = self.cache_entries()
+        return {
+            "root": str(self.root),
+            "bytes": usage["bytes"],
+            "files": usage["files"],
+            "entries": len(usage["entries"]),
+            "caches": [str(cache) for cache in self._caches],
+            "cache_bytes": sum(size for _, size, _ in cache_entries),
+            "cache_entries": len(cache_entries),
+            "active_workspaces": len(self._active),
+            "reserved_bytes": self._committed_bytes(usage["entries"]) - usage["bytes"],
+            "quota_bytes": self.quota_bytes,
+            "disk_free_bytes": shutil.disk_usage(self.root).free
+        }
+
+
+# Global instance
+scratch_space = ScratchSpace()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark de velocidad/calidad de las configuraciones de separation_models
+
+Uso:
+    python separation_benchmark.py fixtures/separation [--configs htdemucs,htdemucs-ft] [--tolerance 0.5]
+
+Estructura de fixtures (estilo MUSDB): un directorio por canción con la
+mezcla y los stems de referencia:
+
+    fixtures/separation/song1/mixture.wav
+    fixtures/separation/song1/vocals.wav
+    fixtures/separation/song1/drums.wav
+    ...
+
+Para cada configuración se reporta el real-time factor (segundos de
+proceso / segundos de audio), el pico de memoria residente del proceso de
+separación y el SDR medio por stem contra las referencias. Se recomienda la
+configuración más barata (menor RTF) cuyo SDR medio no caiga más de
+--tolerance dB respecto a la mejor.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import soundfile as sf
+
+from separation_models import MODEL_REGISTRY, build_separation_command, demucs_env, demucs_output_dir
+
+
+def sdr(reference: np.ndarray, estimate: np.ndarray) -> float:
+    """Signal-to-distortion ratio (dB) entre un stem de referencia y el estimado"""
+    # (frames, canales) para ambos, recortados a la longitud y canales comunes
+    reference, estimate = np.atleast_2d(reference.T).T, np.atleast_2d(estimate.T).T
+    length = min(len(reference), len(estimate))
+    channels = min(reference.shape[1], estimate.shape[1])
+    reference, estimate = reference[:length, :channels], estimate[:length, :channels]
+
+    signal = np.sum(reference.astype(np.float64) ** 2)
+    noise = np.sum((reference.astype(np.float64) - estimate) ** 2)
+    return float(10 * np.log10((signal + 1e-10) / (noise + 1e-10)))
+
+
+def run_separation(config, mixture: Path, output_dir: Path):
+    """
+    Ejecuta la separación midiendo tiempo y memoria del proceso hijo
+
+    Returns:
+        (segundos, pico de RSS en MB, directorio de stems)
+    """
+    cmd = build_separation_command(config, str(mixture), str(output_dir))
+    with tempfile.TemporaryFile() as stderr:
+        start = time.perf_counter()
+        process = subprocess.Popen(cmd, env=demucs_env(config), stdout=subprocess.DEVNULL, stderr=stderr)
+        # os.wait4 entrega el uso de recursos del hijo (ru_maxrss en KB en Linux)
+        _, status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+        elapsed = time.perf_counter() - start
+
+        if process.returncode != 0:
+            stderr.seek(0)
+            raise RuntimeError(f"{config.name} falló: {stderr.read().decode(errors='ignore')[-500:]}")
+
+    return elapsed, usage.ru_maxrss / 1024, demucs_output_dir(config, str(output_dir), str(mixture))
+
+
+def benchmark_config(config, songs) -> dict:
+    rtfs, peaks, scores = [], [], {}
+    for song_dir in songs:
+        mixture = song_dir / "mixture.wav"
+        duration = sf.info(str(mixture)).duration
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            elapsed, peak_mb, stems_dir = run_separation(config, mixture, Path(temp_dir))
+            rtfs.append(elapsed / duration)
+            peaks.append(peak_mb)
+
+            for stem in config.stems:
+                reference_path = song_dir / f"{stem}.wav"
+                estimate_path = stems_dir / f"{stem}.wav"
+                if not reference_path.exists() or not estimate_path.exists():
+                    continue
+                reference, _ = sf.read(str(reference_path), dtype="float32")
+                estimate, _ = sf.read(str(estimate_path), dtype="float32")
+                scores.setdefault(stem, []).append(sdr(reference, estimate))
+
+        print(f"[BENCH] {config.name} / {song_dir.name}: RTF {rtfs[-1]:.2f}, RSS {peak_mb:.0f} MB")
+
+    sdr_by_stem = {stem: float(np.mean(values)) for stem, values in scores.items()}
+    return {
+        "model": config.model,
+        "songs": len(rtfs),
+        "rtf": float(np.mean(rtfs)) if rtfs else 0.0,
+        "peak_rss_mb": float(np.max(peaks)) if peaks else 0.0,
+        "sdr": sdr_by_stem,
+        "mean_sdr": float(np.mean(list(sdr_by_stem.values()))) if sdr_by_stem else 0.0,
+    }
+
+
+def run_benchmark(fixtures_dir: Path, config_names, tolerance: float) -> dict:
+    songs = sorted(d for d in fixtures_dir.iterdir() if (d / "mixture.wav").exists())
+    if not songs:
+        raise FileNotFoundError(f"No hay canciones con mixture.wav en {fixtures_dir}")
+
+    results = {}
+    for name in config_names:
+        try:
+            results[name] = benchmark_config(MODEL_REGISTRY[name], songs)
+        except Exception as e:
+            print(f"[BENCH] Error en {name}: {e}")
+
+    # La configuración más barata dentro de la tolerancia del mejor SDR
+    best_sdr = max((r["mean_sdr"] for r in results.values()), default=0.0)
+    candidates = [name for name, r in results.items() if r["mean_sdr"] >= best_sdr - tolerance]
+    recommended = min(candidates, key=lambda name: results[name]["rtf"]) if candidates else None
+
+    return {"configs": results, "recommended": recommended, "tolerance_db": tolerance}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de modelos de separación (RTF, memoria, SDR)")
+    parser.add_argument("fixtures_dir", help="Directorio con una carpeta por canción (mixture.wav + stems)")
+    parser.add_argument("--configs", default=",".join(MODEL_REGISTRY))
+    parser.add_argument("--tolerance", type=float, default=0.5,
+                        help="Pérdida máxima de SDR medio (dB) aceptable frente a la mejor configuración")
+    parser.add_argument("--json", help="Guardar el reporte completo en este archivo")
+    args = parser.parse_args()
+
+    config_names = [c.strip() for c in args.configs.split(",") if c.strip()]
+    unknown = [c for c in config_names if c not in MODEL_REGISTRY]
+    if unknown:
+        print(f"Configuraciones desconocidas: {unknown}")
+        return 1
+
+    report = run_benchmark(Path(args.fixtures_dir), config_names, args.tolerance)
+
+    print("\n" + "="*72)
+    print(f"{'Config':<16} {'Songs':>6} {'RTF':>8} {'RSS MB':>8} {'SDR dB':>8}  Por stem")
+    for name, r in report["configs"].items():
+        per_stem = ", ".join(f"{stem} {value:.1f}" for stem, value in r["sdr"].items())
+        print(f"{name:<16} {r['songs']:>6} {r['rtf']:>8.2f} {r['peak_rss_mb']:>8.0f} {r['mean_sdr']:>8.2f}  {per_stem}")
+    print("="*72)
+    print(f"Recomendado (tolerancia {report['tolerance_db']} dB): {report['recommended']}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
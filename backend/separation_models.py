@@ -0,0 +1,130 @@
+"""
+Separation Models - registro de modelos de separación y su configuración por tier
+
+Cada configuración fija el modelo de Demucs y sus parámetros de inferencia
+(--shifts, --overlap, --segment, -j y threads de torch), o un modelo
+exportado a ONNX que corre con ONNX Runtime (backend="onnx", ver
+onnx_separator.py), opcionalmente cuantizado a int8. El tipo de
+separación y el flag hi_fi eligen un tier, y cada tier apunta a una
+configuración del registro. El tier se puede reasignar por variable de
+entorno sin tocar código, p.ej. después de correr separation_benchmark.py:
+
+    SEPARATION_TIER_STANDARD=htdemucs-fast
+    SEPARATION_TIER_HI_FI=htdemucs-ft
+"""
+
+import os
+import sys
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+FOUR_STEMS = ("vocals", "drums", "bass", "other")
+SIX_STEMS = ("vocals", "drums", "bass", "other", "guitar", "piano")
+
+
+@dataclass(frozen=True)
+class ModelConfig:
+    name: str                       # Clave en el registro
+    model: str                      # Nombre del modelo de Demucs (--name)
+    stems: Tuple[str, ...] = FOUR_STEMS
+    shifts: int = 1                 # Pasadas con desplazamiento aleatorio (más = mejor y más lento)
+    overlap: float = 0.25           # Solapamiento entre segmentos
+    segment: Optional[int] = None   # Segundos por segmento (None = default del modelo)
+    jobs: int = 0                   # Procesos paralelos de Demucs (-j)
+    torch_threads: Optional[int] = None  # Threads de torch/BLAS/ONNX Runtime (None = default)
+    backend: str = "torch"          # "torch" (CLI de Demucs) u "onnx" (ONNX Runtime)
+    quantize: bool = False          # Cuantización dinámica int8 (solo backend onnx)
+
+    @property
+    def cache_key(self) -> str:
+        """Identifica la salida: configuraciones distintas no comparten cache de stems"""
+        segment = self.segment if self.segment is not None else "auto"
+        key = f"{self.model}_s{self.shifts}_o{self.overlap:g}_seg{segment}"
+        if self.backend != "torch":
+            key += f"_{self.backend}{'_int8' if self.quantize else ''}"
+        return key
+
+    def has_base_stems(self) -> bool:
+        return all(stem in self.stems for stem in FOUR_STEMS)
+
+
+MODEL_REGISTRY: Dict[str, ModelConfig] = {
+    config.name: config for config in [
+        ModelConfig("htdemucs-fast", "htdemucs", shifts=0, overlap=0.1),
+        ModelConfig("htdemucs", "htdemucs"),
+        ModelConfig("htdemucs-ft", "htdemucs_ft", shifts=1, overlap=0.25),
+        ModelConfig("htdemucs-ft-hq", "htdemucs_ft", shifts=2, overlap=0.5),
+        ModelConfig("htdemucs-6s", "htdemucs_6s", stems=SIX_STEMS),
+        ModelConfig("mdx-extra-q", "mdx_extra_q"),
+        ModelConfig("htdemucs-onnx", "htdemucs", shifts=0, backend="onnx"),
+        ModelConfig("htdemucs-onnx-int8", "htdemucs", shifts=0, backend="onnx", quantize=True),
+    ]
+}
+
+# Tier -> configuración por defecto
+TIER_DEFAULTS = {
+    "standard": "htdemucs",
+    "hi_fi": "htdemucs-ft",
+    "five_stem": "mdx-extra-q",
+}
+
+# Tipos de separación con tier propio (el resto usa standard / hi_fi)
+TYPE_TIERS = {
+    "vocals-chorus-drums-bass-piano": "five_stem",
+}
+
+
+def tier_for(separation_type: str, hi_fi: bool = False) -> str:
+    return TYPE_TIERS.get(separation_type, "hi_fi" if hi_fi else "standard")
+
+
+def get_model_config(name: str) -> ModelConfig:
+    if name not in MODEL_REGISTRY:
+        raise ValueError(f"Modelo de separación desconocido: {name} (disponibles: {sorted(MODEL_REGISTRY)})")
+    return MODEL_REGISTRY[name]
+
+
+def select_model(separation_type: str, hi_fi: bool = False) -> ModelConfig:
+    """Configuración para un tipo de separación y calidad (override por SEPARATION_TIER_<TIER>)"""
+    tier = tier_for(separation_type, hi_fi)
+    name = os.getenv(f"SEPARATION_TIER_{tier.upper()}", TIER_DEFAULTS[tier])
+    return get_model_config(name)
+
+
+def build_separation_command(config: ModelConfig, input_path: str, output_dir: str) -> List[str]:
+    """
+    Comando de separación para una configuración: CLI de Demucs (torch) u
+    onnx_separator.py (ONNX Runtime). Ambos dejan los stems en demucs_output_dir.
+    """
+    if config.backend == "onnx":
+        script = Path(__file__).resolve().with_name("onnx_separator.py")
+        return [sys.executable, str(script), config.name, str(input_path), str(output_dir)]
+
+    cmd = [
+        "python", "-m", "demucs.separate",
+        "--name", config.model,
+        "--device", "cpu",
+        "--shifts", str(config.shifts),
+        "--overlap", str(config.overlap),
+    ]
+    if config.segment is not None:
+        cmd += ["--segment", str(config.segment)]
+    if config.jobs:
+        cmd += ["-j", str(config.jobs)]
+    cmd += ["--out", str(output_dir), str(input_path)]
+    return cmd
+
+
+def demucs_env(config: ModelConfig) -> Dict[str, str]:
+    """Entorno del proceso de Demucs con el límite de threads de la configuración"""
+    env = dict(os.environ)
+    if config.torch_threads:
+        for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+            env[var] = str(config.torch_threads)
+    return env
+
+
+def demucs_output_dir(config: ModelConfig, output_dir: str, input_path: str) -> Path:
+    """Directorio donde Demucs deja los stems: {out}/{modelo}/{nombre del input}"""
+    return Path(output_dir) / config.model / Path(input_path).stem
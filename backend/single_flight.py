@@ -0,0 +1,99 @@
+"""
+Single Flight - deduplicación de requests idénticas concurrentes
+
+Los endpoints de análisis reciben a menudo la misma request dos veces (efectos
+de React, reintentos, varias pestañas). Con single-flight:
+- Requests idénticas en curso comparten una sola ejecución
+- El resultado queda en una cache con TTL para las que llegan después
+- Los errores no se cachean (la siguiente request reintenta): ni las
+  excepciones ni los resultados que traen el error como valor ({"error": ...},
+  lo que devuelven los analizadores cuando fallan)
+
+La clave la arma el llamador: (endpoint, URL normalizada o hash de contenido, parámetros).
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def normalize_url(url: str) -> str:
+    """URL canónica para usar como clave: esquema/host en minúsculas, sin puerto por defecto, query ordenada, sin fragmento"""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parts.port}"
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, host, parts.path or "/", query, ""))
+
+
+class AnalysisFailed(Exception):
+    """El analizador devolvió un resultado con error"""
+
+
+def raise_for_error(result: Dict) -> Dict:
+    """Convierte el error devuelto como valor por un analizador en AnalysisFailed"""
+    if result.get("error"):
+        raise AnalysisFailed(result["error"])
+    return result
+
+
+def carries_error(result: Any) -> bool:
+    """Resultado con error propio o en alguna de sus partes (p. ej. una feature del batch)"""
+    if not isinstance(result, dict):
+        return False
+    if result.get("error"):
+        return True
+    return any(isinstance(value, dict) and value.get("error") for value in result.values())
+
+
+class SingleFlight:
+    def __init__(self, ttl: float = 600.0, max_entries: int = 512):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self._results: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Resultado de fn() para esta clave: cache -> ejecución en curso -> ejecución nueva
+        """
+        cached = self._results.get(key)
+        if cached is not None:
+            expires_at, result = cached
+            if expires_at > time.monotonic():
+                self._results.move_to_end(key)
+                print(f"[SINGLE FLIGHT] Cache hit: {key}")
+                return result
+            del self._results[key]
+
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(fn())
+            self._inflight[key] = future
+            future.add_done_callback(lambda f: self._finish(key, f))
+        else:
+            print(f"[SINGLE FLIGHT] Compartiendo ejecución en curso: {key}")
+
+        # shield: si un cliente se desconecta no se cancela la ejecución compartida
+        return await asyncio.shield(future)
+
+    def _finish(self, key: Hashable, future: asyncio.Future):
+        self._inflight.pop(key, None)
+        if future.cancelled() or future.exception() is not None:
+            return
+        if carries_error(future.result()):
+            return
+        self._results[key] = (time.monotonic() + self.ttl, future.result())
+        self._results.move_to_end(key)
+        while len(self._results) > self.max_entries:
+            self._results.popitem(last=False)
+
+
+# Global instance (análisis por URL: BPM, tonalidad, compás)
+analysis_flight = SingleFlight()
@@ -12,6 +12,9 @@ import librosa
 import soundfile as sf
 import numpy as np
 
+from stem_mixer import stem_mixer
+from separation_models import select_model, build_separation_command, demucs_env, demucs_output_dir
+
 class SmartAudioProcessor:
     def __init__(self):
         self.models_loaded = False
@@ -29,13 +32,9 @@ class SmartAudioProcessor:
             if task_callback:
                 task_callback(20, "Starting Demucs AI separation...")
             
-            # Run Demucs command - using the htdemucs model for best quality
-            cmd = [
-                "python", "-m", "demucs",
-                "--name", "htdemucs",  # Best quality model
-                "--out", str(output_dir),
-                file_path
-            ]
+            # Run Demucs command - model and inference settings from the registry
+            config = select_model("vocals-drums-bass-other")
+            cmd = build_separation_command(config, file_path, str(output_dir))
             
             print(f"Running Demucs command: {' '.join(cmd)}")
             
@@ -47,7 +46,8 @@ class SmartAudioProcessor:
             process = await asyncio.create_subprocess_exec(
                 *cmd,
                 stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
+                stderr=asyncio.subprocess.PIPE,
+                env=demucs_env(config)
             )
             
             stdout, stderr = await process.communicate()
@@ -64,10 +64,9 @@ class SmartAudioProcessor:
             
             # Find the separated files
             stems = {}
-            file_name = Path(file_path).stem
             
             # Demucs creates a folder with the model name
-            model_dir = output_dir / "htdemucs" / file_name
+            model_dir = demucs_output_dir(config, str(output_dir), file_path)
             
             if model_dir.exists():
                 # Map Demucs output to our expected format
@@ -98,26 +97,11 @@ class SmartAudioProcessor:
                                 instrumental_tracks.append(track_path)
                         
                         if instrumental_tracks:
-                            # Combinar los tracks instrumentales
-                            combined_audio = None
-                            sr = None
-                            
-                            for track_path in instrumental_tracks:
-                                audio, sample_rate = librosa.load(track_path, sr=None)
-                                sr = sample_rate
-                                
-                                if combined_audio is None:
-                                    combined_audio = audio
-                                else:
-                                    # Asegurar que tengan la misma longitud
-                                    min_length = min(len(combined_audio), len(audio))
-                                    combined_audio = combined_audio[:min_length] + audio[:min_length]
-                            
-                            # Guardar track instrumental combinado
+                            # Combinar los tracks instrumentales (por bloques, SR nativo)
                             instrumental_path = model_dir.parent / "instrumental.wav"
-                            sf.write(str(instrumental_path), combined_audio, sr)
-                            stems["instrumental"] = str(instrumental_path)
-                            print(f"Created instrumental: {instrumental_path}")
+                            if stem_mixer.mix_stems(instrumental_tracks, instrumental_path):
+                                stems["instrumental"] = str(instrumental_path)
+                                print(f"Created instrumental: {instrumental_path}")
                     
                     else:
                         # Procesar tracks individuales solicitados
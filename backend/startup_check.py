@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Chequeo del presupuesto de arranque de la API (cold start de Cloud Run)
+
+Uso:
+    python startup_check.py [--budget-ms 400] [--runs 3]
+
+Importa main.py en un proceso nuevo y compara el tiempo contra importar solo
+FastAPI. Falla (exit 1) si:
+- main tarda más que FastAPI + --budget-ms (mejor de --runs corridas)
+- importar main deja cargado algún módulo pesado (DSP: librosa, numba, scipy,
+  pydub, soundfile, numpy, torch...; clientes HTTP: aiohttp, httpx), que deben
+  importarse en el primer uso (ver lazy_imports.py)
+
+Referencia medida (mejor de 7): main.py ~+120 ms sobre FastAPI, lo que queda
+es pydantic/models y los módulos propios livianos. Antes de diferir aiohttp
+(b2_storage) y httpx (audio_fetch) eran +200..400 ms, justo en el límite del
+presupuesto; +400 ms deja margen para máquinas más lentas y el chequeo de
+módulos pesados ataja las regresiones de verdad.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent
+
+HEAVY_MODULES = (
+    "librosa", "numba", "scipy", "pydub", "soundfile", "numpy",
+    "torch", "torchaudio", "demucs", "onnxruntime", "sklearn", "sqlalchemy",
+    "aiohttp", "httpx",
+)
+
+PROBE = """
+import json, sys, time
+sys.path.insert(0, {backend!r})
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+print(json.dumps({{"seconds": elapsed, "modules": sorted(sys.modules)}}))
+"""
+
+
+def import_probe(module: str, cwd: str) -> dict:
+    """Importa un módulo en un intérprete nuevo: tiempo y módulos cargados"""
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE.format(backend=str(BACKEND_DIR), module=module)],
+        cwd=cwd, capture_output=True, text=True, check=True,
+        env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"}
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Presupuesto de tiempo de import de main.py")
+    parser.add_argument("--budget-ms", type=float, default=400.0,
+                        help="Tiempo extra permitido sobre importar FastAPI (ms)")
+    parser.add_argument("--runs", type=int, default=3, help="Corridas por medición (se toma la mejor)")
+    args = parser.parse_args()
+
+    # main monta StaticFiles(directory="uploads"): correr en un directorio con uploads/
+    with tempfile.TemporaryDirectory() as cwd:
+        (Path(cwd) / "uploads").mkdir()
+        baseline = min(import_probe("fastapi", cwd)["seconds"] for _ in range(args.runs))
+        probes = [import_probe("main", cwd) for _ in range(args.runs)]
+
+    app_seconds = min(probe["seconds"] for probe in probes)
+    loaded = {name.split(".")[0] for name in probes[0]["modules"]}
+    heavy_loaded = [name for name in HEAVY_MODULES if name in loaded]
+
+    extra_ms = (app_seconds - baseline) * 1000
+    print(f"FastAPI:  {baseline * 1000:7.1f} ms")
+    print(f"main.py:  {app_seconds * 1000:7.1f} ms  ({extra_ms:+.1f} ms, presupuesto +{args.budget_ms:.0f} ms)")
+
+    failed = False
+    if heavy_loaded:
+        print(f"[FAIL] Módulos pesados importados al arrancar: {', '.join(heavy_loaded)}")
+        failed = True
+    if extra_ms > args.budget_ms:
+        print("[FAIL] main.py excede el presupuesto de arranque")
+        failed = True
+    if not failed:
+        print("[OK] Arranque dentro del presupuesto")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,367 @@
+"""
+Stem Cache - una sola separación completa por contenido, stems derivados por suma
+
+Siempre se ejecuta el modelo de 4 stems (vocals, drums, bass, other) una vez
+por hash de contenido y se guardan los stems:
+- Cache local en disco: {tmp}/moises_stem_cache/{hash}/{config}/{stem}.wav
+- Espejo en B2: stem_cache/{hash}/{config}/{stem}.wav (compartido entre instancias)
+
+El modelo y sus parámetros salen del registro separation_models (tier por
+tipo de separación y flag hi_fi).
+
+Cualquier tipo de separación (2 stems, 3 stems o un set personalizado) se
+deriva sumando stems cacheados con stem_mixer, sin volver a correr el modelo.
+
+Si el pipeline ya decodificó el audio (PCMBuffer), el modelo corre en
+proceso sobre ese PCM (API de Python de Demucs u ONNX Runtime) y cada stem
+se escribe una sola vez, como WAV 16-bit, directo en la cache. La CLI queda
+como fallback cuando la API no está disponible.
+"""
+
+import asyncio
+import hashlib
+import json
+import shutil
+import subprocess
+import tempfile
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import soundfile as sf
+
+from b2_storage import b2_storage
+from models import SAFE_ID
+from scratch_space import scratch_space
+from stem_mixer import stem_mixer
+from separation_models import (
+    ModelConfig, FOUR_STEMS, SIX_STEMS, select_model, build_separation_command, demucs_env, demucs_output_dir
+)
+
+BASE_STEMS = list(FOUR_STEMS)
+
+# Layouts por tipo de separación: stem de salida -> stems base que se suman
+SEPARATION_LAYOUTS: Dict[str, Dict[str, List[str]]] = {
+    "vocals-instrumental": {
+        "vocals": ["vocals"],
+        "instrumental": ["drums", "bass", "other"],
+    },
+    "vocals-drums-instrumental": {
+        "vocals": ["vocals"],
+        "drums": ["drums"],
+        "instrumental": ["bass", "other"],
+    },
+    "vocals-drums-bass-other": {stem: [stem] for stem in BASE_STEMS},
+}
+
+# Todo stem que puede existir en disco o en B2 (salidas de los modelos y de los layouts)
+KNOWN_STEMS = frozenset(SIX_STEMS) | {name for layout in SEPARATION_LAYOUTS.values() for name in layout}
+
+
+def validate_stem_ref(user_id: str, song_id: str, stems=()) -> None:
+    """ValueError si los ids o los nombres de stem no son seguros para armar rutas"""
+    for label, value in (("user_id", user_id), ("song_id", song_id)):
+        if not isinstance(value, str) or not SAFE_ID.match(value):
+            raise ValueError(f"{label} inválido: {value!r}")
+    unknown = [stem for stem in stems if stem not in KNOWN_STEMS]
+    if unknown:
+        raise ValueError(f"Stems desconocidos: {unknown} (disponibles: {sorted(KNOWN_STEMS)})")
+
+
+class StemCache:
+    def __init__(self):
+        self.cache_dir = scratch_space.register_cache(Path(tempfile.gettempdir()) / "moises_stem_cache")
+        self.separation_timeout = 300  # segundos
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._models = {}  # Modelos cargados en proceso, por config.name
+
+    def content_hash(self, file_content: bytes) -> str:
+        """Hash SHA-256 del contenido del archivo original"""
+        return hashlib.sha256(file_content).hexdigest()
+
+    def layout_for(self, separation_type: str, custom_layout: Optional[Dict[str, List[str]]] = None) -> Optional[Dict[str, List[str]]]:
+        """
+        Layout de stems para un tipo de separación
+        None significa "todos los stems que produzca el modelo, tal cual"
+        """
+        if custom_layout:
+            unknown = {stem for stems in custom_layout.values() for stem in stems} - set(BASE_STEMS)
+            if unknown:
+                raise ValueError(f"Stems base desconocidos en layout personalizado: {sorted(unknown)}")
+            outputs = set(custom_layout) - KNOWN_STEMS
+            if outputs:
+                raise ValueError(f"Nombres de stem no permitidos en layout personalizado: {sorted(outputs)}")
+            return custom_layout
+        return SEPARATION_LAYOUTS.get(separation_type)
+
+    def _model_dir(self, content_hash: str, config: ModelConfig) -> Path:
+        return self.cache_dir / content_hash / config.cache_key
+
+    def _b2_path(self, content_hash: str, config: ModelConfig, stem_name: str) -> str:
+        return f"stem_cache/{content_hash}/{config.cache_key}/{stem_name}.wav"
+
+    def _cached_stems(self, model_dir: Path) -> Dict[str, Path]:
+        if not model_dir.exists():
+            return {}
+        return {path.stem: path for path in model_dir.glob("*.wav")}
+
+    async def get_base_stems(
+        self,
+        file_content: bytes,
+        config: ModelConfig,
+        content_hash: Optional[str] = None,
+        pcm=None,
+        filename: Optional[str] = None
+    ) -> Tuple[str, Dict[str, Path]]:
+        """
+        Stems completos del modelo para este contenido (cache local -> B2 -> separación)
+        Con pcm (PCMBuffer) la separación corre en proceso sobre el audio ya decodificado
+
+        Returns:
+            (hash de contenido, {stem: ruta local})
+        """
+        content_hash = content_hash or self.content_hash(file_content)
+        lock = self._locks.setdefault(f"{content_hash}/{config.cache_key}", asyncio.Lock())
+
+        # Un solo run por contenido aunque lleguen requests concurrentes
+        async with lock:
+            model_dir = self._model_dir(content_hash, config)
+            expected = list(config.stems)
+
+            stems = self._cached_stems(model_dir)
+            if all(name in stems for name in expected):
+                for path in stems.values():
+                    scratch_space.touch(path)
+                print(f"[STEM CACHE] Hit local: {content_hash[:12]} ({config.name})")
+                return content_hash, stems
+
+            stems = await self._download_mirror(content_hash, config, model_dir, expected)
+            if stems:
+                print(f"[STEM CACHE] Hit B2: {content_hash[:12]} ({config.name})")
+                return content_hash, stems
+
+            print(f"[STEM CACHE] Miss: {content_hash[:12]} ({config.name}), ejecutando separación completa")
+            stems = await self._separate(file_content, config, model_dir, pcm, filename)
+            await self._upload_mirror(content_hash, config, stems)
+            return content_hash, stems
+
+    async def _download_mirror(self, content_hash: str, config: ModelConfig, model_dir: Path, expected: List[str]) -> Dict[str, Path]:
+        """Intentar recuperar los stems del espejo en B2"""
+        contents = await asyncio.gather(*[
+            b2_storage.download_file_bytes(self._b2_path(content_hash, config, name)) for name in expected
+        ])
+        if not all(contents):
+            return {}
+
+        model_dir.mkdir(parents=True, exist_ok=True)
+        stems = {}
+        for name, data in zip(expected, contents):
+            path = model_dir / f"{name}.wav"
+            path.write_bytes(data)
+            stems[name] = path
+        return stems
+
+    async def _upload_mirror(self, content_hash: str, config: ModelConfig, stems: Dict[str, Path]):
+        """Subir los stems al espejo de B2 (errores no bloquean la separación)"""
+        for name, path in stems.items():
+            try:
+                await b2_storage.upload_file(
+                    file_content=path.read_bytes(),
+                    filename=self._b2_path(content_hash, config, name),
+                    content_type="audio/wav"
+                )
+            except Exception as e:
+                print(f"[STEM CACHE] Error subiendo espejo de {name}: {e}")
+
+    async def _separate(self, file_content: bytes, config: ModelConfig, model_dir: Path, pcm=None, filename: Optional[str] = None) -> Dict[str, Path]:
+        """Separación en proceso sobre el PCM decodificado, o CLI si no hay PCM o falta la API"""
+        if pcm is not None:
+            try:
+                loop = asyncio.get_event_loop()
+                return await loop.run_in_executor(None, self._separate_pcm, pcm, config, model_dir)
+            except ImportError as e:
+                print(f"[STEM CACHE] Separación en proceso no disponible ({e}), usando CLI")
+        suffix = Path(filename).suffix if filename else ""
+        return await self._run_separation(file_content, config, model_dir, suffix or ".mp3")
+
+    def _separate_pcm(self, pcm, config: ModelConfig, model_dir: Path) -> Dict[str, Path]:
+        """Separa el PCMBuffer en proceso y escribe cada stem una sola vez en la cache"""
+        mix = np.ascontiguousarray(pcm.data.T)  # [2, n]
+        samplerate = pcm.samplerate
+
+        if config.backend == "onnx":
+            from onnx_separator import separator_for_config
+
+            separator = self._models.get(config.name) or separator_for_config(config)
+            separator.session  # Carga la metadata (stems, sample rate) antes de separar
+            self._models[config.name] = separator
+            if separator.samplerate != samplerate:
+                import librosa
+                mix = librosa.resample(mix, orig_sr=samplerate, target_sr=separator.samplerate)
+                samplerate = separator.samplerate
+            sources, names = separator.separate(mix), separator.stems
+        else:
+            sources, names = self._apply_demucs(mix, config)
+
+        # Escribir en un directorio parcial y publicarlo completo (nunca stems a medias en la cache)
+        partial_dir = model_dir.with_name(model_dir.name + ".partial")
+        shutil.rmtree(partial_dir, ignore_errors=True)
+        partial_dir.mkdir(parents=True)
+        for name, source in zip(names, sources):
+            sf.write(str(partial_dir / f"{name}.wav"), np.clip(source.T, -1.0, 1.0), samplerate, subtype="PCM_16")
+        shutil.rmtree(model_dir, ignore_errors=True)
+        partial_dir.replace(model_dir)
+
+        print(f"[STEM CACHE] Separación en proceso ({config.name}): {len(names)} stems")
+        return {name: model_dir / f"{name}.wav" for name in names}
+
+    def _apply_demucs(self, mix: np.ndarray, config: ModelConfig) -> Tuple[np.ndarray, List[str]]:
+        """Demucs vía su API de Python (mismos parámetros que la CLI), modelo cargado una vez"""
+        import torch
+        from demucs.apply import apply_model
+        from demucs.pretrained import get_model
+
+        model = self._models.get(config.name)
+        if model is None:
+            model = get_model(config.model)
+            model.cpu().eval()
+            self._models[config.name] = model
+        if config.torch_threads:
+            torch.set_num_threads(config.torch_threads)
+
+        # Normalización de la mezcla como en demucs.separate
+        wav = torch.from_numpy(mix)
+        reference = wav.mean(0)
+        mean, std = reference.mean(), reference.std()
+        wav = (wav - mean) / std
+
+        with torch.no_grad():
+            sources = apply_model(
+                model, wav[None], device="cpu", shifts=config.shifts, split=True,
+                overlap=config.overlap, segment=config.segment, num_workers=config.jobs, progress=False
+            )[0]
+        sources = sources * std + mean
+        return sources.numpy(), list(model.sources)
+
+    async def _run_separation(self, file_content: bytes, config: ModelConfig, model_dir: Path, suffix: str = ".mp3") -> Dict[str, Path]:
+        """Ejecutar Demucs (todos los stems, sin --two-stems) y mover la salida a la cache"""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            temp_path = Path(temp_dir)
+            input_file = temp_path / f"input{suffix}"
+            input_file.write_bytes(file_content)
+
+            cmd = build_separation_command(config, str(input_file), str(temp_path / "separated"))
+            print(f"[STEM CACHE] Comando: {' '.join(cmd)}")
+
+            loop = asyncio.get_event_loop()
+            result = await loop.run_in_executor(
+                None,
+                lambda: subprocess.run(
+                    cmd, capture_output=True, text=True, timeout=self.separation_timeout, env=demucs_env(config)
+                )
+            )
+            if result.returncode != 0:
+                raise Exception(f"Demucs failed: {result.stderr}")
+
+            separated_dir = demucs_output_dir(config, str(temp_path / "separated"), str(input_file))
+            if not separated_dir.exists():
+                raise Exception(f"No se encontró directorio de salida de Demucs: {separated_dir}")
+
+            model_dir.mkdir(parents=True, exist_ok=True)
+            stems = {}
+            for file_path in separated_dir.glob("*.wav"):
+                target = model_dir / file_path.name
+                shutil.move(str(file_path), target)
+                stems[file_path.stem] = target
+
+        if not stems:
+            raise Exception("Demucs no generó stems")
+        return stems
+
+    def _song_index_path(self, user_id: str, song_id: str) -> Path:
+        return self.cache_dir / "songs" / f"{user_id}_{song_id}.json"
+
+    def register_song(self, user_id: str, song_id: str, stem_paths: Dict[str, Path]):
+        """Asocia los stems locales de una canción para reutilizarlos (mixdown, export)"""
+        index_path = self._song_index_path(user_id, song_id)
+        index_path.parent.mkdir(exist_ok=True)
+        index_path.write_text(json.dumps({name: str(path) for name, path in stem_paths.items()}))
+
+    def song_stems(self, user_id: str, song_id: str) -> Dict[str, Path]:
+        """Stems locales de una canción que sigan en disco ({} si no hay cache)"""
+        index_path = self._song_index_path(user_id, song_id)
+        if not index_path.exists():
+            return {}
+        try:
+            paths = json.loads(index_path.read_text())
+        except ValueError:
+            return {}
+        return {name: Path(path) for name, path in paths.items() if Path(path).exists()}
+
+    def derive(
+        self,
+        content_hash: str,
+        config: ModelConfig,
+        base_stems: Dict[str, Path],
+        layout: Dict[str, List[str]]
+    ) -> Dict[str, Path]:
+        """
+        Deriva los stems de salida sumando stems base (resultados cacheados en disco,
+        por modelo: cada config tiene sus propias sumas)
+        """
+        derived_dir = self._model_dir(content_hash, config) / "derived"
+        derived_dir.mkdir(parents=True, exist_ok=True)
+
+        stems = {}
+        for output_name, sources in layout.items():
+            missing = [name for name in sources if name not in base_stems]
+            if missing:
+                raise ValueError(f"Faltan stems base para {output_name}: {missing}")
+
+            if len(sources) == 1:
+                stems[output_name] = base_stems[sources[0]]
+                continue
+
+            derived_path = derived_dir / f"{'+'.join(sorted(sources))}.wav"
+            if not derived_path.exists():
+                # Nombre único: dos requests pueden derivar la misma suma a la vez
+                partial_path = derived_dir / f"{derived_path.stem}.{uuid.uuid4().hex[:8]}.partial.wav"
+                try:
+                    stem_mixer.mix_stems([base_stems[name] for name in sources], partial_path)
+                    partial_path.replace(derived_path)
+                finally:
+                    partial_path.unlink(missing_ok=True)
+            stems[output_name] = derived_path
+        return stems
+
+    async def get_stems(
+        self,
+        file_content: bytes,
+        separation_type: str,
+        custom_layout: Optional[Dict[str, List[str]]] = None,
+        content_hash: Optional[str] = None,
+        hi_fi: bool = False,
+        pcm=None,
+        filename: Optional[str] = None
+    ) -> Tuple[str, Dict[str, Path]]:
+        """
+        Stems para un tipo de separación, derivados de la separación completa cacheada
+
+        Returns:
+            (hash de contenido, {nombre de stem: ruta local})
+        """
+        config = select_model("custom" if custom_layout else separation_type, hi_fi)
+        content_hash, base_stems = await self.get_base_stems(file_content, config, content_hash, pcm=pcm, filename=filename)
+
+        layout = self.layout_for(separation_type, custom_layout)
+        if layout is None or not config.has_base_stems():
+            return content_hash, base_stems
+
+        loop = asyncio.get_event_loop()
+        stems = await loop.run_in_executor(None, self.derive, content_hash, config, base_stems, layout)
+        return content_hash, stems
+
+
+# Global instance
+stem_cache = StemCache()
@@ -0,0 +1,149 @@
+"""
+Stem Mixer - suma de stems con soundfile, por bloques y a su sample rate nativo
+
+Reemplaza el patrón librosa.load + np.sum usado para crear el instrumental:
+- No hay resampleo (librosa.load remuestreaba a 22050 Hz por defecto)
+- Acumula en un único buffer float32 preasignado, o en streaming directo
+  al archivo de salida cuando la mezcla no cabe en memoria
+- Normalización segura de picos en una segunda pasada barata
+"""
+
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+import soundfile as sf
+
+PathLike = Union[str, Path]
+
+
+class StemMixer:
+    def __init__(self):
+        self.block_frames = 65536                   # Frames leídos por bloque
+        self.peak_ceiling = 0.99                    # Pico máximo permitido tras la mezcla
+        self.max_buffer_bytes = 512 * 1024 * 1024   # Por encima de esto se mezcla en streaming
+
+    def _open_stems(self, stem_paths: List[PathLike]) -> List[sf.SoundFile]:
+        files = [sf.SoundFile(str(path)) for path in stem_paths]
+        samplerates = {f.samplerate for f in files}
+        if len(samplerates) != 1:
+            for f in files:
+                f.close()
+            raise ValueError(f"Los stems tienen sample rates distintos: {sorted(samplerates)}")
+        return files
+
+    def _read_mix_block(self, files: List[sf.SoundFile], gains: List[float], channels: int, frames: int) -> np.ndarray:
+        """Lee `frames` de cada stem y devuelve la suma ponderada en float32"""
+        block = np.zeros((frames, channels), dtype=np.float32)
+        for f, gain in zip(files, gains):
+            data = f.read(frames, dtype='float32', always_2d=True)
+            if not len(data):
+                continue
+            if data.shape[1] != channels:
+                # Mono -> N canales, o downmix a mono
+                data = np.repeat(data, channels, axis=1) if data.shape[1] == 1 else data.mean(axis=1, keepdims=True)
+            if gain != 1.0:
+                data *= gain
+            block[:len(data)] += data
+        return block
+
+    def mix_stems(
+        self,
+        stem_paths: List[PathLike],
+        output_path: PathLike,
+        gains: Optional[List[float]] = None,
+        subtype: Optional[str] = None,
+        streaming: Optional[bool] = None
+    ) -> Optional[str]:
+        """
+        Mezcla varios stems en un archivo de salida
+
+        Args:
+            stem_paths: Rutas de los stems (mismo sample rate)
+            output_path: Archivo de salida (formato según la extensión)
+            gains: Ganancia lineal por stem (por defecto 1.0)
+            subtype: Subtipo de soundfile (por defecto el del primer stem)
+            streaming: Forzar modo streaming (None = automático según tamaño)
+
+        Returns:
+            Ruta del archivo generado o None si no hay stems
+        """
+        gains = list(gains) if gains is not None else [1.0] * len(stem_paths)
+        if len(gains) != len(stem_paths):
+            raise ValueError(f"{len(gains)} ganancias para {len(stem_paths)} stems")
+
+        # Los stems faltantes se descartan junto con su ganancia
+        pairs = [(Path(p), gain) for p, gain in zip(stem_paths, gains) if Path(p).exists()]
+        if not pairs:
+            return None
+        stem_paths = [path for path, _ in pairs]
+        gains = [gain for _, gain in pairs]
+
+        files = self._open_stems(stem_paths)
+        try:
+            samplerate = files[0].samplerate
+            channels = max(f.channels for f in files)
+            total_frames = max(f.frames for f in files)
+            subtype = subtype or files[0].subtype
+
+            if streaming is None:
+                streaming = total_frames * channels * 4 > self.max_buffer_bytes
+
+            if streaming:
+                self._mix_streaming(files, gains, channels, total_frames, samplerate, output_path, subtype)
+            else:
+                self._mix_buffered(files, gains, channels, total_frames, samplerate, output_path, subtype)
+        finally:
+            for f in files:
+                f.close()
+
+        print(f"[MIX] {len(stem_paths)} stems mezclados -> {output_path} ({samplerate} Hz, {channels} ch)")
+        return str(output_path)
+
+    def _mix_buffered(self, files, gains, channels, total_frames, samplerate, output_path, subtype):
+        """Acumula en un buffer float32 preasignado y normaliza en una segunda pasada"""
+        mix = np.zeros((total_frames, channels), dtype=np.float32)
+        position = 0
+        while position < total_frames:
+            frames = min(self.block_frames, total_frames - position)
+            mix[position:position + frames] = self._read_mix_block(files, gains, channels, frames)
+            position += frames
+
+        peak = float(np.max(np.abs(mix))) if total_frames else 0.0
+        if peak > self.peak_ceiling:
+            mix *= self.peak_ceiling / peak
+
+        sf.write(str(output_path), mix, samplerate, subtype=subtype)
+
+    def _mix_streaming(self, files, gains, channels, total_frames, samplerate, output_path, subtype):
+        """Dos pasadas sobre los stems: pico de la suma, luego suma escalada directo al archivo"""
+        peak = 0.0
+        position = 0
+        while position < total_frames:
+            frames = min(self.block_frames, total_frames - position)
+            block = self._read_mix_block(files, gains, channels, frames)
+            peak = max(peak, float(np.max(np.abs(block))))
+            position += frames
+
+        scale = self.peak_ceiling / peak if peak > self.peak_ceiling else 1.0
+        for f in files:
+            f.seek(0)
+
+        with sf.SoundFile(str(output_path), 'w', samplerate=samplerate, channels=channels, subtype=subtype) as out:
+            position = 0
+            while position < total_frames:
+                frames = min(self.block_frames, total_frames - position)
+                block = self._read_mix_block(files, gains, channels, frames)
+                if scale != 1.0:
+                    block *= scale
+                out.write(block)
+                position += frames
+
+    def mix_stem_dir(self, stem_dir: PathLike, stem_names: List[str], output_path: PathLike, **kwargs) -> Optional[str]:
+        """Mezcla los stems `{name}.wav` de un directorio de salida de Demucs"""
+        stem_dir = Path(stem_dir)
+        return self.mix_stems([stem_dir / f"{name}.wav" for name in stem_names], output_path, **kwargs)
+
+
+# Global instance
+stem_mixer = StemMixer()
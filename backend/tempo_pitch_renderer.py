@@ -0,0 +1,212 @@
+"""
+Tempo/Pitch Renderer - variantes de stems con cambio de tono y/o tempo renderizadas en el servidor
+
+- Un stem por worker en un ProcessPoolExecutor (el vocoder es CPU puro)
+- Motor: Rubber Band si pyrubberband está instalado, si no phase vocoder de
+  librosa en una sola pasada (time stretch + resampleo para el tono)
+- Cache en B2 por (canción, stem, semitonos, ratio de tempo):
+  variants/{user_id}/{song_id}/{stem}/p{semitonos}_t{tempo}.wav
+- Servidas a través del proxy /api/audio
+- Renders concurrentes de la misma variante comparten una sola ejecución (single-flight por ruta)
+- Prerender de ±1 y ±2 semitonos tras la separación, cuando el servidor queda ocioso
+"""
+
+import asyncio
+import multiprocessing
+import os
+import tempfile
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+import soundfile as sf
+
+from b2_storage import b2_storage
+from mixdown import mixdown_renderer
+from scratch_space import scratch_space
+from single_flight import SingleFlight
+from stem_cache import validate_stem_ref
+
+try:
+    import pyrubberband
+except ImportError:
+    pyrubberband = None
+
+PROXY_BASE_URL = "http://localhost:8000/api/audio"
+
+SEMITONE_RANGE = (-12, 12)
+TEMPO_RATIO_RANGE = (0.5, 2.0)
+POPULAR_SEMITONES = (-2, -1, 1, 2)
+
+
+def render_stem_variant(input_path: str, output_path: str, semitones: int, tempo_ratio: float) -> str:
+    """
+    Renderiza una variante de un stem (se ejecuta dentro de un worker del pool)
+
+    Args:
+        input_path: Stem original (WAV)
+        output_path: Archivo WAV de salida
+        semitones: Cambio de tono en semitonos
+        tempo_ratio: Ratio de tempo (1.25 = 25% más rápido)
+    """
+    y, sr = sf.read(input_path, dtype="float32", always_2d=True)
+
+    if pyrubberband is not None:
+        if tempo_ratio != 1.0:
+            y = pyrubberband.time_stretch(y, sr, tempo_ratio)
+        if semitones:
+            y = pyrubberband.pitch_shift(y, sr, semitones)
+    else:
+        import librosa
+
+        # Una sola pasada del vocoder: estirar por tempo * factor de tono y
+        # resamplear por el factor de tono (equivalente a librosa.effects.pitch_shift)
+        pitch_rate = 2.0 ** (-semitones / 12.0)
+        channels = y.T
+        stretched = librosa.effects.time_stretch(channels, rate=tempo_ratio * pitch_rate)
+        if semitones:
+            stretched = librosa.resample(stretched, orig_sr=sr / pitch_rate, target_sr=sr)
+        y = stretched.T
+
+    peak = float(np.max(np.abs(y))) if y.size else 0.0
+    if peak > 0.99:
+        y = y * (0.99 / peak)
+
+    sf.write(output_path, y, sr, subtype="PCM_16")
+    return output_path
+
+
+class TempoPitchRenderer:
+    def __init__(self):
+        self.cache_dir = scratch_space.register_cache(Path(tempfile.gettempdir()) / "moises_variants")
+        self.max_workers = int(os.getenv("VARIANT_WORKERS", os.cpu_count() or 2))
+        self.idle_load_threshold = 0.5   # Carga media por CPU por debajo de la cual se prerenderiza
+        # Espera antes del prerender: la carga media de 1 minuto sigue alta justo después de Demucs
+        self.prerender_delay = float(os.getenv("VARIANT_PRERENDER_DELAY", 120))
+        self._flight = SingleFlight(ttl=60.0)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._active_jobs = 0
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # forkserver: un fork del servidor puede heredar locks tomados por otros threads
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("forkserver")
+            )
+        return self._executor
+
+    def normalize_params(self, semitones, tempo_ratio) -> tuple:
+        """Valida y normaliza los parámetros (tempo redondeado a 3 decimales para la cache)"""
+        semitones = int(semitones)
+        tempo_ratio = round(float(tempo_ratio), 3)
+        if not SEMITONE_RANGE[0] <= semitones <= SEMITONE_RANGE[1]:
+            raise ValueError(f"Semitonos fuera de rango {SEMITONE_RANGE}: {semitones}")
+        if not TEMPO_RATIO_RANGE[0] <= tempo_ratio <= TEMPO_RATIO_RANGE[1]:
+            raise ValueError(f"Ratio de tempo fuera de rango {TEMPO_RATIO_RANGE}: {tempo_ratio}")
+        return semitones, tempo_ratio
+
+    def variant_path(self, user_id: str, song_id: str, stem: str, semitones: int, tempo_ratio: float) -> str:
+        return f"variants/{user_id}/{song_id}/{stem}/p{semitones:+d}_t{tempo_ratio:.3f}.wav"
+
+    def is_idle(self) -> bool:
+        """Sin renders en curso y con carga del sistema baja"""
+        if self._active_jobs:
+            return False
+        try:
+            load = os.getloadavg()[0] / (os.cpu_count() or 1)
+        except OSError:
+            return True
+        return load < self.idle_load_threshold
+
+    async def render_variant(
+        self,
+        user_id: str,
+        song_id: str,
+        stems: List[str],
+        semitones: int,
+        tempo_ratio: float = 1.0
+    ) -> Dict[str, Dict]:
+        """
+        Obtiene (o renderiza) la variante de cada stem
+
+        Returns:
+            {stem: {"url": URL del proxy, "cached": bool}}
+        """
+        validate_stem_ref(user_id, song_id, stems)
+        semitones, tempo_ratio = self.normalize_params(semitones, tempo_ratio)
+        paths = {stem: self.variant_path(user_id, song_id, stem, semitones, tempo_ratio) for stem in stems}
+
+        exists = await asyncio.gather(*[b2_storage.file_exists(path) for path in paths.values()])
+        result = {
+            stem: {"url": f"{PROXY_BASE_URL}/{path}", "cached": True}
+            for (stem, path), cached in zip(paths.items(), exists) if cached
+        }
+
+        missing = [stem for stem in stems if stem not in result]
+        if not missing:
+            return result
+
+        if semitones == 0 and tempo_ratio == 1.0:
+            # Sin cambios: el stem original ya está en B2
+            for stem in missing:
+                result[stem] = {"url": f"{PROXY_BASE_URL}/stems/{user_id}/{song_id}/{stem}.wav", "cached": True}
+            return result
+
+        stem_paths = await mixdown_renderer.resolve_stems(user_id, song_id, missing)
+        print(f"[VARIANT] {song_id}: {len(missing)} stems, {semitones:+d} st, x{tempo_ratio}")
+
+        self._active_jobs += 1
+        try:
+            # Un stem por worker; la misma variante pedida a la vez se renderiza una sola vez
+            await asyncio.gather(*[
+                self._flight.do(
+                    paths[stem],
+                    lambda stem=stem: self._render_and_upload(str(stem_paths[stem]), paths[stem], semitones, tempo_ratio)
+                )
+                for stem in missing
+            ])
+        finally:
+            self._active_jobs -= 1
+
+        for stem in missing:
+            result[stem] = {"url": f"{PROXY_BASE_URL}/{paths[stem]}", "cached": False}
+        return result
+
+    async def _render_and_upload(self, input_path: str, b2_path: str, semitones: int, tempo_ratio: float) -> str:
+        """Renderiza una variante en un worker y la sube a B2"""
+        # Nombre local único: otro proceso de la API puede estar renderizando la misma variante
+        output = self.cache_dir / f"{b2_path.replace('/', '_')[:-4]}.{uuid.uuid4().hex[:8]}.wav"
+        loop = asyncio.get_event_loop()
+        try:
+            await loop.run_in_executor(
+                self.executor, render_stem_variant, input_path, str(output), semitones, tempo_ratio
+            )
+            await b2_storage.upload_file(
+                file_content=output.read_bytes(),
+                filename=b2_path,
+                content_type="audio/wav"
+            )
+        finally:
+            output.unlink(missing_ok=True)
+        return b2_path
+
+    async def prerender_popular(self, user_id: str, song_id: str, stems: List[str]):
+        """Prerenderiza ±1 y ±2 semitonos mientras el servidor siga ocioso (tras prerender_delay)"""
+        await asyncio.sleep(self.prerender_delay)
+        for semitones in POPULAR_SEMITONES:
+            if not self.is_idle():
+                print(f"[VARIANT] Servidor ocupado, se detiene el prerender de {song_id}")
+                return
+            try:
+                await self.render_variant(user_id, song_id, stems, semitones)
+            except Exception as e:
+                print(f"[VARIANT] Error prerenderizando {song_id} {semitones:+d}: {e}")
+                return
+
+
+# Global instance
+tempo_pitch_renderer = TempoPitchRenderer()
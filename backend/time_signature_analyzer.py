@@ -4,25 +4,36 @@ Analizador de compás (time signature) usando librosa
 import librosa
 import numpy as np
 
-def analyze_time_signature(audio_path):
+from beat_grid_format import build_beat_grid
+
+def analyze_time_signature(audio_path=None, duration=60, return_grid=False, y=None, sr=None):
     """
     Analiza el compás de un archivo de audio
     
     Args:
         audio_path: Ruta al archivo de audio
+        duration: Segundos a analizar (None = canción completa)
+        return_grid: Incluir "beat_grid" (array float32 N x 3, ver beat_grid_format.py)
+        y, sr: Audio mono ya decodificado (en lugar de audio_path)
         
     Returns:
         dict con información del compás
     """
     try:
-        print(f"[TIME SIG] Analizando compás: {audio_path}")
-        
-        # Cargar audio (solo primeros 60 segundos para análisis rápido)
-        y, sr = librosa.load(audio_path, duration=60)
+        if y is None:
+            print(f"[TIME SIG] Analizando compás: {audio_path}")
+            # Cargar audio (por defecto solo primeros 60 segundos para análisis rápido)
+            y, sr = librosa.load(audio_path, duration=duration)
+        elif duration is not None:
+            y = y[:int(duration * sr)]
         print(f"[TIME SIG] Audio cargado: {len(y)/sr:.1f}s, SR: {sr}")
         
-        # Detectar tempo y beats
-        tempo, beats = librosa.beat.beat_track(y=y, sr=sr)
+        # Detectar downbeats (beats fuertes) usando análisis de energía
+        onset_env = librosa.onset.onset_strength(y=y, sr=sr)
+        
+        # Detectar tempo y beats reutilizando el onset envelope
+        tempo, beats = librosa.beat.beat_track(onset_envelope=onset_env, sr=sr)
+        tempo = float(np.atleast_1d(tempo)[0])
         print(f"[TIME SIG] Tempo detectado: {tempo:.1f} BPM")
         print(f"[TIME SIG] Beats detectados: {len(beats)}")
         
@@ -30,24 +41,21 @@ def analyze_time_signature(audio_path):
         beat_times = librosa.frames_to_time(beats, sr=sr)
         if len(beat_times) < 4:
             print("[TIME SIG] No hay suficientes beats para análisis")
-            return {
+            result = {
                 "time_signature": "4/4",
                 "confidence": 0.5,
                 "detected_pattern": "default"
             }
+            if return_grid:
+                result["duration"] = float(len(y) / sr)
+                result["beat_grid"] = build_beat_grid(beat_times, 4, 0)
+            return result
         
         beat_intervals = np.diff(beat_times)
         
-        # Detectar downbeats (beats fuertes) usando análisis de energía
-        onset_env = librosa.onset.onset_strength(y=y, sr=sr)
-        
-        # Analizar la energía en los beats
-        beat_strengths = []
-        for beat_frame in beats:
-            if beat_frame < len(onset_env):
-                beat_strengths.append(onset_env[beat_frame])
-        
-        beat_strengths = np.array(beat_strengths)
+        # Analizar la energía en los beats (indexado directo, sin bucle)
+        beats = beats[beats < len(onset_env)]
+        beat_strengths = onset_env[beats]
         
         # Normalizar
         if len(beat_strengths) > 0 and beat_strengths.max() > 0:
@@ -58,18 +66,29 @@ def analyze_time_signature(audio_path):
         # Para 3/4: patrón fuerte-débil-débil
         # Para 6/8: patrón fuerte-débil-débil-medio-débil-débil
         
-        time_sig, confidence, pattern = detect_meter_pattern(beat_strengths, beat_intervals)
+        time_sig, confidence, pattern, downbeat_phase = detect_meter_pattern(beat_strengths, beat_intervals)
         
-        print(f"[TIME SIG] Resultado: {time_sig}, Patrón: {pattern}, Confianza: {confidence*100:.1f}%")
+        print(f"[TIME SIG] Resultado: {time_sig}, Patrón: {pattern}, Confianza: {confidence*100:.1f}%, Fase downbeat: {downbeat_phase}")
         
-        return {
+        first_downbeat_time = float(beat_times[downbeat_phase]) if downbeat_phase < len(beat_times) else 0.0
+        
+        result = {
             "time_signature": time_sig,
             "confidence": float(confidence),
             "detected_pattern": pattern,
             "tempo": float(tempo),
-            "beats_analyzed": len(beats)
+            "beats_analyzed": len(beats),
+            "downbeat_phase": int(downbeat_phase),
+            "first_downbeat_time": first_downbeat_time
         }
         
+        if return_grid:
+            result["duration"] = float(len(y) / sr)
+            beats_per_bar = int(time_sig.split('/')[0])
+            result["beat_grid"] = build_beat_grid(beat_times[:len(beats)], beats_per_bar, downbeat_phase)
+        
+        return result
+        
     except Exception as e:
         print(f"[TIME SIG] Error: {e}")
         import traceback
@@ -78,31 +97,41 @@ def analyze_time_signature(audio_path):
         return {
             "time_signature": "4/4",
             "confidence": 0.5,
-            "detected_pattern": "default_error"
+            "detected_pattern": "default_error",
+            "error": str(e)
         }
 
 
+# Compases candidatos y beats por compás
+METER_PATTERNS = {
+    "4/4": 4,
+    "3/4": 3,
+    "6/8": 6,
+    "5/4": 5,
+    "7/8": 7
+}
+
+
 def detect_meter_pattern(beat_strengths, beat_intervals):
     """
     Detecta el patrón métrico basándose en las fuerzas de los beats
+    
+    Returns:
+        (compás, confianza, patrón, fase del downbeat)
+        La fase es el índice del primer beat que cae en el tiempo 1 del compás.
     """
     if len(beat_strengths) < 8:
-        return "4/4", 0.6, "insufficient_data"
-    
-    # Probar diferentes patrones
-    patterns = {
-        "4/4": 4,
-        "3/4": 3,
-        "6/8": 6,
-        "5/4": 5,
-        "7/8": 7
-    }
+        return "4/4", 0.6, "insufficient_data", 0
     
+    # Puntuar todos los compases con todas sus rotaciones de downbeat
     scores = {}
+    phases = {}
     
-    for time_sig, beats_per_bar in patterns.items():
-        score = calculate_pattern_score(beat_strengths, beats_per_bar)
-        scores[time_sig] = score
+    for time_sig, beats_per_bar in METER_PATTERNS.items():
+        phase_scores = calculate_pattern_scores(beat_strengths, beats_per_bar)
+        best_phase = int(np.argmax(phase_scores)) if len(phase_scores) else 0
+        scores[time_sig] = float(phase_scores[best_phase]) if len(phase_scores) else 0.0
+        phases[time_sig] = best_phase
     
     # Encontrar el mejor match
     best_time_sig = max(scores, key=scores.get)
@@ -110,7 +139,7 @@ def detect_meter_pattern(beat_strengths, beat_intervals):
     
     # Si el score es muy bajo, asumir 4/4
     if best_score < 0.3:
-        return "4/4", 0.6, "default_low_confidence"
+        return "4/4", 0.6, "default_low_confidence", phases["4/4"]
     
     # Normalizar confianza
     confidence = min(best_score, 1.0)
@@ -118,62 +147,66 @@ def detect_meter_pattern(beat_strengths, beat_intervals):
     # Si es muy cercano a 4/4 y el score de 4/4 es razonable, preferir 4/4
     # (ya que es el más común)
     if best_time_sig != "4/4" and scores["4/4"] > best_score * 0.85:
-        return "4/4", scores["4/4"], "4/4_preference"
+        return "4/4", scores["4/4"], "4/4_preference", phases["4/4"]
     
-    return best_time_sig, confidence, f"detected_{beats_per_bar}_pattern"
+    return best_time_sig, confidence, f"detected_{METER_PATTERNS[best_time_sig]}_pattern", phases[best_time_sig]
 
 
-def calculate_pattern_score(beat_strengths, beats_per_bar):
+def calculate_pattern_scores(beat_strengths, beats_per_bar):
     """
-    Calcula qué tan bien encaja un patrón métrico con las fuerzas de beats
+    Calcula qué tan bien encaja un patrón métrico con las fuerzas de beats,
+    para todas las rotaciones de downbeat a la vez (una fila por fase)
+    
+    Returns:
+        Array de scores de longitud beats_per_bar (vacío si no hay datos suficientes)
     """
-    if len(beat_strengths) < beats_per_bar * 2:
-        return 0.0
+    beat_strengths = np.asarray(beat_strengths, dtype=np.float64)
     
-    # Agrupar beats según el patrón
-    num_bars = len(beat_strengths) // beats_per_bar
+    # Mismo número de compases completos para todas las fases
+    num_bars = (len(beat_strengths) - (beats_per_bar - 1)) // beats_per_bar
     if num_bars < 2:
-        return 0.0
+        return np.zeros(0)
     
-    # Remodelar en barras
-    truncated_length = num_bars * beats_per_bar
-    bars = beat_strengths[:truncated_length].reshape(num_bars, beats_per_bar)
+    # bars[fase, compás, posición] mediante indexado avanzado
+    phases = np.arange(beats_per_bar)
+    bar_offsets = np.arange(num_bars * beats_per_bar).reshape(num_bars, beats_per_bar)
+    bars = beat_strengths[phases[:, None, None] + bar_offsets[None, :, :]]
     
     # Promediar las fuerzas de cada posición en la barra
-    avg_pattern = np.mean(bars, axis=0)
-    
-    # El primer beat debe ser el más fuerte
-    if avg_pattern[0] < np.mean(avg_pattern[1:]):
-        return 0.0
+    avg_pattern = bars.mean(axis=1)
+    first_beat_strength = avg_pattern[:, 0]
+    other_beats_avg = avg_pattern[:, 1:].mean(axis=1)
     
-    # Calcular score basado en:
     # 1. Qué tan fuerte es el primer beat comparado con los demás
-    first_beat_strength = avg_pattern[0]
-    other_beats_avg = np.mean(avg_pattern[1:])
-    
-    if other_beats_avg == 0:
-        contrast_score = 0.5
-    else:
-        contrast_score = min((first_beat_strength - other_beats_avg) / first_beat_strength, 1.0)
-    
-    # 2. Consistencia del patrón a través de las barras
-    pattern_consistency = 0.0
-    for i in range(beats_per_bar):
-        column = bars[:, i]
-        if len(column) > 1:
-            # Usar coeficiente de variación inverso como medida de consistencia
-            std = np.std(column)
-            mean = np.mean(column)
-            if mean > 0:
-                cv = std / mean
-                pattern_consistency += (1.0 / (1.0 + cv))
-    
-    pattern_consistency /= beats_per_bar
+    with np.errstate(divide='ignore', invalid='ignore'):
+        contrast_score = np.where(
+            other_beats_avg == 0,
+            0.5,
+            np.minimum((first_beat_strength - other_beats_avg) / first_beat_strength, 1.0)
+        )
+    
+    # 2. Consistencia del patrón a través de las barras (coeficiente de variación inverso)
+    column_mean = bars.mean(axis=1)
+    column_std = bars.std(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        consistency = np.where(column_mean > 0, 1.0 / (1.0 + column_std / column_mean), 0.0)
+    pattern_consistency = consistency.mean(axis=1)
     
     # Score final es una combinación de contraste y consistencia
     final_score = (contrast_score * 0.6) + (pattern_consistency * 0.4)
     
-    return final_score
+    # El primer beat debe ser el más fuerte
+    final_score = np.where(first_beat_strength < other_beats_avg, 0.0, final_score)
+    
+    return np.nan_to_num(final_score)
+
+
+def calculate_pattern_score(beat_strengths, beats_per_bar):
+    """
+    Score del patrón métrico asumiendo que el primer beat es downbeat (fase 0)
+    """
+    scores = calculate_pattern_scores(beat_strengths, beats_per_bar)
+    return float(scores[0]) if len(scores) else 0.0
 
 
 def analyze_time_signature_from_file(file_path):
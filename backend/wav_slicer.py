@@ -0,0 +1,170 @@
+"""
+WAV Slicer - secciones de stems con precisión de sample, sin decodificar
+
+Para stems WAV los offsets en bytes se calculan desde el header:
+    offset = data_offset + frame * block_align
+y solo se lee ese rango, del disco local o con un Range GET a B2. Los bytes
+se envuelven en un header nuevo que reutiliza el chunk fmt original (PCM,
+float o extensible). Los slices se cachean por (canción, stem, inicio, fin).
+"""
+
+import hashlib
+import struct
+import tempfile
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+from b2_storage import b2_storage
+from mixdown import mixdown_renderer
+from scratch_space import scratch_space
+from stem_cache import validate_stem_ref
+
+# Bytes leídos para encontrar el chunk data (headers con LIST/bext largos piden más)
+HEADER_PROBE_BYTES = 4096
+MAX_HEADER_BYTES = 1024 * 1024
+
+
+@dataclass
+class WavLayout:
+    fmt_chunk: bytes      # Cuerpo del chunk fmt original
+    channels: int
+    samplerate: int
+    block_align: int
+    data_offset: int      # Offset del primer byte de audio
+    data_size: int
+
+    @property
+    def total_frames(self) -> int:
+        return self.data_size // self.block_align
+
+
+def parse_wav_header(data: bytes) -> Optional[WavLayout]:
+    """
+    Recorre los chunks RIFF hasta el chunk data
+
+    Returns:
+        WavLayout, o None si `data` no alcanza para llegar al chunk data
+    Raises:
+        ValueError si no es un WAV válido
+    """
+    if len(data) < 12 or data[:4] != b"RIFF" or data[8:12] != b"WAVE":
+        raise ValueError("El archivo no es un WAV RIFF")
+
+    fmt_chunk = None
+    position = 12
+    while position + 8 <= len(data):
+        chunk_id = data[position:position + 4]
+        chunk_size = struct.unpack("<I", data[position + 4:position + 8])[0]
+        body = position + 8
+
+        if chunk_id == b"fmt ":
+            if body + chunk_size > len(data):
+                return None
+            fmt_chunk = data[body:body + chunk_size]
+        elif chunk_id == b"data":
+            if fmt_chunk is None:
+                raise ValueError("Chunk data antes del chunk fmt")
+            channels, samplerate = struct.unpack("<HI", fmt_chunk[2:8])
+            block_align = struct.unpack("<H", fmt_chunk[12:14])[0]
+            if not block_align:
+                raise ValueError("block_align inválido en el header WAV")
+            return WavLayout(fmt_chunk, channels, samplerate, block_align, body, chunk_size)
+
+        # Los chunks se alinean a 2 bytes
+        position = body + chunk_size + (chunk_size & 1)
+    return None
+
+
+def build_wav_header(layout: WavLayout, data_size: int) -> bytes:
+    """Header nuevo con el chunk fmt original y el tamaño de datos del slice"""
+    fmt_size = len(layout.fmt_chunk)
+    pad = fmt_size & 1
+    riff_size = 4 + (8 + fmt_size + pad) + (8 + data_size)
+    return (
+        b"RIFF" + struct.pack("<I", riff_size) + b"WAVE"
+        + b"fmt " + struct.pack("<I", fmt_size) + layout.fmt_chunk + b"\0" * pad
+        + b"data" + struct.pack("<I", data_size)
+    )
+
+
+class WavSlicer:
+    def __init__(self):
+        self.cache_dir = scratch_space.register_cache(Path(tempfile.gettempdir()) / "moises_slices")
+
+    def cache_key(self, user_id: str, song_id: str, stem: str, start: float, end: float) -> str:
+        payload = f"{user_id}/{song_id}/{stem}/{start:.6f}/{end:.6f}"
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    async def _read_header(self, local_path: Optional[Path], b2_path: str) -> WavLayout:
+        probe = HEADER_PROBE_BYTES
+        while True:
+            if local_path is not None:
+                with open(local_path, "rb") as f:
+                    data = f.read(probe)
+            else:
+                data = await b2_storage.download_range(b2_path, 0, probe - 1)
+                if not data:
+                    raise FileNotFoundError(f"Stem no disponible en B2: {b2_path}")
+
+            layout = parse_wav_header(data)
+            if layout is not None:
+                return layout
+            if len(data) < probe or probe >= MAX_HEADER_BYTES:
+                raise ValueError("No se encontró el chunk data en el header WAV")
+            probe *= 4
+
+    async def _read_range(self, local_path: Optional[Path], b2_path: str, offset: int, size: int) -> bytes:
+        if local_path is not None:
+            with open(local_path, "rb") as f:
+                f.seek(offset)
+                return f.read(size)
+
+        data = await b2_storage.download_range(b2_path, offset, offset + size - 1)
+        if data is None:
+            raise FileNotFoundError(f"Stem no disponible en B2: {b2_path}")
+        return data
+
+    async def slice_stem(self, user_id: str, song_id: str, stem: str, start: float, end: float) -> Path:
+        """
+        Genera (o reutiliza) el slice [start, end) de un stem WAV
+
+        Returns:
+            Ruta local del WAV del slice
+        """
+        validate_stem_ref(user_id, song_id, [stem])
+        if start < 0 or end <= start:
+            raise ValueError("Rango inválido: se requiere 0 <= start < end")
+
+        cache_path = self.cache_dir / f"{self.cache_key(user_id, song_id, stem, start, end)}.wav"
+        if cache_path.exists():
+            scratch_space.touch(cache_path)
+            return cache_path
+
+        local_path = mixdown_renderer.local_stem(user_id, song_id, stem)
+        b2_path = f"stems/{user_id}/{song_id}/{stem}.wav"
+
+        layout = await self._read_header(local_path, b2_path)
+        start_frame = min(int(round(start * layout.samplerate)), layout.total_frames)
+        end_frame = min(int(round(end * layout.samplerate)), layout.total_frames)
+        if end_frame <= start_frame:
+            raise ValueError("La sección pedida está fuera del stem")
+
+        size = (end_frame - start_frame) * layout.block_align
+        data = await self._read_range(local_path, b2_path, layout.data_offset + start_frame * layout.block_align, size)
+
+        # Parcial único por request: dos requests del mismo slice no escriben el mismo archivo
+        partial_path = cache_path.with_name(f"{cache_path.stem}.{uuid.uuid4().hex[:8]}.partial")
+        try:
+            partial_path.write_bytes(build_wav_header(layout, len(data)) + data)
+            partial_path.replace(cache_path)
+        finally:
+            partial_path.unlink(missing_ok=True)
+
+        print(f"[SLICE] {song_id}/{stem}: frames {start_frame}-{end_frame} ({len(data)} bytes, {'local' if local_path else 'B2 range'})")
+        return cache_path
+
+
+# Global instance
+wav_slicer = WavSlicer()
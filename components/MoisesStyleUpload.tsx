@@ -140,7 +140,8 @@ const MoisesStyleUpload: React.FC<MoisesStyleUploadProps> = ({ onUploadComplete
         setUploadMessage('🤖 Procesando con IA (Demucs)...');
         setUploadProgress(60);
         
-        // El BPM ya viene calculado del backend
+        // BPM, tonalidad, compás y duración ya vienen calculados del backend (análisis de la canción)
+        const analysis = result.data.analysis || null;
         let calculatedBPM = result.data.bpm || null;
         if (calculatedBPM) {
           console.log(`✅ BPM detectado por backend: ${calculatedBPM} (confianza: ${((result.data.bpm_confidence || 0) * 100).toFixed(1)}%)`);
@@ -152,38 +153,50 @@ const MoisesStyleUpload: React.FC<MoisesStyleUploadProps> = ({ onUploadComplete
         // Calcular duración del audio
         let audioDuration = { duration: '0:00', durationSeconds: 0 };
         try {
-          audioDuration = await getAudioDuration(uploadedFile);
+          if (analysis?.duration) {
+            const durationSeconds = Math.floor(analysis.duration);
+            audioDuration = {
+              duration: `${Math.floor(durationSeconds / 60)}:${(durationSeconds % 60).toString().padStart(2, '0')}`,
+              durationSeconds
+            };
+          } else {
+            audioDuration = await getAudioDuration(uploadedFile);
+          }
           console.log(`✅ Duración calculada: ${audioDuration.duration} (${audioDuration.durationSeconds}s)`);
         } catch (error) {
           console.warn('⚠️ No se pudo calcular la duración:', error);
         }
 
         // Calcular tonalidad (Key)
-        let calculatedKey = '-';
-        try {
-          const keyResponse = await fetch(`http://localhost:8000/api/analyze-key-from-url?audio_url=${encodeURIComponent(result.data.original_url)}`);
-          const keyData = await keyResponse.json();
+        let calculatedKey = analysis?.key || '-';
+        if (!analysis?.key) {
+          try {
+            const keyResponse = await fetch(`http://localhost:8000/api/analyze-key-from-url?audio_url=${encodeURIComponent(result.data.original_url)}`);
+            const keyData = await keyResponse.json();
           
-          if (keyData.success && keyData.key_string) {
-            calculatedKey = keyData.key_string;
-            console.log(`✅ Tonalidad detectada: ${calculatedKey} (confianza: ${(keyData.confidence * 100).toFixed(1)}%)`);
+            if (keyData.success && keyData.key_string) {
+              calculatedKey = keyData.key_string;
+              console.log(`✅ Tonalidad detectada: ${calculatedKey} (confianza: ${(keyData.confidence * 100).toFixed(1)}%)`);
+            }
+          } catch (error) {
+            console.warn('⚠️ No se pudo calcular la tonalidad:', error);
           }
-        } catch (error) {
-          console.warn('⚠️ No se pudo calcular la tonalidad:', error);
         }
 
         // Calcular compás (Time Signature)
-        let calculatedTimeSignature = '4/4';
-        try {
-          const timeSignatureResponse = await fetch(`http://localhost:8000/api/analyze-time-signature-from-url?audio_url=${encodeURIComponent(result.data.original_url)}`);
-          const timeSignatureData = await timeSignatureResponse.json();
+        let calculatedTimeSignature = analysis?.time_signature || '4/4';
+        if (!analysis?.time_signature) {
+          try {
+            const timeSignatureResponse = await fetch(`http://localhost:8000/api/analyze-time-signature-from-url?audio_url=${encodeURIComponent(result.data.original_url)}`);
+            const timeSignatureData = await timeSignatureResponse.json();
           
-          if (timeSignatureData.success && timeSignatureData.time_signature) {
-            calculatedTimeSignature = timeSignatureData.time_signature;
-            console.log(`✅ Compás detectado: ${calculatedTimeSignature} (confianza: ${(timeSignatureData.confidence * 100).toFixed(1)}%)`);
+            if (timeSignatureData.success && timeSignatureData.time_signature) {
+              calculatedTimeSignature = timeSignatureData.time_signature;
+              console.log(`✅ Compás detectado: ${calculatedTimeSignature} (confianza: ${(timeSignatureData.confidence * 100).toFixed(1)}%)`);
+            }
+          } catch (error) {
+            console.warn('⚠️ No se pudo calcular el compás, usando 4/4 por defecto:', error);
           }
-        } catch (error) {
-          console.warn('⚠️ No se pudo calcular el compás, usando 4/4 por defecto:', error);
         }
 
         // Guardar en Firestore
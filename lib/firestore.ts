@@ -154,6 +154,7 @@ export async function deleteSong(songId: string): Promise<void> {
             },
             body: JSON.stringify({
               songId: songId,
+              userId: songData.userId,
               fileUrl: songData.fileUrl,
               stems: songData.stems
             })